@@ -1,8 +1,17 @@
 <?php
 
+// content hashes written by the generator, see ManifestGenerator
+$manifestJson = @file_get_contents(__DIR__ . '/js/manifest.json');
+$manifest = json_decode($manifestJson ?: '{}', true)['files'] ?? [];
+
+// same as noxious_map.utils.content_stamp()
+function stamp(string $data): string {
+    return substr(md5($data), 0, 10);
+}
+
 $vars = [
-    'METADATA_MTIME' => filemtime(__DIR__ . '/js/metadata.json'),
-    'SCRIPT_MTIME' => filemtime(__DIR__ . '/js/script.js'),
+    'MANIFEST_HASH' => $manifestJson !== false ? stamp($manifestJson) : '',
+    'SCRIPT_HASH' => $manifest['js/script.js'] ?? stamp(file_get_contents(__DIR__ . '/js/script.js')),
 ];
 
 $html = file_get_contents(__DIR__ . '/start.html');
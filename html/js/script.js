@@ -1,32 +1,59 @@
 /**
- * Noxious map Leaflet viewer, driven by Tiled files.
+ * Noxious map Leaflet viewer, driven by `js/metadata.json`.
  *
- * The Tiled world (`js/tiled/world.tmx`) is an *isometric* map with 64x32
- * tiles, that contains:
- *  - a "Maps" object group with one ImageObject per game map
- *    (each referencing a tile in `js/tiled/maps.tsx` by `gid`)
- *  - a "Connections" object group with point objects for teleports.
- *  - optionally other point-object groups (e.g. "POIs") for interesting
- *    places that should be toggled separately.
+ * The metadata file is written by the Python generator
+ * (`src/noxious_map/viewer.py`) from the Tiled world (`js/tiled/world.tmx`)
+ * and tileset (`js/tiled/maps.tsx`). Everything in it is already projected
+ * from Tiled's isometric pixel space to Leaflet `[lat, lng]` coordinates for
+ * `L.CRS.Simple`, so the viewer does no XML parsing or projection math:
+ *  - `maps`: one entry per game map with its image file name, image bounds
+ *    and the position of its POI marker, and a tiny inline `placeholder`
+ *    image shown blurred until the map image (or the overview) has loaded.
+ *  - `variants`: the resolution folders and the zoom level they start at.
+ *  - `formats`: `[suffix, mime type]` every map image is available in,
+ *    smallest first. The first one the browser can decode is used.
+ *  - `connections`: teleport markers with their destination position.
+ *  - `pois`: point objects of any other Tiled object group.
+ *  - `lights`: per map, an optional light overlay (`maps/lights/`), blended
+ *    over the map images when lights are switched on.
+ *  - `heat`: the monsters with a spawn heatmap (`js/heat/`), per map the
+ *    file name of its heatmap.
+ *  - `overview`: a world mosaic of all maps, shown instead of the per-map
+ *    images when zoomed out.
+ *  - `index`: a grid over all markers, per zoom level, so only the markers
+ *    in view (or one cluster marker per crowded cell) are added to the map.
  *
- * The tileset (`js/tiled/maps.tsx`) describes, for each game map, the path to
- * the rendered image, its paddings, base size, and final image dimensions.
+ * After editing world.tmx in Tiled, the generator has to run again to
+ * update the metadata.
  *
- * Tiled stores object-layer coordinates in "isometric pixel" space: they have
- * to be projected onto screen pixels via Tiled's `pixelToScreenCoords`
- * transform before they can be used as Leaflet coordinates.
- *
- * See also: `src/noxious_map/generator/maps.py` (Python side) for:
- *  - `to_tiled_image_position(local_xy, image_xy, image_wh)`
- *  - `get_tile_center(tile_x, tile_y, tile_map, paddings)`
+ * Asset URLs carry the content hash of the file from `js/manifest.json`
+ * (`maps/default/a.<hash>.webp`), so they are cached until the file changes.
  */
 
-const metadataMtime = document.querySelector('meta[name="metadata-mtime"]')
-    ?.getAttribute('content') || '0';
+const manifestHash = document.querySelector('meta[name="manifest-hash"]')
+    ?.getAttribute('content') || '';
+
+/** @type {Object<string, string>} path inside html/ -> content hash */
+let manifest = {};
+
+/**
+ * Stamped URL of a file inside html/, the plain path if it has no hash.
+ * @param {string} path
+ */
+function assetUrl(path) {
+    const hash = manifest[path];
+    if (!hash) return `./${path}`;
+    return `./${path.replace(/(\.[^./]+)$/, `.${hash}$1`)}`;
+}
 
 window.globalSettings = {
     enablePoi: true,
     enableConnections: true,
+    enableLights: false,
+    // spawn heatmap filter, see addHeatmap()
+    heatFilter: '',
+    // which teleports routes may use, see pickRequirementClass()
+    route: {items: true, level: null},
 };
 
 window.settingCallbacks = [];
@@ -38,370 +65,244 @@ function toggle(which) {
 
 
 // ---------------------------------------------------------------------------
-// Tiled / isometric projection helpers
+// Leaflet map building
 // ---------------------------------------------------------------------------
 
 /**
- * Apply Tiled's isometric `pixelToScreenCoords` transform.
- *
- * For a map with tileWidth and tileHeight:
- *     screenX = (x - y) * tileWidth / (2 * tileHeight) + originX
- *     screenY = (x + y) / 2
- * where originX = mapHeightInTiles * tileWidth / 2.
+ * @typedef {{
+ *     id: string,
+ *     name: string,
+ *     file: string,                   // image file name inside each variant folder
+ *     bounds: [[number, number], [number, number]],
+ *     poi: [number, number],
+ *     lights?: string,                // light overlay file name inside maps/lights/
+ *     heat?: string,                  // spawn heatmap file name inside js/heat/
+ *     placeholder?: string,           // data URL of a tiny version of the map
+ * }} MapEntry
  *
- * For our 64x32 map this simplifies to:
- *     screenX = (x - y) + originX
- *     screenY = (x + y) / 2
+ * @typedef {{
+ *     pos: [number, number],
+ *     label?: string,
+ *     color?: string,
+ *     itemName?: string,
+ *     dest?: [number, number],
+ * }} ConnectionEntry
  *
- * @param {number} x - tiled isometric x
- * @param {number} y - tiled isometric y
- * @param {{tileWidth: number, tileHeight: number, originX: number}} proj
- * @returns {{sx: number, sy: number}}
- */
-function isoToScreen(x, y, proj) {
-    const sx = (x - y) * proj.tileWidth / (2 * proj.tileHeight) + proj.originX;
-    const sy = (x + y) / 2;
-    return {sx, sy};
-}
-
-/**
- * Convert a screen-pixel coordinate to Leaflet [lat, lng] for L.CRS.Simple.
- * We flip Y so that "up" on screen is positive lat, which matches the
- * existing map images being drawn "right way up".
- */
-function screenToLatLng(sx, sy) {
-    return [-sy, sx];
-}
-
-
-// ---------------------------------------------------------------------------
-// Tiled XML loading
-// ---------------------------------------------------------------------------
-
-async function loadXml(url) {
-    const resp = await fetch(url);
-    if (!resp.ok) throw new Error(`Failed to load ${url}: ${resp.status}`);
-    const text = await resp.text();
-    const doc = new DOMParser().parseFromString(text, 'application/xml');
-    const err = doc.querySelector('parsererror');
-    if (err) throw new Error(`XML parse error for ${url}: ${err.textContent}`);
-    return doc;
-}
-
-function parseProperties(elem) {
-    const props = {};
-    const propsElem = elem.querySelector(':scope > properties');
-    if (!propsElem) return props;
-    for (const p of propsElem.querySelectorAll(':scope > property')) {
-        const name = p.getAttribute('name');
-        const type = p.getAttribute('type') || 'string';
-        let value = p.getAttribute('value');
-        if (type === 'int' || type === 'float') value = Number(value);
-        else if (type === 'bool') value = value === 'true';
-        props[name] = value;
-    }
-    return props;
-}
-
-/**
  * @typedef {{
- *     id: number,
- *     gid: number,                // world-level gid (firstgid + local id)
- *     noxiousId: string,
- *     paddings: {top:number,right:number,bottom:number,left:number},
- *     baseSize: [number, number], // (base_w, base_h) of un-padded iso diamond
- *     mapColumns: number,         // iso tile columns (tile_map.width)
- *     mapRows: number,            // iso tile rows (tile_map.height)
- *     imageSource: string,        // relative path stored in the .tsx
- *     imageWidth: number,         // final padded image width (pixels)
- *     imageHeight: number,        // final padded image height (pixels)
- * }} TilesetTile
- */
-
-/**
- * Parse a `.tsx` tileset document.
- * @param {Document} doc
- * @param {number} firstgid - assigned in the world.tmx `<tileset>` entry
- * @returns {{name:string, tiles: Object.<number, TilesetTile>, byNoxiousId: Object.<string, TilesetTile>}}
- */
-function parseTileset(doc, firstgid) {
-    const tileset = doc.querySelector('tileset');
-    const name = tileset.getAttribute('name');
-
-    const tiles = {};
-    const byNoxiousId = {};
-
-    for (const tileElem of tileset.querySelectorAll(':scope > tile')) {
-        const localId = parseInt(tileElem.getAttribute('id'), 10);
-        const props = parseProperties(tileElem);
-        const imgElem = tileElem.querySelector(':scope > image');
-        if (!imgElem) continue;
-
-        // paddings stored as the string "top,right,bottom,left"
-        const padParts = String(props.paddings || '0,0,0,0').split(',').map(n => parseInt(n, 10));
-        const paddings = {
-            top: padParts[0] || 0,
-            right: padParts[1] || 0,
-            bottom: padParts[2] || 0,
-            left: padParts[3] || 0,
-        };
-
-        // baseSize stored as "(w, h)"
-        const bsMatch = String(props.baseSize || '').match(/\(\s*(\d+)\s*,\s*(\d+)\s*\)/);
-        const baseSize = bsMatch
-            ? [parseInt(bsMatch[1], 10), parseInt(bsMatch[2], 10)]
-            : [0, 0];
-
-        const tile = {
-            id: localId,
-            gid: firstgid + localId,
-            noxiousId: props.noxious_id,
-            paddings,
-            baseSize,
-            // NOTE: The `mapWidth` / `mapHeight` properties on each tile in
-            // maps.tsx store the map's *tile grid* dimensions (columns/rows,
-            // i.e. tile_map.width / tile_map.height on the Python side), NOT
-            // the pixel dimensions. The padded image's pixel size lives on
-            // the <image> element's width/height attributes.
-            mapColumns: Number(props.mapWidth),
-            mapRows: Number(props.mapHeight),
-            imageSource: imgElem.getAttribute('source'),
-            imageWidth: parseInt(imgElem.getAttribute('width'), 10),
-            imageHeight: parseInt(imgElem.getAttribute('height'), 10),
-        };
-        tiles[tile.gid] = tile;
-        if (tile.noxiousId) byNoxiousId[tile.noxiousId] = tile;
-    }
-
-    return {name, tiles, byNoxiousId};
-}
-
-/**
+ *     pos: [number, number],
+ *     group: string,
+ *     label?: string,
+ *     color?: string,
+ * }} PoiEntry
+ *
  * @typedef {{
- *     id: number, name: string, group: string,
- *     x: number, y: number,
- *     gid: number, width: number, height: number,
- *     properties: Object.<string, any>,
- * }} WorldImageObject
+ *     m?: number[],                   // indices into maps (named maps only)
+ *     c?: number[],                   // indices into connections
+ *     p?: number[],                   // indices into pois
+ *     pos?: [number, number],         // centroid, clustered levels only
+ * }} IndexCell
  *
  * @typedef {{
- *     id: number, name: string, group: string,
- *     x: number, y: number,
- *     properties: Object.<string, any>,
- * }} WorldPointObject
+ *     zoom: number,                   // used from this zoom down to the next level
+ *     cell: number,                   // cell size in lat/lng units
+ *     cluster: boolean,
+ *     cells: Object<string, IndexCell>, // keyed by "x,y"
+ * }} IndexLevel
  *
  * @typedef {{
- *     projection: {tileWidth:number, tileHeight:number, mapWidthInTiles:number, mapHeightInTiles:number, originX:number},
- *     tilesetFirstGid: number,
- *     tilesetSource: string,
- *     imageObjects: WorldImageObject[],
- *     pointObjects: WorldPointObject[],
- * }} ParsedWorld
+ *     variants: [string, number][],
+ *     formats: [string, string][],
+ *     maps: MapEntry[],
+ *     connections: ConnectionEntry[],
+ *     pois: PoiEntry[],
+ *     index: {levels: IndexLevel[]},
+ *     heat?: {
+ *         monsters: [string, string, number][], // [id, name, level]
+ *         band: number,               // levels per band of the level filter
+ *     },
+ *     overview?: {
+ *         bounds: [[number, number], [number, number]],
+ *         maxZoom: number,            // mosaic instead of map overlays up to here
+ *         levels: [number, string][], // [zoom, file in maps/overview/], highest first
+ *     },
+ * }} Metadata
  */
 
 /**
- * @param {Document} doc
- * @returns {ParsedWorld}
+ * @param {Metadata} meta
  */
-function parseWorld(doc) {
-    const mapElem = doc.querySelector('map');
-    const tileWidth = parseInt(mapElem.getAttribute('tilewidth'), 10);
-    const tileHeight = parseInt(mapElem.getAttribute('tileheight'), 10);
-    const mapWidthInTiles = parseInt(mapElem.getAttribute('width'), 10);
-    const mapHeightInTiles = parseInt(mapElem.getAttribute('height'), 10);
-    const originX = mapHeightInTiles * tileWidth / 2;
-
-    const tilesetElem = mapElem.querySelector(':scope > tileset');
-    const tilesetFirstGid = parseInt(tilesetElem.getAttribute('firstgid'), 10);
-    const tilesetSource = tilesetElem.getAttribute('source');
-
-    const imageObjects = [];
-    const pointObjects = [];
-
-    for (const og of mapElem.querySelectorAll(':scope > objectgroup')) {
-        const groupName = og.getAttribute('name') || '';
-        for (const obj of og.querySelectorAll(':scope > object')) {
-            const base = {
-                id: parseInt(obj.getAttribute('id'), 10),
-                name: obj.getAttribute('name') || '',
-                group: groupName,
-                x: parseFloat(obj.getAttribute('x')),
-                y: parseFloat(obj.getAttribute('y')),
-                properties: parseProperties(obj),
-            };
-            const gidAttr = obj.getAttribute('gid');
-            if (gidAttr != null) {
-                base.gid = parseInt(gidAttr, 10);
-                base.width = parseFloat(obj.getAttribute('width'));
-                base.height = parseFloat(obj.getAttribute('height'));
-                imageObjects.push(base);
-            } else if (obj.querySelector(':scope > point')) {
-                pointObjects.push(base);
-            }
-        }
-    }
+async function buildMap(meta) {
+    const suffix = await pickImageFormat(meta.formats || [['.webp', 'image/webp']]);
+    const map = L.map('map', {
+        crs: L.CRS.Simple,
+        minZoom: -10,
+        maxZoom: 2,
+    });
 
-    return {
-        projection: {tileWidth, tileHeight, mapWidthInTiles, mapHeightInTiles, originX},
-        tilesetFirstGid, tilesetSource, imageObjects, pointObjects,
-    };
-}
+    // below the overlay pane, so lines drawn there stay on top of the images
+    // no matter when the images are (re-)added
+    map.createPane('maps').style.zIndex = 350;
+    // light overlays brighten the map images below them
+    const lightsPane = map.createPane('lights');
+    lightsPane.style.zIndex = 360;
+    lightsPane.style.mixBlendMode = 'screen';
+    // placeholders sit below the map images, blurred so the few pixels do
+    // not look like a bug
+    const placeholdersPane = map.createPane('placeholders');
+    placeholdersPane.style.zIndex = 340;
+    placeholdersPane.style.filter = 'blur(6px)';
 
+    let overallBounds = L.latLngBounds([[0, 0], [1, 1]]);
 
-// ---------------------------------------------------------------------------
-// Coordinate conversions
-// ---------------------------------------------------------------------------
+    /** @param {{url: string, zoom: number}[]} levels highest zoom first */
+    const pickUrl = (levels, zoom) => (levels.find(res => zoom >= res.zoom) || levels[levels.length - 1]).url;
+
+    // Only maps in the padded viewport have an image. Images leaving it are
+    // dropped, so requests and decoded images scale with the viewport, not
+    // with the world. meta.maps keeps the draw order of the "Maps" object
+    // group in world.tmx (draworder="index": first object at the bottom),
+    // the zIndex keeps that stacking whatever order images are added in.
+    const mapOverlays = meta.maps.map((entry, i) => {
+        const bounds = L.latLngBounds(entry.bounds);
+        const file = entry.file.replace(/\.[^.]+$/, suffix);
+        overallBounds = overallBounds.extend(bounds);
+        return {
+            bounds,
+            pane: 'maps',
+            zIndex: i,
+            resolutions: meta.variants.map(([folder, zoom]) => ({
+                url: assetUrl(`maps/${folder}/${file}`),
+                zoom,
+            })),
+            placeholder: entry.placeholder || null,
+            image: null,
+            placeholderImage: null,
+            url: null,
+        };
+    });
 
-/**
- * Get the screen-pixel position of an image object's anchor point.
- *
- * For isometric maps, Tiled anchors tile image objects at their
- * **bottom-center**. That is: `isoToScreen(obj.x, obj.y)` is the screen
- * pixel where the bottom-center of the object's image is drawn.
- *
- * This matches the offsets used by the Python generator's
- * `to_tiled_image_position`, which encodes
- *   delta_screen = (local_x - image_width/2, local_y - image_height)
- * i.e. the image pixel (image_width/2, image_height) = bottom-center is
- * positioned at iso(obj.x, obj.y).
- *
- * @param {WorldImageObject} obj
- * @param proj
- * @returns {{sx:number, sy:number}}
- */
-function imageObjectScreenAnchor(obj, proj) {
-    return isoToScreen(obj.x, obj.y, proj);
-}
+    const lightOverlays = meta.maps.flatMap((entry, i) => {
+        if (!entry.lights) return [];
+        const url = assetUrl(`maps/lights/${entry.lights.replace(/\.[^.]+$/, suffix)}`);
+        return [{
+            bounds: L.latLngBounds(entry.bounds),
+            pane: 'lights',
+            zIndex: i,
+            resolutions: [{url, zoom: -Infinity}],
+            placeholder: null,
+            image: null,
+            placeholderImage: null,
+            url: null,
+        }];
+    });
 
-/**
- * Compute the Leaflet [lat,lng] bounds of an image object.
- *
- * @param {WorldImageObject} obj
- * @param proj
- * @returns {L.LatLngBounds}
- */
-function imageObjectLatLngBounds(obj, proj) {
-    const {sx, sy} = imageObjectScreenAnchor(obj, proj);
-    // Anchor = bottom-center of the image.
-    const blSx = sx - obj.width / 2;
-    const blSy = sy;
-    const trSx = sx + obj.width / 2;
-    const trSy = sy - obj.height;
-    return L.latLngBounds(
-        screenToLatLng(blSx, blSy),
-        screenToLatLng(trSx, trSy),
-    );
-}
+    // One world mosaic replaces all map overlays when zoomed out.
+    let overview = null;
+    if (meta.overview) {
+        const resolutions = meta.overview.levels.map(([zoom, file]) => ({
+            url: assetUrl(`maps/overview/${file.replace(/\.[^.]+$/, suffix)}`),
+            zoom,
+        }));
+        const url = pickUrl(resolutions, -Infinity);
+        overview = {image: L.imageOverlay(url, meta.overview.bounds, {pane: 'maps'}), resolutions, url, loaded: false};
+    }
 
-/**
- * Given a tile-grid position (tx, ty) on a specific map, return the Leaflet
- * [lat, lng] of that isometric-tile's center, using the same math as the
- * Python generator's `get_tile_center` + `to_tiled_image_position` pair.
- *
- * The local pixel coord inside the padded image:
- *     local_x = paddings.left + (tx - ty) * 32 + rows * 32
- *     local_y = paddings.top  + (tx + ty) * 16 + 16
- * where `rows` = tile_map.height (= tile.mapRows here).
- *
- * Image local pixel (lx, ly) sits at screen-delta (lx - w/2, ly - h) from
- * the image object's bottom-center anchor in screen space.
- *
- * @param {number} tx
- * @param {number} ty
- * @param {WorldImageObject} imageObject
- * @param {TilesetTile} tile
- * @param proj
- * @returns {[number, number]}
- */
-function tilePosToLatLng(tx, ty, imageObject, tile, proj) {
-    const rows = tile.mapRows;
-    const localX = tile.paddings.left + (tx - ty) * 32 + rows * 32;
-    const localY = tile.paddings.top + (tx + ty) * 16 + 16;
-
-    const {sx, sy} = imageObjectScreenAnchor(imageObject, proj);
-    const pointSx = sx + (localX - tile.imageWidth / 2);
-    const pointSy = sy + (localY - tile.imageHeight);
-    return screenToLatLng(pointSx, pointSy);
-}
+    // Placeholders are inline, so they show without a request until the
+    // map image (or, zoomed out, the overview) is there.
+    const showPlaceholder = overlay => {
+        if (!overlay.placeholder || overlay.placeholderImage) return;
+        overlay.placeholderImage = L.imageOverlay(overlay.placeholder, overlay.bounds, {
+            pane: 'placeholders',
+            zIndex: overlay.zIndex,
+        }).addTo(map);
+    };
 
-/**
- * Parse a Tiled `"(x, y)"` tuple property. Returns [x, y] or null.
- * @param {string|undefined|null} value
- * @returns {[number, number] | null}
- */
-function parseTuple(value) {
-    if (!value) return null;
-    const m = String(value).match(/\(\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*\)/);
-    if (!m) return null;
-    return [Number(m[1]), Number(m[2])];
-}
+    const hidePlaceholder = overlay => {
+        overlay.placeholderImage?.remove();
+        overlay.placeholderImage = null;
+    };
 
-// ---------------------------------------------------------------------------
-// Leaflet map building
-// ---------------------------------------------------------------------------
+    overview?.image.once('load', () => {
+        overview.loaded = true;
+        mapOverlays.forEach(overlay => overlay.image || hidePlaceholder(overlay));
+    });
 
-/**
- * @param {ParsedWorld} world
- * @param tileset {{tiles: Object.<number, TilesetTile>}}
- */
-async function buildMap(world, tileset) {
-    // Respect Tiled's authored draw order. The "Maps" object group uses
-    // draworder="index": objects are drawn in document order, so the
-    // first object in the XML is at the bottom and the last one is on top.
-    // Leaflet also draws later-added overlays on top, so iterating the
-    // image objects in document order gives the right stacking.
-    const mapObjects = [...world.imageObjects];
+    const showOverlay = (overlay, zoom) => {
+        const url = pickUrl(overlay.resolutions, zoom);
+        if (!overlay.image) {
+            overlay.image = L.imageOverlay(url, overlay.bounds, {pane: overlay.pane, zIndex: overlay.zIndex});
+            if (overlay.placeholder) {
+                showPlaceholder(overlay);
+                overlay.image.once('load', () => hidePlaceholder(overlay));
+            }
+        } else if (overlay.url !== url) {
+            overlay.image.setUrl(url);
+        }
+        overlay.url = url;
+        if (!map.hasLayer(overlay.image)) overlay.image.addTo(map);
+    };
 
-    const map = L.map('map', {
-        crs: L.CRS.Simple,
-        minZoom: -10,
-        maxZoom: 2,
-    });
+    const releaseOverlay = (overlay, keepPlaceholder = false) => {
+        if (!keepPlaceholder) hidePlaceholder(overlay);
+        if (!overlay.image) return;
+        const element = overlay.image.getElement();
+        overlay.image.off('load');
+        overlay.image.remove();
+        // stops a download still in flight and lets the decoded image go
+        if (element) element.src = '';
+        overlay.image = null;
+        overlay.url = null;
+    };
 
-    let overallBounds = L.latLngBounds([[0, 0], [1, 1]]);
+    /** Area of the part of `bounds` inside `view`, 0 outside of it */
+    const visibleArea = (bounds, view) => {
+        const width = Math.min(bounds.getEast(), view.getEast()) - Math.max(bounds.getWest(), view.getWest());
+        const height = Math.min(bounds.getNorth(), view.getNorth()) - Math.max(bounds.getSouth(), view.getSouth());
+        return Math.max(0, width) * Math.max(0, height);
+    };
 
-    mapObjects.forEach(obj => {
-        const tile = tileset.tiles[obj.gid];
-        if (!tile) {
-            console.warn('No tile found for gid', obj.gid, obj.name);
+    const updateOverlays = () => {
+        const zoom = map.getZoom();
+        const view = map.getBounds();
+        // a little margin, so maps don't pop in right at the edge
+        const padded = view.pad(0.25);
+        if (overview && zoom <= meta.overview.maxZoom) {
+            // the placeholders paint the world until the overview loaded
+            mapOverlays.forEach(overlay => {
+                const keep = !overview.loaded && padded.intersects(overlay.bounds);
+                releaseOverlay(overlay, keep);
+                if (keep) showPlaceholder(overlay);
+            });
+            lightOverlays.forEach(overlay => releaseOverlay(overlay));
+            showOverlay(overview, zoom);
             return;
         }
-
-        const bounds = imageObjectLatLngBounds(obj, world.projection);
-
-        // The tile's imageSource is relative to js/tiled/maps.tsx, typically
-        // "../../maps/default/<id>.webp". Rewrite it into a path relative to
-        // start.html/index.php, preserving the per-resolution folder.
-        const fileName = tile.imageSource.replace(/^.*\/maps\/[^/]+\//, '');
-        const stampedFile = fileName.replace(/\.webp$/, `.${metadataMtime}.webp`);
-
-        const resolutions = [
-            {url: `./maps/default/${stampedFile}`, zoom: 0},
-            {url: `./maps/low/${stampedFile}`, zoom: -2},
-            {url: `./maps/small/${stampedFile}`, zoom: -4},
-            {url: `./maps/tiny/${stampedFile}`, zoom: -6},
-            {url: `./maps/micro/${stampedFile}`, zoom: -9999},
-        ];
-
-        let current = resolutions[resolutions.length - 1].url;
-        const image = L.imageOverlay(current, bounds).addTo(map);
-
-        map.on('zoomend', function () {
-            const zoom = map.getZoom();
-            for (let i = 0; i < resolutions.length; i++) {
-                const res = resolutions[i];
-                if (zoom >= res.zoom) {
-                    if (res.url !== current) {
-                        current = res.url;
-                        image.setUrl(current);
-                    }
-                    break;
-                }
+        overview?.image.remove();
+
+        const overlays = globalSettings.enableLights ? mapOverlays.concat(lightOverlays) : mapOverlays;
+        if (!globalSettings.enableLights) lightOverlays.forEach(overlay => releaseOverlay(overlay));
+        const wanted = [];
+        for (const overlay of overlays) {
+            if (padded.intersects(overlay.bounds)) {
+                wanted.push([visibleArea(overlay.bounds, view), overlay]);
+            } else {
+                releaseOverlay(overlay);
             }
-        });
+        }
+        // requests start in this order, the biggest part of the view first
+        wanted.sort((a, b) => b[0] - a[0]);
+        wanted.forEach(([, overlay]) => showOverlay(overlay, zoom));
+    };
 
-        overallBounds = overallBounds.extend(bounds);
+    // Zooming ends with a moveend as well. Waiting until panning and
+    // zooming settle skips the resolutions and maps only passed through.
+    let updateTimer = null;
+    map.on('moveend', () => {
+        clearTimeout(updateTimer);
+        updateTimer = setTimeout(updateOverlays, 150);
     });
+    map.on('movestart', () => clearTimeout(updateTimer));
+    window.settingCallbacks.push(updateOverlays);
 
     let stored = JSON.parse(localStorage.getItem('mapBounds') || 'null');
     let initialBounds = null;
@@ -428,6 +329,7 @@ async function buildMap(world, tileset) {
         initialBounds = overallBounds;
     }
     map.fitBounds(initialBounds);
+    updateOverlays();
 
     map.on('moveend', () => {
         const b = map.getBounds();
@@ -442,54 +344,44 @@ async function buildMap(world, tileset) {
 
 
 /**
- * Add markers for the point objects in world.tmx. Points in the
- * "Connections" object group become teleport markers; points in any other
- * group become POI markers.
+ * Show the POI marker of every map, plus markers for the point objects of
+ * world.tmx: teleport markers for the "Connections" group and POI markers
+ * for any other group.
+ *
+ * Markers are created on first use and only those in the viewport are on
+ * the map. On zoomed out levels of `meta.index` each crowded cell is shown
+ * as one cluster marker instead.
  *
- * Each point may carry a `color` property to override its icon color.
+ * Each point may carry a `color` to override its icon color.
  *
- * @param {ParsedWorld} world
- * @param tileset {{tiles: Object.<number, TilesetTile>, byNoxiousId: Object.<string, TilesetTile>}}
+ * @param {Metadata} meta
  * @param {L.Map} map
  */
-async function addMarkers(world, tileset, map) {
-    /** @type {L.Marker[]} */
-    const poiMarkers = [];
-    /** @type {L.Marker[]} */
-    const connectionMarkers = [];
-
-    // One POI marker at the center of each named map image object.
-    world.imageObjects.forEach(obj => {
-        if (obj.group !== 'Maps') return;
-        const label = obj.name || obj.properties.tileMapName;
-        if (!label) return;
-
-        const tileMapId = obj.properties.tileMapId;
-        const tile = tileset.byNoxiousId[tileMapId];
-        const tilePos = tilePosToLatLng(Math.ceil(tile.mapColumns / 2), Math.ceil(tile.mapRows / 2), obj, tile, world.projection);
-
-        const icon = new L.Icon({
-            iconUrl: poiIconUrl('#8ff'),
-            iconSize: [32, 32],
-            iconAnchor: [16, 32],
-            tooltipAnchor: [0, -32],
-        });
-        const marker = new L.Marker(tilePos, {icon});
-        marker.bindTooltip(label, {direction: 'top'});
-        marker.addTo(map);
-        poiMarkers.push(marker);
-    });
-
-    // Index map image objects by their tileMapId (= noxious_id of the
-    // underlying map), so connection points can look up their destination
-    // map from their `destMapId` property.
-    /** @type {Object.<string, WorldImageObject>} */
-    const mapByNoxId = {};
-    world.imageObjects.forEach(obj => {
-        if (obj.group !== 'Maps') return;
-        const nox = obj.properties.tileMapId;
-        if (nox) mapByNoxId[nox] = obj;
-    });
+async function addMarkers(meta, map) {
+    // Right-click two map markers to show the teleport route between them.
+    const mapsById = Object.fromEntries(meta.maps.map(entry => [entry.id, entry]));
+    let routeStart = null;
+    let routeLine = null;
+    const showRoute = async (entry) => {
+        routeLine?.remove();
+        routeLine = null;
+        if (routeStart === null || routeStart === entry.id) {
+            routeStart = entry.id;
+            return;
+        }
+        const path = await findRoute(routeStart, entry.id, window.globalSettings.route);
+        routeStart = null;
+        if (!path) {
+            alert(`No route to ${entry.name}`);
+            return;
+        }
+        routeLine = L.polyline(path.map(id => mapsById[id].poi), {
+            color: '#8ff',
+            weight: 3,
+            interactive: false,
+        }).addTo(map);
+        routeLine.bindTooltip(path.map(id => htmlEscape(mapsById[id].name)).join(' &rarr; '), {permanent: true});
+    };
 
     // Ephemeral hover layer: a dashed line + destination marker shown
     // while the cursor is over a connection marker. Cleared on mouseout
@@ -503,71 +395,55 @@ async function addMarkers(world, tileset, map) {
         hoverDest = null;
     };
 
-    /**
-     * Resolve a connection point's destination to leaflet [lat, lng],
-     * treating destPos as an arbitrary tile on the destination map.
-     * Returns null if the destination map can't be found.
-     */
-    const resolveDestination = (pt) => {
-        const dstId = pt.properties.destMapId;
-        if (!dstId) return null;
-        const dstObj = mapByNoxId[dstId];
-        if (!dstObj) return null;
-        const tile = tileset.tiles[dstObj.gid];
-        if (!tile) return null;
-
-        const destPos = parseTuple(pt.properties.destPos);
-        if (destPos) {
-            return tilePosToLatLng(destPos[0], destPos[1], dstObj, tile, world.projection);
-        }
-        // Fallback: center of the destination map.
-        const c = imageObjectLatLngBounds(dstObj, world.projection).getCenter();
-        return [c.lat, c.lng];
-    };
-
-    world.pointObjects.forEach(pt => {
-        const {sx, sy} = isoToScreen(pt.x, pt.y, world.projection);
-        const pos = screenToLatLng(sx, sy);
-
-        const isConnection = pt.group === 'Connections';
-        const color = pt.properties.color
-            || (isConnection ? '#c44' : '#fff');
-
-        const icon = isConnection
-            ? new L.Icon({
-                iconUrl: connectionIconUrl(color),
-                iconSize: [32, 42],
-                iconAnchor: [16, 42],
-                tooltipAnchor: [0, -42],
-            })
-            : new L.Icon({
-                iconUrl: poiIconUrl(color),
+    /** @type {Object<string, function(number): L.Marker>} */
+    const factories = {
+        // POI marker at the center of a named map
+        m: i => {
+            const entry = meta.maps[i];
+            const icon = new L.Icon({
+                iconUrl: poiIconUrl('#8ff'),
                 iconSize: [32, 32],
                 iconAnchor: [16, 32],
                 tooltipAnchor: [0, -32],
             });
+            const marker = new L.Marker(entry.poi, {icon});
+            marker.bindTooltip(htmlEscape(entry.name), {direction: 'top'});
+            marker.on('contextmenu', () => showRoute(entry));
+            return marker;
+        },
+        p: i => {
+            const pt = meta.pois[i];
+            const icon = new L.Icon({
+                iconUrl: poiIconUrl(pt.color || '#fff'),
+                iconSize: [32, 32],
+                iconAnchor: [16, 32],
+                tooltipAnchor: [0, -32],
+            });
+            const marker = new L.Marker(pt.pos, {icon});
+            marker.bindTooltip(htmlEscape(pt.label || 'POI'), {direction: 'top'});
+            return marker;
+        },
+        c: i => {
+            const pt = meta.connections[i];
+            const icon = new L.Icon({
+                iconUrl: connectionIconUrl(pt.color || '#c44'),
+                iconSize: [32, 42],
+                iconAnchor: [16, 42],
+                tooltipAnchor: [0, -42],
+            });
 
-        let label = htmlEscape(
-            pt.name
-            || pt.properties.destMapName
-            || pt.properties.srcMapName
-            || (isConnection ? 'Connection' : 'POI')
-        );
-
-        if (pt.properties.itemName) {
-            label += `<br>Req. item: ${htmlEscape(pt.properties.itemName)}`;
-        }
+            let label = htmlEscape(pt.label || 'Connection');
+            if (pt.itemName) {
+                label += `<br>Req. item: ${htmlEscape(pt.itemName)}`;
+            }
 
-        const marker = new L.Marker(pos, {icon});
-        marker.bindTooltip(label, {direction: 'top'});
-        marker.addTo(map);
+            const marker = new L.Marker(pt.pos, {icon});
+            marker.bindTooltip(label, {direction: 'top'});
 
-        if (isConnection) {
             marker.on('mouseover', () => {
                 clearHover();
-                const destLatLng = resolveDestination(pt);
-                if (!destLatLng) return;
-                hoverLine = L.polyline([pos, destLatLng], {
+                if (!pt.dest) return;
+                hoverLine = L.polyline([pt.pos, pt.dest], {
                     color: '#ff0',
                     weight: 2,
                     dashArray: '6, 6',
@@ -579,27 +455,382 @@ async function addMarkers(world, tileset, map) {
                     iconAnchor: [16, 42],
                     tooltipAnchor: [0, -42],
                 });
-                hoverDest = new L.Marker(destLatLng, {
+                hoverDest = new L.Marker(pt.dest, {
                     icon: destIcon,
                     interactive: false,
                 }).addTo(map);
             });
             marker.on('mouseout', clearHover);
-        }
+            return marker;
+        },
+    };
 
-        (isConnection ? connectionMarkers : poiMarkers).push(marker);
-    });
+    /** @type {Map<string, L.Marker>} every marker created so far */
+    const markers = new Map();
+    const getMarker = (kind, i) => {
+        const key = kind + i;
+        if (!markers.has(key)) markers.set(key, factories[kind](i));
+        return markers.get(key);
+    };
+
+    const clusterMarker = (pos, count, level) => {
+        const icon = L.divIcon({
+            html: `<span>${count}</span>`,
+            className: 'marker-cluster',
+            iconSize: [36, 36],
+        });
+        const marker = new L.Marker(pos, {icon});
+        marker.on('click', () => map.setView(pos, Math.max(map.getZoom(), level.zoom) + 1));
+        return marker;
+    };
+
+    /** @type {Map<string, L.Marker>} markers currently on the map */
+    const shown = new Map();
 
     const updateMarkers = () => {
-        if (globalSettings.enablePoi) poiMarkers.forEach(m => m.addTo(map));
-        else poiMarkers.forEach(m => m.remove(map));
-        if (globalSettings.enableConnections) connectionMarkers.forEach(m => m.addTo(map));
-        else connectionMarkers.forEach(m => m.remove(map));
+        const kinds = [];
+        if (globalSettings.enablePoi) kinds.push('m', 'p');
+        if (globalSettings.enableConnections) kinds.push('c');
+
+        const levels = meta.index.levels;
+        const zoom = map.getZoom();
+        const level = levels.find(l => l.zoom <= zoom) || levels[levels.length - 1];
+
+        // a little margin, so markers don't pop in right at the edge
+        const bounds = map.getBounds().pad(0.25);
+        const x0 = Math.floor(bounds.getWest() / level.cell);
+        const x1 = Math.floor(bounds.getEast() / level.cell);
+        const y0 = Math.floor(bounds.getSouth() / level.cell);
+        const y1 = Math.floor(bounds.getNorth() / level.cell);
+
+        /** @type {Map<string, function(): L.Marker>} */
+        const wanted = new Map();
+        for (let x = x0; x <= x1; x++) {
+            for (let y = y0; y <= y1; y++) {
+                const cell = level.cells[`${x},${y}`];
+                if (!cell) continue;
+                const members = kinds.flatMap(kind => (cell[kind] || []).map(i => [kind, i]));
+                if (level.cluster && members.length > 1) {
+                    const key = `${level.zoom}:${x},${y}:${kinds.join('')}`;
+                    wanted.set(key, () => clusterMarker(cell.pos, members.length, level));
+                    continue;
+                }
+                members.forEach(([kind, i]) => wanted.set(kind + i, () => getMarker(kind, i)));
+            }
+        }
+
+        for (const [key, marker] of shown) {
+            if (!wanted.has(key)) {
+                marker.remove();
+                shown.delete(key);
+            }
+        }
+        for (const [key, create] of wanted) {
+            if (!shown.has(key)) shown.set(key, create().addTo(map));
+        }
     };
+    // zooming ends with a moveend as well
+    map.on('moveend', updateMarkers);
     window.settingCallbacks.push(updateMarkers);
 }
 
 
+/**
+ * 1x1 images to test decoding support with, for formats not every browser
+ * this viewer targets can show.
+ */
+const formatProbes = {
+    'image/avif': 'data:image/avif;base64,AAAAIGZ0eXBhdmlmAAAAAGF2aWZtaWYxbWlhZk1BMUIAAADrbWV0YQAAAAAAAAAhaGRscgAAAAAAAAAAcGljdAAAAAAAAAAAAAAAAAAAAAAOcGl0bQAAAAAAAQAAAB5pbG9jAAAAAEQAAAEAAQAAAAEAAAETAAAAIQAAAChpaW5mAAAAAAABAAAAGmluZmUCAAAAAAEAAGF2MDFDb2xvcgAAAABqaXBycAAAAEtpcGNvAAAAFGlzcGUAAAAAAAAAAQAAAAEAAAAQcGl4aQAAAAADCAgIAAAADGF2MUOBAAwAAAAAE2NvbHJuY2x4AAEADQAGgAAAABdpcG1hAAAAAAAAAAEAAQQBAoMEAAAAKW1kYXQSAAoIGAAGiAhoNCAyExlHh4Yhh5555oJAAJBAyRxhQr4=',
+};
+
+/**
+ * @param {[string, string][]} formats `[suffix, mime type]`, preferred first
+ * @returns {Promise<string>} suffix of the first format the browser decodes
+ */
+async function pickImageFormat(formats) {
+    for (const [suffix, mime] of formats) {
+        const probe = formatProbes[mime];
+        if (!probe) return suffix;
+        const image = new Image();
+        image.src = probe;
+        try {
+            await image.decode();
+            return suffix;
+        } catch {
+            // not supported, try the next one
+        }
+    }
+    return formats[formats.length - 1][0];
+}
+
+
+// ---------------------------------------------------------------------------
+// Spawn heatmap
+// ---------------------------------------------------------------------------
+
+/**
+ * `js/heat/<map>.json` holds one layer per monster spawning on a map: a
+ * uint8 grid over the `box` of a `size` grid that covers the map's ground
+ * tiles, 255 is `scale` monsters per tile. Loaded on first use.
+ *
+ * @typedef {{
+ *     bounds: [[number, number], [number, number]],
+ *     size: [number, number],
+ *     layers: {monster: number, scale: number, box: number[], data: Uint8Array}[],
+ * }} HeatFile
+ */
+const heatFiles = new Map();
+
+/** @returns {Promise<HeatFile>} */
+function loadHeat(file) {
+    if (!heatFiles.has(file)) {
+        heatFiles.set(file, fetch(assetUrl(`js/heat/${file}`))
+            .then(resp => {
+                if (!resp.ok) throw new Error(`Failed to load heatmap: ${resp.status}`);
+                return resp.json();
+            })
+            .then(heat => {
+                heat.layers.forEach(layer => {
+                    layer.data = Uint8Array.from(atob(layer.data), c => c.charCodeAt(0));
+                });
+                return heat;
+            }));
+    }
+    return heatFiles.get(file);
+}
+
+/** First level of the band `level` is in */
+const heatBand = (level, band) => Math.floor(Math.max(level - 1, 0) / band) * band + 1;
+
+/** Transparent blue for few spawns up to red for the most, `t` is 0-1 */
+function heatColor(t) {
+    return [
+        Math.round(255 * Math.min(1, 2 * t)),
+        Math.round(255 * (1 - Math.abs(2 * t - 1))),
+        Math.round(255 * Math.max(0, 1 - 2 * t)),
+        Math.round(255 * Math.min(1, 0.3 + t)),
+    ];
+}
+
+/**
+ * Sum of the layers whose monster index passes `matches`, as an image data
+ * URL. Null if nothing matches.
+ * @param {HeatFile} heat
+ * @param {function(number): boolean} matches
+ */
+function renderHeat(heat, matches) {
+    const [width, height] = heat.size;
+    const sum = new Float32Array(width * height);
+    let max = 0;
+    for (const layer of heat.layers) {
+        if (!matches(layer.monster)) continue;
+        const [x0, y0, x1] = layer.box;
+        const boxWidth = x1 - x0;
+        const factor = layer.scale / 255;
+        layer.data.forEach((value, i) => {
+            if (!value) return;
+            const j = (y0 + Math.floor(i / boxWidth)) * width + x0 + i % boxWidth;
+            sum[j] += value * factor;
+            max = Math.max(max, sum[j]);
+        });
+    }
+    if (!max) return null;
+
+    const canvas = document.createElement('canvas');
+    canvas.width = width;
+    canvas.height = height;
+    const ctx = canvas.getContext('2d');
+    const image = ctx.createImageData(width, height);
+    sum.forEach((value, i) => {
+        // square root, so single spawns still show next to crowded areas
+        if (value) image.data.set(heatColor(Math.sqrt(value / max)), i * 4);
+    });
+    ctx.putImageData(image, 0, 0);
+    return canvas.toDataURL();
+}
+
+/**
+ * Spawn density overlay of the maps in view, filtered by
+ * `globalSettings.heatFilter`:
+ *  - `''`: off
+ *  - `'all'`: every monster
+ *  - `'band:<first level>'`: monsters of one level band
+ *  - `'monster:<id>'`: one monster
+ *
+ * @param {Metadata} meta
+ * @param {L.Map} map
+ */
+function addHeatmap(meta, map) {
+    const select = document.querySelector('#heat-filter');
+    if (!meta.heat) {
+        select?.remove();
+        return;
+    }
+    const {monsters, band} = meta.heat;
+    map.createPane('heat').style.zIndex = 370;
+
+    if (select) {
+        const option = (value, text) => {
+            const element = document.createElement('option');
+            element.value = value;
+            element.textContent = text;
+            return element;
+        };
+        const group = (label, options) => {
+            const element = document.createElement('optgroup');
+            element.label = label;
+            element.append(...options);
+            return element;
+        };
+        const bands = [...new Set(monsters.map(([, , level]) => heatBand(level, band)))]
+            .sort((a, b) => a - b);
+        const byLevel = [...monsters].sort((a, b) => a[2] - b[2] || a[1].localeCompare(b[1]));
+        select.append(
+            option('', 'No heatmap'),
+            option('all', 'All monsters'),
+            group('Level', bands.map(first => option(`band:${first}`, `Level ${first}-${first + band - 1}`))),
+            group('Monster', byLevel.map(([id, name, level]) => option(`monster:${id}`, `${name} (${level})`))),
+        );
+        select.addEventListener('change', () => {
+            globalSettings.heatFilter = select.value;
+            settingCallbacks.forEach(callback => callback());
+        });
+    }
+
+    const matcher = filter => {
+        if (filter === 'all') return () => true;
+        const colon = filter.indexOf(':');
+        const kind = filter.slice(0, colon);
+        const value = filter.slice(colon + 1);
+        if (kind === 'band') return i => heatBand(monsters[i][2], band) === Number(value);
+        if (kind === 'monster') return i => monsters[i][0] === value;
+        return () => false;
+    };
+
+    /** @type {Map<number, {filter: string, image: L.ImageOverlay | null}>} by map index */
+    const overlays = new Map();
+    // a newer update makes older ones stop after loading
+    let generation = 0;
+
+    const updateHeat = async () => {
+        const filter = globalSettings.heatFilter;
+        if (select && select.value !== filter) select.value = filter;
+        const zoom = map.getZoom();
+        const enabled = filter && !(meta.overview && zoom <= meta.overview.maxZoom);
+        const bounds = map.getBounds().pad(0.25);
+
+        const wanted = [];
+        meta.maps.forEach((entry, i) => {
+            if (!entry.heat) return;
+            if (enabled && bounds.intersects(L.latLngBounds(entry.bounds))) {
+                wanted.push(i);
+            } else {
+                overlays.get(i)?.image?.remove();
+            }
+        });
+
+        const run = ++generation;
+        const heats = await Promise.all(wanted.map(i => loadHeat(meta.maps[i].heat)));
+        if (run !== generation) return;
+
+        const matches = matcher(filter);
+        wanted.forEach((i, n) => {
+            let overlay = overlays.get(i);
+            if (overlay?.filter !== filter) {
+                overlay?.image?.remove();
+                const url = renderHeat(heats[n], matches);
+                const image = url && L.imageOverlay(url, heats[n].bounds, {
+                    pane: 'heat',
+                    opacity: 0.7,
+                    interactive: false,
+                });
+                overlay = {filter, image};
+                overlays.set(i, overlay);
+            }
+            if (overlay.image && !map.hasLayer(overlay.image)) overlay.image.addTo(map);
+        });
+    };
+    // zooming ends with a moveend as well
+    map.on('moveend', updateHeat);
+    window.settingCallbacks.push(updateHeat);
+}
+
+
+// ---------------------------------------------------------------------------
+// Teleport routes
+// ---------------------------------------------------------------------------
+
+/**
+ * `js/routes.json` holds, per requirement class, a packed next-hop table:
+ * `next[src * n + dst]` is the map to teleport to from `src` on a shortest
+ * route to `dst` (row-major, uint8 or little endian uint16, all-ones for
+ * unreachable). Loaded on first use.
+ */
+let routesPromise = null;
+
+function loadRoutes() {
+    routesPromise ??= fetch(assetUrl('js/routes.json'))
+        .then(resp => {
+            if (!resp.ok) throw new Error(`Failed to load routes: ${resp.status}`);
+            return resp.json();
+        })
+        .then(routes => {
+            routes.index = Object.fromEntries(routes.maps.map((id, i) => [id, i]));
+            routes.tables = routes.tables.map(table => ({
+                width: table.width,
+                next: Uint8Array.from(atob(table.next), c => c.charCodeAt(0)),
+            }));
+            return routes;
+        });
+    return routesPromise;
+}
+
+/**
+ * Pick the table for a player: `items` if they have the required items,
+ * `level` their level (null for no limit).
+ */
+function pickRequirementClass(routes, {items = true, level = null} = {}) {
+    const candidates = routes.classes.filter(cls => cls.items === items);
+    if (level !== null) {
+        const capped = candidates
+            .filter(cls => cls.maxLevel !== null && cls.maxLevel <= level)
+            .sort((a, b) => b.maxLevel - a.maxLevel);
+        if (capped.length) return capped[0];
+    }
+    return candidates.find(cls => cls.maxLevel === null);
+}
+
+/**
+ * @param {string} fromId
+ * @param {string} toId
+ * @param {{items?: boolean, level?: number|null}} [options]
+ * @returns {Promise<string[]|null>} map ids from start to destination
+ */
+async function findRoute(fromId, toId, options) {
+    const routes = await loadRoutes();
+    const table = routes.tables[pickRequirementClass(routes, options).table];
+    const n = routes.maps.length;
+    const unreachable = table.width === 1 ? 0xFF : 0xFFFF;
+    const hop = (a, b) => {
+        const i = a * n + b;
+        if (table.width === 1) return table.next[i];
+        return table.next[2 * i] | (table.next[2 * i + 1] << 8);
+    };
+
+    let current = routes.index[fromId];
+    const dest = routes.index[toId];
+    if (current === undefined || dest === undefined) return null;
+
+    const path = [fromId];
+    while (current !== dest) {
+        current = hop(current, dest);
+        if (current === unreachable) return null;
+        path.push(routes.maps[current]);
+    }
+    return path;
+}
+
+
 // ---------------------------------------------------------------------------
 // Marker icons
 // ---------------------------------------------------------------------------
@@ -633,23 +864,26 @@ function poiIconUrl(color) {
 // ---------------------------------------------------------------------------
 
 (async () => {
-    const worldDoc = await loadXml('./js/tiled/world.tmx');
-    const world = parseWorld(worldDoc);
+    const manifestResp = await fetch(manifestHash ? `./js/manifest.${manifestHash}.json` : './js/manifest.json');
+    if (manifestResp.ok) manifest = (await manifestResp.json()).files;
 
-    // Resolve the tileset referenced by world.tmx relative to that file.
-    const tsxUrl = new URL(world.tilesetSource, new URL('./js/tiled/world.tmx', window.location.href)).href;
-    const tsxDoc = await loadXml(tsxUrl);
-    const tileset = parseTileset(tsxDoc, world.tilesetFirstGid);
+    const resp = await fetch(assetUrl('js/metadata.json'));
+    if (!resp.ok) throw new Error(`Failed to load metadata: ${resp.status}`);
+    /** @type {Metadata} */
+    const meta = await resp.json();
 
-    const map = await buildMap(world, tileset);
+    const map = await buildMap(meta);
 
-    await addMarkers(world, tileset, map);
+    await addMarkers(meta, map);
+    addHeatmap(meta, map);
 
     const poisButton = document.querySelector('#toggle-pois');
     const connectionsButton = document.querySelector('#toggle-connections');
+    const lightsButton = document.querySelector('#toggle-lights');
     window.settingCallbacks.push(() => {
         poisButton?.classList.toggle('active', globalSettings.enablePoi);
         connectionsButton?.classList.toggle('active', globalSettings.enableConnections);
+        lightsButton?.classList.toggle('active', globalSettings.enableLights);
     });
     window.settingCallbacks.push(() => {
         localStorage.setItem('globalSettings', JSON.stringify(globalSettings));
@@ -658,6 +892,9 @@ function poiIconUrl(color) {
     const tmp = JSON.parse(localStorage.getItem('globalSettings') || '{}');
     if (tmp.enablePoi !== undefined) globalSettings.enablePoi = tmp.enablePoi;
     if (tmp.enableConnections !== undefined) globalSettings.enableConnections = tmp.enableConnections;
+    if (tmp.enableLights !== undefined) globalSettings.enableLights = tmp.enableLights;
+    if (tmp.heatFilter !== undefined) globalSettings.heatFilter = tmp.heatFilter;
+    if (tmp.route !== undefined) globalSettings.route = tmp.route;
 
     // run once, after everything's set up
     settingCallbacks.forEach(callback => callback());
@@ -1,42 +1,557 @@
-from http.server import (
-    SimpleHTTPRequestHandler,
-    ThreadingHTTPServer,
-)
-from http.server import test  # noqa
-import contextlib
-import socket
+"""Static preview server for the html/ folder.
+
+Plain asyncio, no dependencies. Speaks HTTP/1.1 with keep-alive, sends
+strong ETags and answers conditional requests, supports single byte
+ranges and serves precompressed ``.br``/``.zst``/``.gz`` siblings when the client
+accepts them. ``/`` renders ``start.html`` the same way ``index.php`` does,
+and stamped asset URLs (``script.0123456789.js``, content hashes from
+``js/manifest.json``) are resolved like the ``.htaccess`` rewrite and sent
+with ``Cache-Control: immutable``.
+
+With ``--live-reload`` HTML pages get a script that listens on
+``/__livereload`` (server-sent events) and reloads the page whenever
+``noxious-map watch`` finished a rebuild (``.cache/livereload.json``).
+
+    python html/run.py [--bind 127.0.0.1] [--port 4354] [--live-reload]
+"""
+
+from dataclasses import dataclass
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+import argparse
+import asyncio
+import hashlib
+import mimetypes
 import os
+import re
+import socket
+import contextlib
 
-if __name__ == "__main__":
-    # ensure dual-stack is not disabled; ref #38907
-    class DualStackServerMixin:
-        def server_bind(self):
-            # suppress exception when protocol is IPv4
+HERE = Path(__file__).absolute().parent
+
+KEEP_ALIVE_TIMEOUT = 15
+MAX_HEADER_BYTES = 64 * 1024
+STREAM_CHUNK = 1 << 16
+
+STAMP_RE = re.compile(
+    r"^(?P<stem>.+)\.(?:\d+|[0-9a-f]{10}|%%\w+?%%)\.(?P<ext>php|js|mjs|json|css|png|jpg|gif|svg|avif|webp|tmx|tsx|bin|gz)$"
+)
+TEMPLATE_VAR_RE = re.compile(r"%%(\w+?)%%")
+
+mimetypes.add_type("image/webp", ".webp")
+mimetypes.add_type("image/avif", ".avif")
+mimetypes.add_type("text/javascript", ".mjs")
+mimetypes.add_type("application/xml", ".tmx")
+mimetypes.add_type("application/xml", ".tsx")
+
+LIVE_RELOAD_PATH = "/__livereload"
+LIVE_RELOAD_SCRIPT = (
+    f'<script>new EventSource("{LIVE_RELOAD_PATH}")'
+    '.addEventListener("reload", () => location.reload());</script>'
+)
+LIVE_RELOAD_POLL = 0.2
+LIVE_RELOAD_PING = 15
+
+# encoding token -> file suffix, in order of preference
+PRECOMPRESSED = [("br", ".br"), ("zstd", ".zst"), ("gzip", ".gz")]
+
+REASONS = {
+    200: "OK",
+    206: "Partial Content",
+    304: "Not Modified",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    412: "Precondition Failed",
+    416: "Range Not Satisfiable",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int):
+        super().__init__(REASONS.get(status, ""))
+        self.status = status
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    version: str
+    headers: dict[str, str]
+
+    @property
+    def keep_alive(self) -> bool:
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+
+@dataclass
+class Resource:
+    path: Path
+    size: int
+    mtime: float
+    etag: str
+    content_type: str
+    encoding: str | None = None
+    body: bytes | None = None
+
+
+class ETagCache:
+    """Content hashes keyed by (path, size, mtime_ns), so files are hashed once"""
+
+    def __init__(self):
+        self._cache: dict[Path, tuple[int, int, str]] = {}
+
+    async def get(self, path: Path, stat: os.stat_result) -> str:
+        cached = self._cache.get(path)
+        if cached is not None and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+            return cached[2]
+        # off the event loop, a large map must not stall other connections
+        loop = asyncio.get_running_loop()
+        etag = await loop.run_in_executor(None, self.hash_file, path)
+        self._cache[path] = (stat.st_size, stat.st_mtime_ns, etag)
+        return etag
+
+    @staticmethod
+    def hash_file(path: Path) -> str:
+        digest = hashlib.blake2b(digest_size=12)
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(1 << 16), b""):
+                digest.update(chunk)
+        return f'"{digest.hexdigest()}"'
+
+
+class StaticServer:
+    def __init__(self, root: Path, live_reload: Path | None = None):
+        self.root = root.resolve()
+        self.etags = ETagCache()
+        # file rewritten after every rebuild of ``noxious-map watch``
+        self.live_reload = live_reload
+
+    # ------------------------------------------------------------------
+    # connection handling
+    # ------------------------------------------------------------------
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        self.read_request(reader), KEEP_ALIVE_TIMEOUT
+                    )
+                except (TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except HTTPError as e:
+                    await self.send_error(writer, e.status, keep_alive=False)
+                    break
+                if request is None:
+                    break
+
+                try:
+                    keep_alive = await self.respond(request, writer)
+                except HTTPError as e:
+                    keep_alive = request.keep_alive
+                    await self.send_error(writer, e.status, keep_alive=keep_alive)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    # e.g. a file deleted between stat and open
+                    print(f"Error handling {request.method} {request.path}: {e!r}")
+                    await self.send_error(writer, 500, keep_alive=False)
+                    break
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
             with contextlib.suppress(Exception):
-                self.socket.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
-            return super().server_bind()
+                await writer.wait_closed()
+
+    async def read_request(self, reader: asyncio.StreamReader) -> Request | None:
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.LimitOverrunError:
+            raise HTTPError(431)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None
+            raise
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise HTTPError(400)
+        if not version.startswith("HTTP/1."):
+            raise HTTPError(400)
 
-        def finish_request(self, request, client_address):
-            self.RequestHandlerClass(
-                request, client_address, self, directory=os.path.dirname(__file__)
+        headers = {}
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(":")
+            if not sep:
+                raise HTTPError(400)
+            headers[name.strip().lower()] = value.strip()
+
+        # request bodies are not supported, but must not desync the connection
+        try:
+            length = int(headers.get("content-length", "0") or 0)
+        except ValueError:
+            raise HTTPError(400)
+        if length < 0:
+            raise HTTPError(400)
+        if length:
+            await reader.readexactly(length)
+
+        return Request(method=method, path=target, version=version, headers=headers)
+
+    async def send_error(self, writer: asyncio.StreamWriter, status: int, *, keep_alive: bool):
+        body = f"{status} {REASONS.get(status, '')}\n".encode()
+        headers = {
+            "Content-Type": "text/plain; charset=utf-8",
+            "Content-Length": str(len(body)),
+        }
+        self.write_head(writer, status, headers, keep_alive=keep_alive)
+        writer.write(body)
+        await writer.drain()
+
+    @staticmethod
+    def write_head(
+        writer: asyncio.StreamWriter, status: int, headers: dict[str, str], *, keep_alive: bool
+    ):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        headers.setdefault("Date", formatdate(usegmt=True))
+        headers.setdefault("Server", "noxious-map")
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    # ------------------------------------------------------------------
+    # resources
+    # ------------------------------------------------------------------
+
+    def translate_path(self, url_path: str) -> tuple[Path, bool]:
+        """Map an URL path to a file, returns (path, stamped)"""
+        parts = [p for p in unquote(url_path).split("/") if p and p != "."]
+        if ".." in parts:
+            raise HTTPError(403)
+        path = self.root.joinpath(*parts)
+        if not path.is_relative_to(self.root):
+            raise HTTPError(403)
+        if path.is_file():
+            return path, False
+
+        # same as the .htaccess rewrite: name.<stamp>.ext -> name.ext
+        match = STAMP_RE.match(path.name)
+        if match:
+            unstamped = path.with_name(f"{match['stem']}.{match['ext']}")
+            if unstamped.is_file():
+                return unstamped, True
+        return path, False
+
+    def render_start_page(self) -> bytes:
+        """Equivalent of index.php"""
+        # hashed from the files, not the manifest, so edits show up right away
+        stamps = {}
+        for name, rel in (("MANIFEST_HASH", "js/manifest.json"), ("SCRIPT_HASH", "js/script.js")):
+            with contextlib.suppress(OSError):
+                data = (self.root / rel).read_bytes()
+                stamps[name] = hashlib.md5(data).hexdigest()[:10]
+        html = (self.root / "start.html").read_text(encoding="utf-8")
+        html = TEMPLATE_VAR_RE.sub(lambda m: stamps.get(m[1], ""), html)
+        return self.inject_live_reload(html).encode("utf-8")
+
+    def inject_live_reload(self, html: str) -> str:
+        if self.live_reload is None:
+            return html
+        head, sep, tail = html.rpartition("</body>")
+        if not sep:
+            return html + LIVE_RELOAD_SCRIPT
+        return head + LIVE_RELOAD_SCRIPT + sep + tail
+
+    def live_reload_stamp(self) -> tuple[int, int] | None:
+        try:
+            stat = self.live_reload.stat()
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    async def resolve(self, request: Request) -> tuple[Resource, bool]:
+        url_path = urlsplit(request.path).path
+        if url_path in ("/", "/index.php"):
+            body = self.render_start_page()
+            etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+            resource = Resource(
+                path=self.root / "start.html",
+                size=len(body),
+                mtime=(self.root / "start.html").stat().st_mtime,
+                etag=etag,
+                content_type="text/html; charset=utf-8",
+                body=body,
             )
+            return resource, False
+
+        path, stamped = self.translate_path(url_path)
+        if path.suffix == ".py" or path.name.startswith("."):
+            raise HTTPError(403)
+        if path.is_dir():
+            index = path / "index.html"
+            if not index.is_file():
+                raise HTTPError(404)
+            path = index
+        if not path.is_file():
+            raise HTTPError(404)
+
+        content_type, _ = mimetypes.guess_type(path.name)
+        content_type = content_type or "application/octet-stream"
+        if content_type.startswith("text/") or content_type in ("application/json", "application/xml"):
+            content_type += "; charset=utf-8"
+
+        stat = path.stat()
+        if self.live_reload is not None and path.suffix == ".html":
+            body = self.inject_live_reload(path.read_text(encoding="utf-8")).encode("utf-8")
+            resource = Resource(
+                path=path,
+                size=len(body),
+                mtime=stat.st_mtime,
+                etag=f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"',
+                content_type=content_type,
+                body=body,
+            )
+            return resource, stamped
+        encoding = None
+        accepted = self.accepted_encodings(request)
+        for token, suffix in PRECOMPRESSED:
+            if token not in accepted:
+                continue
+            sibling = path.with_name(path.name + suffix)
+            try:
+                sibling_stat = sibling.stat()
+            except OSError:
+                continue
+            # ignore stale siblings
+            if sibling_stat.st_mtime_ns >= stat.st_mtime_ns:
+                path, stat, encoding = sibling, sibling_stat, token
+                break
+
+        resource = Resource(
+            path=path,
+            size=stat.st_size,
+            mtime=stat.st_mtime,
+            etag=await self.etags.get(path, stat),
+            content_type=content_type,
+            encoding=encoding,
+        )
+        return resource, stamped
+
+    @staticmethod
+    def accepted_encodings(request: Request) -> set[str]:
+        accepted = set()
+        for part in request.headers.get("accept-encoding", "").split(","):
+            token, _, params = part.strip().partition(";")
+            if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                continue
+            if token:
+                accepted.add(token.lower())
+        return accepted
+
+    @staticmethod
+    def not_modified(request: Request, resource: Resource) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            return "*" in tags or resource.etag in tags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(resource.mtime) <= since
+        return False
 
-    class HTTPDualStackServer(DualStackServerMixin, ThreadingHTTPServer):
-        pass
+    @staticmethod
+    def parse_range(request: Request, resource: Resource) -> tuple[int, int] | None:
+        """Returns an inclusive (start, end) for a satisfiable single range"""
+        header = request.headers.get("range")
+        if not header or not header.startswith("bytes="):
+            return None
+        if_range = request.headers.get("if-range")
+        if if_range is not None and if_range != resource.etag:
+            return None
+        spec = header[len("bytes="):].strip()
+        if "," in spec:
+            # multipart ranges are not worth it here, send everything
+            return None
+        first, sep, last = spec.partition("-")
+        if not sep:
+            return None
+        size = resource.size
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else size - 1
+            else:
+                start = max(0, size - int(last))
+                end = size - 1
+        except ValueError:
+            return None
+        if start >= size or start > end:
+            raise HTTPError(416)
+        return start, min(end, size - 1)
 
-    class RequestHandler(SimpleHTTPRequestHandler):
-        def translate_path(self, path):
-            path = super().translate_path(path)
-            path = path.replace(".%%METADATA_MTIME%%", "")
-            path = path.replace(".%%SCRIPT_MTIME%%", "")
-            return path
+    # ------------------------------------------------------------------
+    # responses
+    # ------------------------------------------------------------------
 
-    ServerClass = HTTPDualStackServer
+    async def respond(self, request: Request, writer: asyncio.StreamWriter) -> bool:
+        keep_alive = request.keep_alive
+        if request.method not in ("GET", "HEAD"):
+            raise HTTPError(405)
 
-    test(
-        HandlerClass=RequestHandler,
-        ServerClass=HTTPDualStackServer,
-        port=4354,
-        bind="127.0.0.1",
-        protocol="HTTP/1.0",
+        if self.live_reload is not None and urlsplit(request.path).path == LIVE_RELOAD_PATH:
+            await self.send_live_reload_events(writer)
+            return False
+
+        resource, stamped = await self.resolve(request)
+
+        headers = {
+            "Content-Type": resource.content_type,
+            "ETag": resource.etag,
+            "Last-Modified": formatdate(resource.mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
+            "Vary": "Accept-Encoding",
+        }
+        if resource.encoding is not None:
+            headers["Content-Encoding"] = resource.encoding
+        if stamped:
+            headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            headers["Cache-Control"] = "no-cache"
+
+        if self.not_modified(request, resource):
+            del headers["Content-Type"]
+            self.write_head(writer, 304, headers, keep_alive=keep_alive)
+            await writer.drain()
+            return keep_alive
+
+        try:
+            byte_range = self.parse_range(request, resource)
+        except HTTPError:
+            headers = {"Content-Range": f"bytes */{resource.size}", "Content-Length": "0"}
+            self.write_head(writer, 416, headers, keep_alive=keep_alive)
+            await writer.drain()
+            return keep_alive
+
+        status = 200
+        start, end = 0, resource.size - 1
+        if byte_range is not None:
+            status = 206
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{resource.size}"
+        length = max(0, end - start + 1)
+        headers["Content-Length"] = str(length)
+
+        self.write_head(writer, status, headers, keep_alive=keep_alive)
+        if request.method == "HEAD" or length == 0:
+            await writer.drain()
+            return keep_alive
+
+        if resource.body is not None:
+            writer.write(resource.body[start:end + 1])
+            await writer.drain()
+            return keep_alive
+
+        await writer.drain()
+        loop = asyncio.get_running_loop()
+        with resource.path.open("rb") as f:
+            try:
+                await loop.sendfile(writer.transport, f, start, length)
+            except (NotImplementedError, RuntimeError):
+                # e.g. TLS or Windows proactor transports
+                f.seek(start)
+                remaining = length
+                while remaining > 0:
+                    chunk = await loop.run_in_executor(None, f.read, min(STREAM_CHUNK, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    writer.write(chunk)
+                    await writer.drain()
+        return keep_alive
+
+    async def send_live_reload_events(self, writer: asyncio.StreamWriter):
+        """Server-sent events: ``reload`` with the rebuild info after each rebuild"""
+        headers = {"Content-Type": "text/event-stream", "Cache-Control": "no-cache"}
+        self.write_head(writer, 200, headers, keep_alive=False)
+        await writer.drain()
+        last = self.live_reload_stamp()
+        idle = 0.0
+        while not writer.is_closing():
+            await asyncio.sleep(LIVE_RELOAD_POLL)
+            idle += LIVE_RELOAD_POLL
+            stamp = self.live_reload_stamp()
+            if stamp != last:
+                last = stamp
+                with contextlib.suppress(OSError):
+                    data = self.live_reload.read_text(encoding="utf-8").strip()
+                    writer.write(f"event: reload\ndata: {data}\n\n".encode("utf-8"))
+                    idle = 0.0
+            elif idle >= LIVE_RELOAD_PING:
+                # notices closed connections, keeps proxies from timing out
+                writer.write(b": ping\n\n")
+                idle = 0.0
+            await writer.drain()
+
+
+async def serve(root: Path, bind: str, port: int, live_reload: Path | None = None):
+    server = StaticServer(root, live_reload)
+    family = socket.AF_INET6 if ":" in bind else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if family == socket.AF_INET6:
+        # ensure dual-stack is not disabled; ref #38907
+        with contextlib.suppress(Exception):
+            sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+    sock.bind((bind, port))
+
+    aserver = await asyncio.start_server(
+        server.handle_connection, sock=sock, backlog=1024, limit=MAX_HEADER_BYTES
     )
+    host = f"[{bind}]" if family == socket.AF_INET6 else bind
+    print(f"Serving {root} on http://{host}:{port}/ ...")
+    if live_reload is not None:
+        print(f"Reloading pages when {live_reload} changes")
+    async with aserver:
+        await aserver.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bind", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4354)
+    parser.add_argument("--directory", type=Path, default=HERE)
+    parser.add_argument(
+        "--live-reload",
+        action="store_true",
+        help="reload open pages after each rebuild of noxious-map watch",
+    )
+    args = parser.parse_args()
+    live_reload = None
+    if args.live_reload:
+        live_reload = args.directory.absolute().parent / ".cache" / "livereload.json"
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve(args.directory, args.bind, args.port, live_reload))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,8 @@
 from pathlib import Path
 
-from .downloader import download_data
-from .generator import BaseGenerator
-from .utils import compare_depth_sort
 
+def main(here: Path | None = None, argv: list[str] | None = None):
+    # the CLI imports the heavy modules per command, keep this one empty
+    from .cli import main as cli_main
 
-def main(here: Path):
-    download_data(here)
-
-    for gen_cls, _kwargs in BaseGenerator.get_subclasses():
-        print(f"Invoking generator: {gen_cls.__name__}")
-        gen = gen_cls(here)
-        gen.generate()
+    cli_main(here, argv)
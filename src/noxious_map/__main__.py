@@ -0,0 +1,3 @@
+from noxious_map import main
+
+main()
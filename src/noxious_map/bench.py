@@ -0,0 +1,223 @@
+"""Offline benchmarks against a synthetic bundle.
+
+Run with ``python -m noxious_map.bench``. Wall times are measured without
+tracemalloc; peak memory comes from one extra traced run per benchmark.
+
+``--startup`` instead times the light CLI commands against
+``STARTUP_BUDGET`` and exits with 1 if one is over.
+"""
+
+from dataclasses import dataclass
+from typing import Callable
+from pathlib import Path
+import argparse
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+import time
+import sys
+
+from noxious_map.generator import MapGenerator, MobGenerator
+from noxious_map.memory import peak_rss
+from noxious_map.models import Map
+from noxious_map.synthetic import SyntheticConfig, generate_bundle
+from noxious_map.tiled import parse_world
+from noxious_map.utils import pretty_size
+
+
+# commands that must not import the generators, see noxious_map.cli
+STARTUP_COMMANDS = [["--help"], ["targets"], ["build", "--help"]]
+# seconds on top of starting a bare interpreter
+STARTUP_BUDGET = 0.1
+
+
+@dataclass
+class BenchResult:
+    name: str
+    times: list[float]
+    peak_memory: int
+    max_rss: int | None
+
+    def row(self) -> str:
+        best = min(self.times) * 1000
+        median = statistics.median(self.times) * 1000
+        rss = pretty_size(self.max_rss) if self.max_rss is not None else "n/a"
+        return (
+            f"{self.name:<36} {best:>10.1f} {median:>10.1f}"
+            f" {pretty_size(self.peak_memory):>12} {rss:>12}"
+        )
+
+
+def measure(
+    name: str,
+    func: Callable[[], object],
+    *,
+    repeat: int,
+    setup: Callable[[], object] | None = None,
+) -> BenchResult:
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return BenchResult(name=name, times=times, peak_memory=peak, max_rss=peak_rss())
+
+
+def run_benchmarks(root: Path, *, repeat: int = 3) -> list[BenchResult]:
+    results = []
+
+    map_gen = MapGenerator(root)
+    tile_maps = [
+        Map.model_validate(tm, extra="forbid") for tm in map_gen.load("data/maps.json")
+    ]
+    tile_map = tile_maps[0]
+
+    results.append(
+        measure(
+            "MapGenerator.generate_base_map",
+            lambda: map_gen.generate_base_map(tile_map),
+            repeat=repeat,
+        )
+    )
+    results.append(
+        measure(
+            "MapGenerator.generate_map_objects",
+            lambda: map_gen.generate_map_objects(tile_map),
+            repeat=repeat,
+        )
+    )
+
+    extended_map, _ = map_gen.render_map(tile_map)
+    variants_dir = root / "bench_variants"
+
+    def _clear_variants():
+        for path in variants_dir.glob("*/*"):
+            path.unlink()
+
+    results.append(
+        measure(
+            "MapGenerator.save_variants",
+            lambda: map_gen.save_variants(extended_map, variants_dir, "bench.webp"),
+            repeat=repeat,
+            setup=_clear_variants,
+        )
+    )
+
+    # the remaining benchmarks work on the outputs of a full map build
+    results.append(measure("MapGenerator.generate", map_gen.generate, repeat=1))
+
+    world_file = map_gen.tiled_dir / "world.tmx"
+    results.append(
+        measure("parse_world", lambda: parse_world(world_file), repeat=repeat)
+    )
+    world = parse_world(world_file)
+    results.append(
+        measure(
+            "TiledWorld.write_xml",
+            lambda: world.write_xml(world_file),
+            repeat=repeat,
+        )
+    )
+
+    mob_gen = MobGenerator(root)
+    results.append(measure("MobGenerator.generate", mob_gen.generate, repeat=repeat))
+
+    return results
+
+
+def time_process(args: list[str], *, repeat: int) -> float:
+    """Median wall time of running ``args``"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def check_startup(*, repeat: int) -> bool:
+    interpreter = time_process([sys.executable, "-c", "pass"], repeat=repeat)
+    print(f"bare interpreter: {interpreter * 1000:.1f} ms")
+    print(f"{'command':<36} {'median ms':>10} {'budget ms':>10}")
+    ok = True
+    for command in STARTUP_COMMANDS:
+        elapsed = time_process(
+            [sys.executable, "-m", "noxious_map", *command], repeat=repeat
+        )
+        overhead = elapsed - interpreter
+        over = overhead > STARTUP_BUDGET
+        ok = ok and not over
+        print(
+            f"{' '.join(command):<36} {overhead * 1000:>10.1f}"
+            f" {STARTUP_BUDGET * 1000:>10.0f}{'  OVER' if over else ''}"
+        )
+    return ok
+
+
+def main(argv: list[str] | None = None):
+    defaults = SyntheticConfig()
+    parser = argparse.ArgumentParser(prog="python -m noxious_map.bench")
+    parser.add_argument("--maps", type=int, default=defaults.maps)
+    parser.add_argument("--map-size", type=int, default=defaults.map_width)
+    parser.add_argument(
+        "--density",
+        type=float,
+        default=defaults.object_density,
+        help="map objects per tile",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="only check the CLI start-up times, exit with 1 if over budget",
+    )
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument(
+        "--keep",
+        type=Path,
+        metavar="DIR",
+        help="generate into DIR and keep it instead of using a temp dir",
+    )
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        sys.exit(0 if check_startup(repeat=max(args.repeat, 5)) else 1)
+
+    config = SyntheticConfig(
+        maps=args.maps,
+        map_width=args.map_size,
+        map_height=args.map_size,
+        object_density=args.density,
+        seed=args.seed,
+    )
+
+    with tempfile.TemporaryDirectory(prefix="noxious-bench-") as tmp:
+        root = args.keep or Path(tmp)
+        print(f"Generating synthetic bundle in {root} ...")
+        generate_bundle(root, config)
+        results = run_benchmarks(root, repeat=args.repeat)
+
+    print()
+    print(
+        f"{'benchmark':<36} {'best ms':>10} {'median ms':>10}"
+        f" {'py peak':>12} {'max rss':>12}"
+    )
+    for result in results:
+        print(result.row())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,282 @@
+"""``noxious-map`` command line.
+
+Every command imports what it needs when it runs, so ``--help``,
+``targets`` and ``metadata`` start without loading Pillow, pydantic, Jinja
+or requests. ``python -m noxious_map.bench --startup`` checks this.
+"""
+
+from pathlib import Path
+import contextlib
+import tracemalloc
+import argparse
+import sys
+
+from .generator import TARGETS
+
+COMMANDS = ("build", "watch", "export", "targets", "metadata", "tiles", "bench")
+
+
+def add_build_arguments(parser: argparse.ArgumentParser, *, targets: bool = True):
+    if targets:
+        parser.add_argument(
+            "targets",
+            nargs="*",
+            metavar="TARGET",
+            help="only run these generators, in build order (default: all, see targets)",
+        )
+    parser.add_argument(
+        "--trace",
+        type=Path,
+        metavar="FILE",
+        help="write a Chrome trace-event JSON file (open in Perfetto)",
+    )
+    parser.add_argument(
+        "--timings",
+        action="store_true",
+        help="print a per-stage and per-map timing summary",
+    )
+    parser.add_argument(
+        "--memory-report",
+        type=Path,
+        metavar="FILE",
+        help="write per-map memory usage as JSON (enables tracemalloc)",
+    )
+    parser.add_argument(
+        "--memory-budget",
+        type=int,
+        metavar="MIB",
+        help="render large maps with less memory, or abort, to stay below this RSS",
+    )
+    parser.add_argument(
+        "--teleport-mode",
+        choices=["telepads", "tiles"],
+        default="telepads",
+        help="one connection per group of adjacent teleport tiles, or per tile",
+    )
+    parser.add_argument(
+        "--lights",
+        action="store_true",
+        help="render map lights into a separate overlay the viewer can toggle",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        metavar="N",
+        help=(
+            "threads encoding map images while the next map renders,"
+            " 0 renders and encodes in order (default: up to 4, 0 with"
+            " --memory-budget or --memory-report)"
+        ),
+    )
+    parser.add_argument(
+        "--encoding",
+        action="append",
+        default=[],
+        metavar="CLASS=FORMAT[:QUALITY[:EFFORT]][,...]",
+        help=(
+            "encoding profiles of an output class (full, ladder, thumbnail, sprite),"
+            " formats webp, webp-lossless and avif, effort 0-6."
+            " The first is referenced by Tiled and <img>, keep it webp."
+            " Example: --encoding full=webp:80,avif:55:5"
+        ),
+    )
+
+
+def build_options(parser: argparse.ArgumentParser, args: argparse.Namespace):
+    from .encoding import parse_profiles
+    from .types import BuildOptions
+
+    if args.workers is not None and args.workers < 0:
+        parser.error("--workers must be 0 or more")
+    try:
+        encoding = parse_profiles(args.encoding)
+    except ValueError as e:
+        parser.error(str(e))
+
+    return BuildOptions(
+        memory_report=args.memory_report,
+        memory_budget=(
+            args.memory_budget * 1024 * 1024 if args.memory_budget is not None else None
+        ),
+        teleport_mode=args.teleport_mode,
+        lights=args.lights,
+        workers=args.workers,
+        encoding=encoding,
+    )
+
+
+def build(parser: argparse.ArgumentParser, args: argparse.Namespace, here: Path):
+    unknown = [target for target in args.targets if target not in TARGETS]
+    if unknown:
+        parser.error(
+            f"unknown target {', '.join(unknown)}, choose from {', '.join(TARGETS)}"
+        )
+    options = build_options(parser, args)
+
+    from .downloader import download_data
+    from .generator import load_target
+    from .trace import tracer
+
+    if args.trace or args.timings:
+        tracer.enable()
+    if args.memory_report:
+        tracemalloc.start()
+
+    download_data(here)
+
+    for target in TARGETS:
+        if args.targets and target not in args.targets:
+            continue
+        gen_cls = load_target(target)
+        print(f"Invoking generator: {gen_cls.__name__}")
+        gen = gen_cls(here, options)
+        with tracer.span(gen_cls.__name__):
+            gen.generate()
+
+    if tracer.enabled:
+        print()
+        print(tracer.summary())
+    if args.trace:
+        tracer.write_chrome_trace(args.trace)
+        print(f"Trace written to {args.trace}")
+
+
+def watch(parser: argparse.ArgumentParser, args: argparse.Namespace, here: Path):
+    options = build_options(parser, args)
+
+    from .watch import Watcher
+
+    with contextlib.suppress(KeyboardInterrupt):
+        Watcher(here, options).run(args.interval)
+
+
+def export(parser: argparse.ArgumentParser, args: argparse.Namespace, here: Path):
+    from .export import HASH_CACHE, OUTPUT_MANIFEST, OutputManifest, export_delta
+    from .utils import pretty_size
+
+    if args.output.exists():
+        parser.error(f"{args.output} already exists")
+    since = None
+    if args.since is not None:
+        try:
+            since = OutputManifest.read(args.since)
+        except (OSError, ValueError, KeyError) as e:
+            parser.error(f"cannot read manifest {args.since}: {e}")
+
+    html_dir = here / "html"
+    manifest = OutputManifest.scan(html_dir, here / HASH_CACHE)
+    manifest.write(here / OUTPUT_MANIFEST)
+    delta = manifest.diff(since)
+    export_delta(html_dir, manifest, delta, args.output)
+
+    size = sum(manifest.files[rel].size for rel in delta.copied)
+    print(
+        f"{len(delta.added)} added, {len(delta.changed)} changed,"
+        f" {len(delta.deleted)} deleted files"
+    )
+    print(
+        f"Written {pretty_size(size)} of {pretty_size(manifest.size)} to {args.output}"
+    )
+
+
+def targets(parser: argparse.ArgumentParser, args: argparse.Namespace, here: Path):
+    for target, class_name in TARGETS.items():
+        print(f"{target:<10} {class_name}")
+
+
+def metadata(parser: argparse.ArgumentParser, args: argparse.Namespace, here: Path):
+    from .viewer import refresh_viewer_metadata
+
+    html_dir = here / "html"
+    metadata_file = html_dir / "js" / "metadata.json"
+    refresh_viewer_metadata(html_dir / "js" / "tiled" / "world.tmx", metadata_file)
+    print(f"Written {metadata_file}")
+
+
+def tiles(argv: list[str]):
+    from .tileserver import main as tileserver_main
+
+    tileserver_main(argv)
+
+
+def bench(argv: list[str]):
+    from .bench import main as bench_main
+
+    bench_main(argv)
+
+
+# commands with their own argument parser, they get the rest of the command line
+DELEGATED = {"tiles": tiles, "bench": bench}
+
+
+def main(here: Path | None = None, argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(
+        prog="noxious-map",
+        description="Without a command, runs build.",
+    )
+    subparsers = parser.add_subparsers(dest="command", metavar="COMMAND")
+
+    build_parser = subparsers.add_parser("build", help="download the data and build html/")
+    add_build_arguments(build_parser)
+    build_parser.set_defaults(run=build)
+
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help="rebuild what changes in the bundle, templates and Tiled files",
+    )
+    add_build_arguments(watch_parser, targets=False)
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=0.5,
+        metavar="SECONDS",
+        help="how often to look for changed files",
+    )
+    watch_parser.set_defaults(run=watch)
+
+    export_parser = subparsers.add_parser(
+        "export",
+        help="copy the files of html/ that changed since a deployment",
+    )
+    export_parser.add_argument(
+        "output",
+        type=Path,
+        help="new directory, or a .zip, .tar or .tar.gz archive",
+    )
+    export_parser.add_argument(
+        "--since",
+        type=Path,
+        metavar="MANIFEST",
+        help="output-manifest.json of the last deployment (default: export everything)",
+    )
+    export_parser.set_defaults(run=export)
+
+    subparsers.add_parser("targets", help="list the generators build runs").set_defaults(
+        run=targets
+    )
+    subparsers.add_parser(
+        "metadata",
+        help="rewrite js/metadata.json after editing js/tiled/world.tmx in Tiled",
+    ).set_defaults(run=metadata)
+
+    subparsers.add_parser("tiles", help="serve map tiles rendered on demand")
+    subparsers.add_parser("bench", help="benchmark the generators on a synthetic bundle")
+
+    if argv is None:
+        argv = sys.argv[1:]
+    # "noxious-map --trace x" used to be the only way to build
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        argv = ["build", *argv]
+    if argv[0] in DELEGATED:
+        DELEGATED[argv[0]](argv[1:])
+        return
+    args = parser.parse_args(argv)
+
+    if here is None:
+        here = Path.cwd()
+    sub_parser = {
+        "build": build_parser,
+        "watch": watch_parser,
+        "export": export_parser,
+    }.get(args.command, parser)
+    args.run(sub_parser, args, here)
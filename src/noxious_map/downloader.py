@@ -6,65 +6,78 @@ import secrets
 
 import requests
 
-from .models import Map
-from .utils import checksum_file, pretty_size, progress, normalize_name
+from .store import STORE_DIR, MapStore
+from .trace import span
+from .utils import checksum_file, pretty_size, progress
 
 
 def download_data(here: Path, *, force=False):
     print("Updating bundle.zip")
 
     filename = here / "bundle.zip"
-    bundle_dir = here / "bundle"
     url = "https://server.noxious.gg/data/bundle"
 
-    r = requests.head(url)
+    with span("download: head"):
+        r = requests.head(url)
     checksum = r.headers["Etag"].strip("\"'").lower()
     file_size = int(r.headers.get("Content-Length", "0"))
 
     if force or not filename.exists() or checksum != checksum_file(filename):
-        r = requests.get(url, stream=True)
-
         print("  downloading...")
-        collected = 0
-        with filename.open("wb") as f:
-            for chunk in progress(r.iter_content(1 << 16), max=file_size, incfunc=len):
-                print(f' [{pretty_size(collected)}/{pretty_size(file_size)}]', end='')
-                collected += len(chunk)
-                f.write(chunk)
+        with span("download: fetch", size=file_size):
+            r = requests.get(url, stream=True)
+            collected = 0
+            with filename.open("wb") as f:
+                for chunk in progress(r.iter_content(1 << 16), max=file_size, incfunc=len):
+                    print(f' [{pretty_size(collected)}/{pretty_size(file_size)}]', end='')
+                    collected += len(chunk)
+                    f.write(chunk)
     else:
         print("  skipping download.")
 
+    unpack_bundle(here)
+
+
+def unpack_bundle(here: Path):
+    """Unzip ``bundle.zip`` into ``bundle/`` and bring the map store up to date"""
+    filename = here / "bundle.zip"
+    bundle_dir = here / "bundle"
+
     print("  unzipping...")
-    if bundle_dir.exists():
-        shutil.rmtree(bundle_dir)
-    with zipfile.ZipFile(filename, "r") as zf:
-        zf.extractall(bundle_dir)
+    with span("download: unzip"):
+        # the map store is updated incrementally, see below
+        if bundle_dir.exists():
+            for child in bundle_dir.iterdir():
+                if child.name == STORE_DIR:
+                    continue
+                if child.is_dir():
+                    shutil.rmtree(child)
+                else:
+                    child.unlink()
+        with zipfile.ZipFile(filename, "r") as zf:
+            zf.extractall(bundle_dir)
 
     print("  formatting json files in bundle/data/ ...")
     for json_file in (bundle_dir / "data").glob("*.json"):
-        with json_file.open("r", encoding="utf-8") as f:
-            data = json.load(f)
-
-        rval = secrets.token_urlsafe(12)
-        tmp_json_file = json_file.with_stem(f"{json_file.stem}_{rval}")
-
-        with tmp_json_file.open("w", encoding="utf-8", newline="\n") as f:
-            json.dump(data, f, indent=2)
-
-        shutil.copyfile(tmp_json_file, json_file)
-        tmp_json_file.unlink()
-
-    # dump all maps in individual files for easier inspection
-    maps_json = bundle_dir / "data/maps.json"
-    maps_folder = bundle_dir / "maps"
-    if maps_folder.exists():
-        shutil.rmtree(maps_folder)
-    maps_folder.mkdir(parents=True, exist_ok=True)
-    with maps_json.open('r', encoding='utf-8') as f:
-        maps = json.load(f)
-    for tile_map in maps:
-        map_file = maps_folder / f"{tile_map['id']}_{normalize_name(tile_map['name'])}.json"
-        with map_file.open('w', encoding='utf-8', newline='\n') as f:
-            json.dump(tile_map, f, indent=4)
+        # by far the largest file and only ever read one map at a time,
+        # loading it whole here would set the peak memory of the build
+        if json_file.name == "maps.json":
+            continue
+        with span("download: format json", file=json_file.name):
+            with json_file.open("r", encoding="utf-8") as f:
+                data = json.load(f)
+
+            rval = secrets.token_urlsafe(12)
+            tmp_json_file = json_file.with_stem(f"{json_file.stem}_{rval}")
+
+            with tmp_json_file.open("w", encoding="utf-8", newline="\n") as f:
+                json.dump(data, f, indent=2)
+
+            shutil.copyfile(tmp_json_file, json_file)
+            tmp_json_file.unlink()
+
+    # one file per map, for loading single maps (and inspecting them)
+    with span("download: map store"):
+        MapStore.update(bundle_dir / "data" / "maps.json", bundle_dir / STORE_DIR)
 
     print("Update complete!")
@@ -0,0 +1,211 @@
+"""Image encoding profiles per output class.
+
+Output classes:
+ - ``full``: the full resolution map images (``maps/default``)
+ - ``ladder``: the downscaled map images the viewer switches to when zooming out
+ - ``thumbnail``: the fixed size map previews (``maps/fixed``)
+ - ``sprite``: monster and item sprites of the mobs page
+
+Every class has a list of profiles. The first one is the primary format, it
+is what the Tiled files and ``<img>`` tags point to. Further profiles write
+the same image again in another format, for browsers that support it.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+import io
+import threading
+import time
+
+from noxious_map.trace import span
+from noxious_map.utils import pretty_size
+
+if TYPE_CHECKING:
+    # BuildOptions needs this module, Pillow is only imported to encode
+    from PIL import Image
+
+OUTPUT_CLASSES = ("full", "ladder", "thumbnail", "sprite")
+
+# format -> (suffix, mime type)
+FORMATS: dict[str, tuple[str, str]] = {
+    "avif": (".avif", "image/avif"),
+    "webp": (".webp", "image/webp"),
+    "webp-lossless": (".webp", "image/webp"),
+}
+
+MAX_EFFORT = 6
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    format: str
+    # lossy quality, or how hard lossless webp tries
+    quality: int = 75
+    # 0 (fast) to 6 (small), webp's ``method``, mapped onto avif's ``speed``
+    effort: int = 4
+
+    def __str__(self):
+        return f"{self.format}:{self.quality}:{self.effort}"
+
+    @property
+    def suffix(self) -> str:
+        return FORMATS[self.format][0]
+
+    @property
+    def mime_type(self) -> str:
+        return FORMATS[self.format][1]
+
+    def save_kwargs(self) -> dict:
+        if self.format == "avif":
+            speed = round((MAX_EFFORT - self.effort) * 10 / MAX_EFFORT)
+            return {"format": "AVIF", "quality": self.quality, "speed": speed}
+        return {
+            "format": "WEBP",
+            "quality": self.quality,
+            "method": self.effort,
+            "lossless": self.format == "webp-lossless",
+        }
+
+
+def default_profiles() -> dict[str, list[EncodingProfile]]:
+    return {
+        "full": [EncodingProfile("webp", 75)],
+        "ladder": [EncodingProfile("webp", 75)],
+        "thumbnail": [EncodingProfile("webp", 75)],
+        "sprite": [EncodingProfile("webp", 80)],
+    }
+
+
+def _has_avif() -> bool:
+    from PIL import features
+
+    return features.check("avif")
+
+
+def parse_profiles(specs: list[str]) -> dict[str, list[EncodingProfile]]:
+    """Parse ``CLASS=FORMAT[:QUALITY[:EFFORT]][,FORMAT...]`` options.
+
+    Classes without a spec keep their default profiles.
+    """
+    profiles = default_profiles()
+    for spec in specs:
+        output_class, sep, value = spec.partition("=")
+        if not sep or output_class not in OUTPUT_CLASSES:
+            raise ValueError(
+                f"{spec!r}: expected CLASS=FORMAT[:QUALITY[:EFFORT]],"
+                f" CLASS is one of {', '.join(OUTPUT_CLASSES)}"
+            )
+
+        class_profiles = []
+        for part in value.split(","):
+            fmt, *numbers = part.split(":")
+            if fmt not in FORMATS or len(numbers) > 2:
+                raise ValueError(
+                    f"{spec!r}: bad profile {part!r}, format is one of"
+                    f" {', '.join(FORMATS)}"
+                )
+            try:
+                profile = EncodingProfile(fmt, *map(int, numbers))
+            except ValueError:
+                raise ValueError(
+                    f"{spec!r}: quality and effort must be integers"
+                ) from None
+            if not 0 <= profile.quality <= 100:
+                raise ValueError(f"{spec!r}: quality must be 0-100")
+            if not 0 <= profile.effort <= MAX_EFFORT:
+                raise ValueError(f"{spec!r}: effort must be 0-{MAX_EFFORT}")
+            if fmt == "avif" and not _has_avif():
+                raise ValueError(f"{spec!r}: Pillow was built without AVIF support")
+            if any(p.suffix == profile.suffix for p in class_profiles):
+                raise ValueError(f"{spec!r}: more than one {profile.suffix} profile")
+            class_profiles.append(profile)
+        profiles[output_class] = class_profiles
+
+    if not viewer_formats(profiles):
+        raise ValueError("full and ladder need at least one format in common")
+    return profiles
+
+
+def viewer_formats(
+    profiles: dict[str, list[EncodingProfile]],
+) -> list[tuple[str, str]]:
+    """(suffix, mime type) available for every map variant, smallest first"""
+    suffixes = {p.suffix for p in profiles["full"]}
+    suffixes &= {p.suffix for p in profiles["ladder"]}
+    return [
+        (suffix, mime)
+        for suffix, mime in dict(FORMATS.values()).items()
+        if suffix in suffixes
+    ]
+
+
+@dataclass
+class EncodingStats:
+    files: int = 0
+    bytes: int = 0
+    seconds: float = 0.0
+
+
+class Encoder:
+    """Saves images with the profiles of an output class and keeps totals"""
+
+    def __init__(self, profiles: dict[str, list[EncodingProfile]]):
+        self.profiles = profiles
+        self.stats: dict[tuple[str, EncodingProfile], EncodingStats] = {}
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """Start new totals, for the next run of a generator"""
+        with self._lock:
+            self.stats = {}
+
+    def primary(self, output_class: str) -> EncodingProfile:
+        return self.profiles[output_class][0]
+
+    def encode(
+        self, image: Image.Image, output_class: str, path: Path
+    ) -> list[tuple[Path, bytes]]:
+        """Encode once per profile without writing, primary first.
+
+        Returns the file path (``path`` with the profile's suffix) and data of
+        each. Can be called from several threads at once.
+        """
+        files = []
+        for profile in self.profiles[output_class]:
+            buffer = io.BytesIO()
+            with span("encode", output_class=output_class, profile=str(profile)):
+                start = time.perf_counter()
+                image.save(buffer, **profile.save_kwargs())
+                elapsed = time.perf_counter() - start
+            data = buffer.getvalue()
+
+            with self._lock:
+                stats = self.stats.setdefault((output_class, profile), EncodingStats())
+                stats.files += 1
+                stats.bytes += len(data)
+                stats.seconds += elapsed
+            files.append((path.with_suffix(profile.suffix), data))
+        return files
+
+    def save(self, image: Image.Image, output_class: str, path: Path) -> list[Path]:
+        """Write ``path`` (suffix replaced) once per profile, primary first"""
+        paths = []
+        for out, data in self.encode(image, output_class, path):
+            out.write_bytes(data)
+            paths.append(out)
+        return paths
+
+    def report(self) -> str:
+        lines = [
+            f"  {'class':<10} {'profile':<20} {'files':>6}"
+            f" {'size':>11} {'time':>9} {'avg':>10}"
+        ]
+        for (output_class, profile), stats in self.stats.items():
+            avg = stats.bytes // stats.files if stats.files else 0
+            lines.append(
+                f"  {output_class:<10} {str(profile):<20} {stats.files:>6}"
+                f" {pretty_size(stats.bytes):>11} {stats.seconds:>8.2f}s"
+                f" {pretty_size(avg):>10}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,164 @@
+"""Manifest of every file in ``html/`` and delta exports for deployment.
+
+A build writes ``output-manifest.json`` next to ``html/``: size and MD5 of
+each output file. Maps are written again on every build, so mtimes say
+nothing, but the content of an unchanged map stays the same.
+
+``noxious-map export --since OLD`` compares the current files with ``OLD``,
+the manifest of the last deployment, and exports::
+
+    html/...              added and changed files
+    deleted.txt           paths to delete on the server, one per line
+    output-manifest.json  the manifest to pass as --since next time
+
+into a directory, or a ``.zip``/``.tar``/``.tar.gz`` archive.
+"""
+
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Self
+import io
+import json
+import shutil
+import tarfile
+import time
+import zipfile
+
+from noxious_map.utils import checksum_file
+
+OUTPUT_MANIFEST = "output-manifest.json"
+DELETED_FILE = "deleted.txt"
+# path -> [size, mtime_ns, md5], so unchanged files are not hashed again
+HASH_CACHE = Path(".cache") / "output-hashes.json"
+
+# never deployed
+EXCLUDE_DIRS = {"__pycache__"}
+EXCLUDE_SUFFIXES = {".pyc"}
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+@dataclass
+class OutputFile:
+    size: int
+    hash: str
+
+
+@dataclass
+class Delta:
+    added: list[str] = field(default_factory=list)
+    changed: list[str] = field(default_factory=list)
+    deleted: list[str] = field(default_factory=list)
+
+    @property
+    def copied(self) -> list[str]:
+        return sorted(self.added + self.changed)
+
+
+class OutputManifest:
+    def __init__(self, files: dict[str, OutputFile]):
+        # posix path relative to html/ -> file
+        self.files = files
+
+    @classmethod
+    def scan(cls, html_dir: Path, cache_file: Path | None = None) -> Self:
+        """Size and hash of every file below ``html_dir``"""
+        cache: dict[str, list] = {}
+        if cache_file is not None and cache_file.exists():
+            cache = json.loads(cache_file.read_text(encoding="utf-8"))
+
+        files = {}
+        new_cache = {}
+        for path in sorted(html_dir.rglob("*")):
+            if not path.is_file() or path.suffix in EXCLUDE_SUFFIXES:
+                continue
+            rel = path.relative_to(html_dir)
+            if EXCLUDE_DIRS.intersection(rel.parts[:-1]):
+                continue
+            rel = rel.as_posix()
+            stat = path.stat()
+            cached = cache.get(rel)
+            if cached is not None and cached[:2] == [stat.st_size, stat.st_mtime_ns]:
+                digest = cached[2]
+            else:
+                digest = checksum_file(path)
+            files[rel] = OutputFile(size=stat.st_size, hash=digest)
+            new_cache[rel] = [stat.st_size, stat.st_mtime_ns, digest]
+
+        if cache_file is not None:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            with cache_file.open("w", encoding="utf-8", newline="\n") as f:
+                json.dump(new_cache, f, separators=(",", ":"))
+        return cls(files)
+
+    @classmethod
+    def read(cls, path: Path) -> Self:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return cls(
+            {
+                rel: OutputFile(size=size, hash=digest)
+                for rel, (size, digest) in data["files"].items()
+            }
+        )
+
+    def dumps(self) -> bytes:
+        data = {
+            "files": {
+                rel: [file.size, file.hash] for rel, file in sorted(self.files.items())
+            }
+        }
+        return json.dumps(data, separators=(",", ":")).encode("utf-8")
+
+    def write(self, path: Path):
+        path.write_bytes(self.dumps())
+
+    @property
+    def size(self) -> int:
+        return sum(file.size for file in self.files.values())
+
+    def diff(self, old: Self | None) -> Delta:
+        """What changed since ``old``, everything is added without it"""
+        old_files = old.files if old is not None else {}
+        delta = Delta()
+        for rel, file in self.files.items():
+            before = old_files.get(rel)
+            if before is None:
+                delta.added.append(rel)
+            elif before != file:
+                delta.changed.append(rel)
+        delta.deleted = sorted(old_files.keys() - self.files.keys())
+        return delta
+
+
+def export_delta(html_dir: Path, manifest: OutputManifest, delta: Delta, out: Path):
+    """Write the changed files, ``deleted.txt`` and the manifest to ``out``"""
+    extra = {
+        DELETED_FILE: "".join(f"{rel}\n" for rel in delta.deleted).encode("utf-8"),
+        OUTPUT_MANIFEST: manifest.dumps(),
+    }
+
+    name = out.name.lower()
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as zf:
+            for rel in delta.copied:
+                zf.write(html_dir / rel, f"html/{rel}")
+            for member, data in extra.items():
+                zf.writestr(member, data)
+    elif name.endswith(ARCHIVE_SUFFIXES):
+        mode = "w" if name.endswith(".tar") else "w:gz"
+        with tarfile.open(out, mode) as tf:
+            for rel in delta.copied:
+                tf.add(html_dir / rel, f"html/{rel}")
+            for member, data in extra.items():
+                info = tarfile.TarInfo(member)
+                info.size = len(data)
+                info.mtime = int(time.time())
+                tf.addfile(info, io.BytesIO(data))
+    else:
+        out.mkdir(parents=True)
+        for rel in delta.copied:
+            target = out / "html" / rel
+            target.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(html_dir / rel, target)
+        for member, data in extra.items():
+            (out / member).write_bytes(data)
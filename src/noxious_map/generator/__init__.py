@@ -1,3 +1,50 @@
-from .base import BaseGenerator as BaseGenerator
-from .mobs import MobGenerator as MobGenerator
-from .maps import MapGenerator as MapGenerator
+"""The generators of a build, in the order they run.
+
+The generator modules pull in Pillow, pydantic and Jinja, so they are only
+imported once one of their classes is accessed.
+"""
+
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+# target name (module) -> generator class, in build order; CompressGenerator
+# has to come after everything writing text assets, OutputsGenerator last
+TARGETS: dict[str, str] = {
+    "maps": "MapGenerator",
+    "overview": "OverviewGenerator",
+    "heatmap": "HeatmapGenerator",
+    "mobs": "MobGenerator",
+    "routes": "RouteGenerator",
+    "walk": "WalkGenerator",
+    "manifest": "ManifestGenerator",
+    "compress": "CompressGenerator",
+    "outputs": "OutputsGenerator",
+}
+
+_MODULES = {"BaseGenerator": "base"} | {
+    class_name: target for target, class_name in TARGETS.items()
+}
+
+if TYPE_CHECKING:
+    from .base import BaseGenerator as BaseGenerator
+    from .maps import MapGenerator as MapGenerator
+    from .overview import OverviewGenerator as OverviewGenerator
+    from .heatmap import HeatmapGenerator as HeatmapGenerator
+    from .mobs import MobGenerator as MobGenerator
+    from .routes import RouteGenerator as RouteGenerator
+    from .walk import WalkGenerator as WalkGenerator
+    from .manifest import ManifestGenerator as ManifestGenerator
+    from .compress import CompressGenerator as CompressGenerator
+    from .outputs import OutputsGenerator as OutputsGenerator
+
+
+def __getattr__(name: str):
+    module = _MODULES.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(import_module(f".{module}", __name__), name)
+
+
+def load_target(target: str) -> type[BaseGenerator]:
+    """Generator class of a target name, see ``TARGETS``"""
+    return __getattr__(TARGETS[target])
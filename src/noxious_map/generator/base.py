@@ -1,8 +1,15 @@
 import json
 from pathlib import Path
+from typing import Iterator
 
 from jinja2 import Environment, FileSystemLoader
 
+from noxious_map.models import Map
+from noxious_map.store import MapStore
+from noxious_map.trace import span
+from noxious_map.types import BuildOptions
+from noxious_map.utils import content_stamp, stamp_name
+
 
 class BaseGenerator:
     root: Path
@@ -10,18 +17,12 @@ class BaseGenerator:
     out_dir: Path
     templates_root: Path
     jinja_env: Environment
+    options: BuildOptions
+    _store: MapStore | None = None
 
-    _subclasses = []
-
-    def __init_subclass__(cls, **kwargs):
-        cls._subclasses.append((cls, kwargs))
-
-    @classmethod
-    def get_subclasses(cls):
-        return cls._subclasses
-
-    def __init__(self, root: Path):
+    def __init__(self, root: Path, options: BuildOptions | None = None):
         self.root = root
+        self.options = options or BuildOptions()
         self.bundle_dir = self.root / "bundle"
         self.out_dir = self.root / "html"
         self.tiled_dir = self.out_dir / "js" / "tiled"
@@ -52,11 +53,41 @@ class BaseGenerator:
             raise FileNotFoundError(str(result))
         return result
 
+    def stamped(self, path: str) -> str:
+        """``path`` inside html/ with the content hash of the file in its name.
+
+        Files that do not exist keep their plain name.
+        """
+        full_path = self.out(path)
+        if not full_path.is_file():
+            return path
+        return stamp_name(path, content_stamp(full_path))
+
     def load(self, path: str):
         """Load JSON file from bundle"""
         full_path = self.bundle_dir / path
         with full_path.open("r", encoding="utf-8") as f:
             return json.load(f)
 
+    @property
+    def store(self) -> MapStore:
+        """The bundle's map store, opened on first use"""
+        if self._store is None:
+            self._store = MapStore.open(self.bundle_dir)
+        return self._store
+
+    def load_map(self, map_id: str) -> Map:
+        """One map from the bundle's map store, without parsing maps.json"""
+        return self.store.load(map_id)
+
+    def iter_maps(self, forbid_extra: bool = False) -> Iterator[Map]:
+        """All maps in ``maps.json`` order, one validated map in memory at a time"""
+        for entry in self.store:
+            with span("validate map", map=entry.id):
+                tile_map = Map.model_validate(
+                    self.store.load_raw(entry.id), extra="forbid" if forbid_extra else None
+                )
+            yield tile_map
+
     def generate(self):
         raise NotImplementedError()
@@ -0,0 +1,139 @@
+from typing import Callable
+from pathlib import Path
+import hashlib
+import gzip
+import json
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    from compression import zstd
+except ImportError:
+    zstd = None
+
+from noxious_map.trace import span
+from noxious_map.utils import pretty_size
+from .base import BaseGenerator
+
+# every sibling this step may have written, whatever is installed now
+SIBLING_SUFFIXES = (".gz", ".br", ".zst")
+
+
+def _gzip(data: bytes) -> bytes:
+    # mtime=0 keeps the output stable for unchanged inputs
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _brotli(data: bytes) -> bytes:
+    return brotli.compress(data, quality=11)
+
+
+def _zstd(data: bytes) -> bytes:
+    _, max_level = zstd.CompressionParameter.compression_level.bounds()
+    return zstd.compress(data, level=max_level)
+
+
+class CompressGenerator(BaseGenerator):
+    """Writes .gz/.br/.zst siblings for the text assets in html/.
+
+    The packed walk files are included: their distance fields are smooth
+    and compress to a fifth of their size or less.
+
+    Runs after the other generators. A content hash per file is kept in
+    ``.cache/precompress.json`` so unchanged files are not compressed again.
+    """
+
+    patterns = [
+        "*.html",
+        "js/*.js",
+        "js/*.json",
+        "js/*.svg",
+        "js/tiled/*.tmx",
+        "js/tiled/*.tsx",
+        "js/heat/*.json",
+        "js/walk/*.bin",
+    ]
+    # not worth a second request header round for tiny files
+    min_size = 256
+
+    def encoders(self) -> list[tuple[str, Callable[[bytes], bytes]]]:
+        encoders = [(".gz", _gzip)]
+        if brotli is not None:
+            encoders.append((".br", _brotli))
+        if zstd is not None:
+            encoders.append((".zst", _zstd))
+        return encoders
+
+    def find_siblings(self) -> list[Path]:
+        siblings = set()
+        for pattern in self.patterns:
+            for suffix in SIBLING_SUFFIXES:
+                siblings.update(self.out_dir.glob(pattern + suffix))
+        return sorted(siblings)
+
+    def find_assets(self) -> list[Path]:
+        assets = set()
+        for pattern in self.patterns:
+            for path in self.out_dir.glob(pattern):
+                if path.is_file() and path.stat().st_size >= self.min_size:
+                    assets.add(path)
+        return sorted(assets)
+
+    def generate(self):
+        print("Precompressing text assets...")
+        state_file = self.root / ".cache" / "precompress.json"
+        state: dict[str, str] = {}
+        if state_file.exists():
+            state = json.loads(state_file.read_text(encoding="utf-8"))
+
+        encoders = self.encoders()
+        assets = self.find_assets()
+        new_state: dict[str, str] = {}
+        for path in assets:
+            rel = path.relative_to(self.out_dir).as_posix()
+            data = path.read_bytes()
+            digest = hashlib.sha256(data).hexdigest()
+            new_state[rel] = digest
+
+            siblings = [
+                (path.with_name(path.name + suffix), encode)
+                for suffix, encode in encoders
+            ]
+            if state.get(rel) == digest and all(s.exists() for s, _ in siblings):
+                for sibling, _ in siblings:
+                    self.sync_mtime(path, sibling)
+                continue
+
+            sizes = []
+            for sibling, encode in siblings:
+                with span("compress", file=rel, encoding=sibling.suffix):
+                    compressed = encode(data)
+                sibling.write_bytes(compressed)
+                self.sync_mtime(path, sibling)
+                sizes.append(f"{sibling.suffix} {pretty_size(len(compressed))}")
+            print(f"  {rel}: {pretty_size(len(data))} -> {', '.join(sizes)}")
+
+        # siblings of assets that are gone, too small now, or of an encoder
+        # that is no longer installed would be served forever otherwise
+        current = {
+            path.with_name(path.name + suffix)
+            for path in assets
+            for suffix, _ in encoders
+        }
+        for sibling in self.find_siblings():
+            if sibling not in current:
+                sibling.unlink()
+
+        state_file.parent.mkdir(parents=True, exist_ok=True)
+        with state_file.open("w", encoding="utf-8", newline="\n") as f:
+            json.dump(new_state, f, indent=2)
+
+    @staticmethod
+    def sync_mtime(source: Path, sibling: Path):
+        """Give the sibling the source's mtime, so servers can tell it is not stale"""
+        stat = source.stat()
+        os.utime(sibling, ns=(stat.st_atime_ns, stat.st_mtime_ns))
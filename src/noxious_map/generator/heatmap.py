@@ -0,0 +1,106 @@
+import json
+
+from noxious_map.heatmap import project_to_screen, quantize, splat_spawns
+from noxious_map.models.map import Monster
+from noxious_map.tiled import ImageObject, Tile, parse_world
+from noxious_map.trace import span
+from noxious_map.utils import normalize_name, progress
+from noxious_map.viewer import Projection, latlng
+from .base import BaseGenerator
+
+
+class HeatmapGenerator(BaseGenerator):
+    """Writes ``js/heat/<map>.json``: spawn density, one layer per monster.
+
+    Layers are uint8 grids of ``cell`` screen pixels over the ground tiles,
+    cropped to where the monster spawns. The viewer adds up the layers that
+    match its monster or level band filter. ``metadata.json`` gets the
+    monster list as ``heat`` and the file name per map entry.
+    """
+
+    # screen pixels per grid cell, half a tile's width
+    cell = 32
+    # levels per band of the viewer's level filter
+    band = 10
+
+    def generate(self):
+        print("Generating spawn heatmaps...")
+        metadata_file = self.out("js/metadata.json")
+        metadata = json.loads(metadata_file.read_text(encoding="utf-8"))
+
+        world = parse_world(self.tiled_dir / "world.tmx")
+        proj = Projection(world)
+        placed: dict[str, tuple[ImageObject, Tile]] = {}
+        for obj in world.get_layer_by_name("Maps").objects:
+            if isinstance(obj, ImageObject) and obj.gid is not None:
+                tile = world.get_tile_by_gid(obj.gid)
+                if tile is not None:
+                    placed[obj.properties["tileMapId"].value] = obj, tile
+
+        monsters_data = {m["id"]: m for m in self.load("data/monsters.json")}
+        out_dir = self.out("js/heat")
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        # monster id -> index into metadata["heat"]["monsters"]
+        monster_index: dict[str, int] = {}
+        heat_files: dict[str, str] = {}
+        for tile_map in progress(self.iter_maps(), max=len(self.store)):
+            if not tile_map.monsters or tile_map.id not in placed:
+                continue
+
+            spawns: dict[str, list[Monster]] = {}
+            for monster in tile_map.monsters:
+                spawns.setdefault(monster.monster, []).append(monster)
+
+            layers = []
+            size = (0, 0)
+            with span("heatmap: splat", map=tile_map.id, spawns=len(tile_map.monsters)):
+                for monster_id, monster_spawns in sorted(spawns.items()):
+                    grid = splat_spawns(tile_map, monster_spawns)
+                    screen = project_to_screen(tile_map, grid, self.cell)
+                    size = screen.size
+                    layer = quantize(screen)
+                    if layer is None:
+                        continue
+                    layer["monster"] = monster_index.setdefault(
+                        monster_id, len(monster_index)
+                    )
+                    layers.append(layer)
+            if not layers:
+                continue
+
+            left, top, _, _ = proj.base_screen_bounds(*placed[tile_map.id])
+            right = left + size[0] * self.cell
+            bottom = top + size[1] * self.cell
+            heat = {
+                "bounds": [latlng(left, bottom), latlng(right, top)],
+                "size": list(size),
+                "layers": layers,
+            }
+            filename = f"{normalize_name(tile_map.id)}.json"
+            with (out_dir / filename).open("w", encoding="utf-8", newline="\n") as f:
+                json.dump(heat, f, separators=(",", ":"))
+            heat_files[tile_map.id] = filename
+
+        # maps that lost their spawns or their place in the world, with the
+        # precompressed siblings of their files
+        written = set(heat_files.values())
+        for path in out_dir.iterdir():
+            name = path.name
+            if path.suffix in (".gz", ".br", ".zst"):
+                name = path.stem
+            if path.is_file() and name not in written:
+                path.unlink()
+        for entry in metadata["maps"]:
+            if entry["id"] in heat_files:
+                entry["heat"] = heat_files[entry["id"]]
+            else:
+                entry.pop("heat", None)
+        monsters = []
+        for monster_id in monster_index:
+            data = monsters_data.get(monster_id, {})
+            monsters.append([monster_id, data.get("name", monster_id), data.get("level", 0)])
+        metadata["heat"] = {"monsters": monsters, "band": self.band}
+        with metadata_file.open("w", encoding="utf-8", newline="\n") as f:
+            json.dump(metadata, f, separators=(",", ":"), ensure_ascii=False)
+        print(f"  {len(heat_files)} maps, {len(monsters)} monsters")
@@ -0,0 +1,54 @@
+from pathlib import Path
+import json
+
+from noxious_map.trace import span
+from noxious_map.utils import content_stamp
+from .base import BaseGenerator
+
+
+class ManifestGenerator(BaseGenerator):
+    """Writes ``js/manifest.json``: content hash of every versioned asset.
+
+    The viewer and ``index.php`` put these hashes into asset URLs
+    (``maps/default/a.<hash>.webp``), which are served as immutable. A file
+    only gets a new URL when its content changes, so a rebuild does not
+    invalidate every cached map image.
+    """
+
+    patterns = [
+        "maps/*/*.webp",
+        "maps/*/*.avif",
+        "sprites/*.webp",
+        "sprites/*.avif",
+        "sprites/*.png",
+        "js/tiled/*.tmx",
+        "js/tiled/*.tsx",
+        "js/heat/*.json",
+        "js/walk/*.bin",
+        "js/*.json",
+        "js/*.js",
+        "js/*.svg",
+    ]
+    manifest_path = "js/manifest.json"
+
+    def find_assets(self) -> list[Path]:
+        assets = set()
+        for pattern in self.patterns:
+            for path in self.out_dir.glob(pattern):
+                if path.is_file():
+                    assets.add(path)
+        assets.discard(self.out(self.manifest_path))
+        return sorted(assets)
+
+    def generate(self):
+        print("Writing asset manifest...")
+        files = {}
+        with span("manifest: hash assets"):
+            for path in self.find_assets():
+                files[path.relative_to(self.out_dir).as_posix()] = content_stamp(path)
+
+        with self.out(self.manifest_path).open(
+            "w", encoding="utf-8", newline="\n"
+        ) as f:
+            json.dump({"files": files}, f, separators=(",", ":"), sort_keys=True)
+        print(f"  {len(files)} files")
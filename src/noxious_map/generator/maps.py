@@ -1,6 +1,9 @@
 from random import Random
-from functools import cmp_to_key
-from typing import Generator, TypedDict, Collection
+from functools import cmp_to_key, partial
+from typing import TYPE_CHECKING, Generator, Iterable, TypedDict, Collection
+import base64
+import io
+import os
 import re
 import shutil
 from pathlib import Path
@@ -10,7 +13,23 @@ from PIL import Image
 from noxious_map.models import Map, MapObject, Item
 from noxious_map.models.map import Teleport
 from noxious_map.types import Paddings, ObjectMapRanges
-from noxious_map.utils import compare_depth_sort, nc, progress, normalize_name
+from noxious_map.trace import span
+from noxious_map.encoding import Encoder, viewer_formats
+from noxious_map.lighting import render_lights
+from noxious_map.pipeline import Pipeline
+from noxious_map.memory import (
+    MapMemoryRecord,
+    MemoryBudgetExceeded,
+    MemoryReport,
+    current_rss,
+)
+from noxious_map.utils import (
+    compare_depth_sort,
+    nc,
+    progress,
+    normalize_name,
+    pretty_size,
+)
 from noxious_map.tiled import (
     parse_world,
     Tile,
@@ -19,11 +38,22 @@ from noxious_map.tiled import (
     PointObject,
     Property,
 )
+from noxious_map.viewer import write_viewer_metadata
 from .base import BaseGenerator
 
+if TYPE_CHECKING:
+    from noxious_map.utils import SortParam
+
 random = Random()
 random.seed(123)
 
+# clockwise tile rotations in degrees that need no resampling
+QUARTER_TURNS = {
+    90: Image.Transpose.ROTATE_270,
+    180: Image.Transpose.ROTATE_180,
+    270: Image.Transpose.ROTATE_90,
+}
+
 
 class Telepad(TypedDict):
     src_positions: list[tuple[int, int]]
@@ -31,12 +61,58 @@ class Telepad(TypedDict):
     dest_map: str
     dest_positions: list[tuple[int, int]]
     dest_center: tuple[int, int]
+    # representative teleport, carries the shared requirements
+    teleport: Teleport
 
 
 class MapGenerator(BaseGenerator):
+    # resolution folder -> integer downscale factor or thumbnail bounding box
+    variants: list[tuple[str, int | tuple[float, float]]] = [
+        ("default", 1),
+        ("low", 2),
+        ("small", 3),
+        ("tiny", 4),
+        ("micro", 5),
+        ("fixed", (256, 256)),
+    ]
+
+    memory_report: MemoryReport | None = None
+    encoder: Encoder
+    pipeline: Pipeline | None = None
+    # re-render only these map ids and keep the images of the others,
+    # everything is rendered when None
+    only: Collection[str] | None = None
+    # map id -> light overlay file in maps/lights/
+    light_files: dict[str, str]
+    # map id -> tiny blurred stand-in shown while the map image loads,
+    # made from this variant, at most placeholder_size pixels wide and high
+    placeholders: dict[str, str]
+    placeholder_variant = "micro"
+    placeholder_size = 24
+    # (tile type, rotation) -> ground texture and its offset from the
+    # unrotated one, loaded and turned once and shared by all maps
+    tile_textures: dict[tuple[str, int], tuple[Image.Image, tuple[int, int]]]
+
+    def setup(self):
+        self.encoder = Encoder(self.options.encoding)
+        self.tile_textures = {}
+        self.light_files = {}
+        self.placeholders = {}
+        if self.options.memory_report is not None:
+            self.memory_report = MemoryReport(budget=self.options.memory_budget)
+
     def generate(self):
         print("generating maps...")
+        self.encoder.reset()
         self.load_maps()
+        print("Map encoding:")
+        print(self.encoder.report())
+        if self.pipeline is not None:
+            print("Map pipeline:")
+            print(self.pipeline.report())
+        if self.memory_report is not None:
+            self.memory_report.write_json(self.options.memory_report)
+            print(f"Memory report written to {self.options.memory_report}")
         print("Done!")
 
     def load_maps(self):
@@ -59,24 +135,20 @@ class MapGenerator(BaseGenerator):
         max_tile_id = max(t.id for t in orig_tileset.tiles) if orig_tileset.tiles else 0
 
         # load items data
-        items_data_raw = self.load("data/items.json")
-        items_data: dict[str | int, Item] = {
-            item["id"]: Item.model_validate(item, extra="forbid")
-            for item in items_data_raw
-        }
-
-        tile_maps_raw = self.load("data/maps.json")
-        tile_maps: list[Map] = []
-        id_map_tile_map: dict[str, Map] = {}
-        for tile_map_raw in tile_maps_raw:
-            loaded_map = Map.model_validate(tile_map_raw, extra="forbid")
-            tile_maps.append(loaded_map)
-            id_map_tile_map[loaded_map.id] = loaded_map
-
-        missing_teleport_destination_maps = []
-
-        for tile_map, img, paddings, default_filepath in self.generate_map_images(
-            tile_maps
+        with span("maps: load items"):
+            items_data_raw = self.load("data/items.json")
+            items_data: dict[str | int, Item] = {
+                item["id"]: Item.model_validate(item, extra="forbid")
+                for item in items_data_raw
+            }
+
+        # maps are validated and rendered one at a time from the map store,
+        # only their names stay around to resolve teleport destinations
+        map_names = {entry.id: entry.name for entry in self.store}
+        missing_teleport_destination_maps: list[tuple[str, str, Teleport]] = []
+
+        for tile_map, size, paddings, default_filepath in self.generate_map_images(
+            self.iter_maps(forbid_extra=True), len(map_names)
         ):
             tile = orig_tileset.find_tile_by_noxious_id(tile_map.id)
             if tile is None:
@@ -93,8 +165,8 @@ class MapGenerator(BaseGenerator):
                 tile = Tile(
                     id=max_tile_id,
                     source=default_filepath,
-                    width=img.width,
-                    height=img.height,
+                    width=size[0],
+                    height=size[1],
                 )
 
             tile.properties["noxious_id"] = Property(type="string", value=tile_map.id)
@@ -109,8 +181,7 @@ class MapGenerator(BaseGenerator):
                 type="int", value=str(tile_map.height)
             )
             tile.source = default_filepath
-            tile.width = img.width
-            tile.height = img.height
+            tile.width, tile.height = size
             tileset.tiles.append(tile)
 
             old_object = old_world.get_image_object_by_tile_map_id(tile_map.id)
@@ -136,19 +207,22 @@ class MapGenerator(BaseGenerator):
             obj.properties["tileMapName"] = Property(type="string", value=tile_map.name)
 
             map_objects.objects.append(obj)
-            # for group in self.group_teleport_islands(tile_map.teleports):
-            for tp in tile_map.teleports:
-                dest_tile_map = id_map_tile_map.get(tp.toMap)
-                if dest_tile_map is None:
-                    missing_teleport_destination_maps.append((tile_map, tp))
+            for tp, src_pos, dest_pos, src_tiles, dest_tiles in self.iter_connections(
+                tile_map
+            ):
+                dest_name = map_names.get(tp.toMap)
+                if dest_name is None:
+                    missing_teleport_destination_maps.append(
+                        (tile_map.id, tile_map.name, tp)
+                    )
                     continue
-                src_x, src_y = tp.x, tp.y
+                src_x, src_y = src_pos
                 local_xy = self.get_tile_center(src_x, src_y, tile_map, paddings)
                 world_x, world_y = self.to_tiled_image_position(
-                    local_xy, (obj.x, obj.y), img.size
+                    local_xy, (obj.x, obj.y), size
                 )
                 pobject = PointObject(
-                    name=f"To: {dest_tile_map.name}",
+                    name=f"To: {dest_name}",
                     id=new_world.nextobjectid,
                     x=world_x,
                     y=world_y,
@@ -156,16 +230,23 @@ class MapGenerator(BaseGenerator):
                         "attachedTo": Property(type="object", value=str(obj.id)),
                         "srcMapId": Property(type="string", value=tile_map.id),
                         "srcMapName": Property(type="string", value=tile_map.name),
-                        "srcPos": Property(type="string", value=str((tp.x, tp.y))),
-                        "destMapId": Property(type="string", value=dest_tile_map.id),
-                        "destMapName": Property(
-                            type="string", value=dest_tile_map.name
-                        ),
-                        "destPos": Property(type="string", value=str((tp.toX, tp.toY))),
+                        "srcPos": Property(type="string", value=str(src_pos)),
+                        "destMapId": Property(type="string", value=tp.toMap),
+                        "destMapName": Property(type="string", value=dest_name),
+                        "destPos": Property(type="string", value=str(dest_pos)),
                     },
                 )
                 new_world.nextobjectid += 1
 
+                if len(src_tiles) > 1:
+                    pobject.properties["srcTiles"] = Property(
+                        type="string", value=str(src_tiles)
+                    )
+                if len(dest_tiles) > 1:
+                    pobject.properties["destTiles"] = Property(
+                        type="string", value=str(dest_tiles)
+                    )
+
                 if tp.itemRequired is not None:
                     pobject.properties["itemRequired"] = Property(
                         type="string", value=str(tp.itemRequired)
@@ -182,13 +263,14 @@ class MapGenerator(BaseGenerator):
 
                 point_objects.objects.append(pobject)
 
-        for tm, tp in missing_teleport_destination_maps:
+        for map_id, map_name, tp in missing_teleport_destination_maps:
             print(
-                f"[{tm.id}] {tm.name} {(tp.x, tp.y)} missing teleport map: {tp.toMap}, at {(tp.toX, tp.toY)}"
+                f"[{map_id}] {map_name} {(tp.x, tp.y)} missing teleport map: {tp.toMap}, at {(tp.toX, tp.toY)}"
             )
 
         tileset.tiles.sort(key=lambda t: t.id)
-        tileset.write_xml()
+        with span("maps: write tileset"):
+            tileset.write_xml()
 
         def _sorter(obj: TiledObject) -> int | float:
             noxid = obj.properties.get("tileMapId")
@@ -198,7 +280,49 @@ class MapGenerator(BaseGenerator):
 
         map_objects.objects.sort(key=_sorter)
 
-        new_world.write_xml(self.tiled_dir / "world.tmx")
+        with span("maps: write world"):
+            new_world.write_xml(self.tiled_dir / "world.tmx")
+
+        with span("maps: write viewer metadata"):
+            write_viewer_metadata(
+                self.tiled_dir / "world.tmx",
+                self.out("js/metadata.json"),
+                viewer_formats(self.encoder.profiles),
+                self.light_files,
+                self.placeholders,
+            )
+
+    def iter_connections(
+        self, tile_map: Map
+    ) -> Generator[
+        tuple[
+            Teleport,
+            tuple[int, int],
+            tuple[int, int],
+            list[tuple[int, int]],
+            list[tuple[int, int]],
+        ]
+    ]:
+        """Yield (teleport, src_pos, dest_pos, src_tiles, dest_tiles) per connection.
+
+        In "telepads" mode adjacent teleport tiles with the same destination
+        and requirements become one connection at the island's center,
+        in "tiles" mode every teleport tile is its own connection.
+        """
+        if self.options.teleport_mode == "tiles":
+            for tp in tile_map.teleports:
+                src, dest = (tp.x, tp.y), (tp.toX, tp.toY)
+                yield tp, src, dest, [src], [dest]
+            return
+
+        for pad in self.group_teleport_islands(tile_map.teleports):
+            yield (
+                pad["teleport"],
+                pad["src_center"],
+                pad["dest_center"],
+                pad["src_positions"],
+                pad["dest_positions"],
+            )
 
     @staticmethod
     def to_tiled_image_position(
@@ -236,63 +360,294 @@ class MapGenerator(BaseGenerator):
 
         return pixel_x, pixel_y
 
+    def encode_workers(self) -> int:
+        """Encode threads of the map pipeline.
+
+        Memory budget and report numbers assume one map at a time, so with
+        either of them maps are encoded in order unless asked otherwise.
+        """
+        if self.options.workers is not None:
+            return self.options.workers
+        if self.options.memory_budget is not None or self.memory_report is not None:
+            return 0
+        return min(4, os.cpu_count() or 1)
+
+    def previous_renders(self) -> dict[str, tuple[tuple[int, int], Paddings]]:
+        """Image size and paddings per map id, from the last build's tileset"""
+        renders = {}
+        tileset = parse_world(self.tiled_dir / "world.tmx").tilesets[0]
+        for tile in tileset.tiles:
+            if "noxious_id" in tile.properties and "paddings" in tile.properties:
+                renders[tile.properties["noxious_id"].value] = (
+                    (tile.width, tile.height),
+                    Paddings.parse(tile.properties["paddings"].value),
+                )
+        return renders
+
+    def remove_map_files(self, map_folder: Path, filename: str):
+        """Delete the images of one map written by an earlier build"""
+        suffixes = {
+            profile.suffix
+            for profiles in self.encoder.profiles.values()
+            for profile in profiles
+        }
+        for folder in [folder for folder, _ in self.variants] + ["lights"]:
+            for suffix in suffixes:
+                (map_folder / folder / filename).with_suffix(suffix).unlink(
+                    missing_ok=True
+                )
+
     def generate_map_images(
-        self, tile_maps: list[Map]
-    ) -> Generator[tuple[Map, Image.Image, Paddings, Path]]:
+        self, tile_maps: Iterable[Map], count: int | None = None
+    ) -> Generator[tuple[Map, tuple[int, int], Paddings, Path]]:
+        """Render every map and yield its image size while it is being encoded.
+
+        All files are written once the generator is exhausted. With ``only``
+        set, other maps keep their images and size from the last build.
+        """
         map_folder = self.out_dir / "maps"
-        if map_folder.exists():
-            shutil.rmtree(map_folder)
+        previous = {}
+        if self.only is None:
+            if map_folder.exists():
+                shutil.rmtree(map_folder)
+        else:
+            previous = self.previous_renders()
         map_folder.mkdir(parents=True, exist_ok=True)
 
-        for tile_map in progress(tile_maps):
-            # if tile_map.id not in ("xf07cohu0dqymrh", "a2f5vu1iw2okj2o"):
-            #     continue
-
-            # if i >= 5:
-            #     print("")
-            #     print("TEMPORARY BREAK")
-            #     break
-
-            map_im = self.generate_base_map(tile_map)
-            obj_im, paddings = self.generate_map_objects(tile_map)
-
-            extended_map = Image.new("RGBA", obj_im.size, (0, 0, 0, 0))
-            extended_map.alpha_composite(map_im, (paddings.left, paddings.top))
-            extended_map.alpha_composite(obj_im)
-
-            name = normalize_name(tile_map.id)
-            filename = f"{name}.webp"
-
-            folders: list[tuple[str, int | tuple[float, float]]] = [
-                ("default", 1),
-                ("low", 2),
-                ("small", 3),
-                ("tiny", 4),
-                ("micro", 5),
-                ("fixed", (256, 256)),
-            ]
-            for folder, resize in folders:
-                filepath = map_folder / folder / filename
-                filepath.parent.mkdir(parents=True, exist_ok=True)
-                if filepath.exists():
-                    raise FileExistsError(str(filepath))
-
-                if resize == 1:
-                    extended_map.save(filepath, quality=75)
-                elif isinstance(resize, tuple):
-                    tmp_map = extended_map.copy()
-                    tmp_map.thumbnail(resize, Image.Resampling.BICUBIC)
-                    tmp_map.save(filepath, quality=75)
-                else:
-                    w, h = extended_map.size
-                    tmp_map = extended_map.resize(
-                        (max(1, w // resize), max(1, h // resize)),
-                        Image.Resampling.BICUBIC,
+        self.pipeline = Pipeline(self.encode_workers())
+        with self.pipeline as pipeline:
+            for tile_map in progress(tile_maps, max=count, status=pipeline.status):
+                name = normalize_name(tile_map.id)
+                filename = f"{name}{self.encoder.primary('full').suffix}"
+                default_filepath = map_folder / "default" / filename
+
+                if self.only is not None:
+                    # the placeholder comes from it, an interrupted build may
+                    # have left the map without it
+                    micro = map_folder / self.placeholder_variant / filename
+                    if (
+                        tile_map.id not in self.only
+                        and tile_map.id in previous
+                        and default_filepath.exists()
+                        and micro.exists()
+                    ):
+                        size, paddings = previous[tile_map.id]
+                        if (map_folder / "lights" / filename).exists():
+                            self.light_files[tile_map.id] = filename
+                        with Image.open(micro) as im:
+                            self.placeholders[tile_map.id] = self.make_placeholder(im)
+                        yield tile_map, size, paddings, default_filepath
+                        continue
+                    self.remove_map_files(map_folder, filename)
+
+                # if tile_map.id not in ("xf07cohu0dqymrh", "a2f5vu1iw2okj2o"):
+                #     continue
+
+                # if i >= 5:
+                #     print("")
+                #     print("TEMPORARY BREAK")
+                #     break
+
+                record = None
+                if self.memory_report is not None:
+                    record = MapMemoryRecord(
+                        id=tile_map.id,
+                        name=tile_map.name,
+                        tiles=len(tile_map.mapTiles),
+                        objects=len(tile_map.mapObjects),
+                    )
+                    self.memory_report.begin(record)
+
+                with pipeline.rendering(), span("render map", map=tile_map.name):
+                    extended_map, paddings = self.render_map(tile_map, record)
+                    self.save_variants(
+                        extended_map, map_folder, filename, pipeline, tile_map.id
                     )
-                    tmp_map.save(filepath, quality=75)
+                    if self.options.lights:
+                        self.save_lights(
+                            tile_map,
+                            extended_map.size,
+                            paddings,
+                            map_folder,
+                            filename,
+                            pipeline,
+                        )
+
+                if record is not None:
+                    self.memory_report.end(record)
 
-            default_filepath = map_folder / "default" / filename
-            yield tile_map, extended_map, paddings, default_filepath
+                yield tile_map, extended_map.size, paddings, default_filepath
+
+    def save_variants(
+        self,
+        extended_map: Image.Image,
+        map_folder: Path,
+        filename: str,
+        pipeline: Pipeline | None = None,
+        map_id: str | None = None,
+    ):
+        """Encode the rendered map once per resolution folder and profile.
+
+        Runs in order unless a pipeline is given. With ``map_id`` the
+        placeholder of the map is made from its micro variant.
+        """
+        if pipeline is None:
+            pipeline = Pipeline(0)
+        for folder, resize in self.variants:
+            if resize == 1:
+                output_class = "full"
+            elif isinstance(resize, tuple):
+                output_class = "thumbnail"
+            else:
+                output_class = "ladder"
+
+            filepath = map_folder / folder / filename
+            filepath.parent.mkdir(parents=True, exist_ok=True)
+            for profile in self.encoder.profiles[output_class]:
+                if filepath.with_suffix(profile.suffix).exists():
+                    raise FileExistsError(str(filepath.with_suffix(profile.suffix)))
+
+            pipeline.submit(
+                partial(
+                    self.encode_variant,
+                    extended_map,
+                    folder,
+                    resize,
+                    output_class,
+                    filepath,
+                    map_id if folder == self.placeholder_variant else None,
+                )
+            )
+
+    def encode_variant(
+        self,
+        extended_map: Image.Image,
+        folder: str,
+        resize: int | tuple[float, float],
+        output_class: str,
+        filepath: Path,
+        placeholder_for: str | None = None,
+    ) -> list[tuple[Path, bytes]]:
+        """Downscale for the variant and encode, runs on the encode threads"""
+        with span("encode variant", variant=folder):
+            if resize == 1:
+                return self.encoder.encode(extended_map, output_class, filepath)
+            if isinstance(resize, tuple):
+                tmp_map = extended_map.copy()
+                tmp_map.thumbnail(resize, Image.Resampling.BICUBIC)
+            else:
+                w, h = extended_map.size
+                tmp_map = extended_map.resize(
+                    (max(1, w // resize), max(1, h // resize)),
+                    Image.Resampling.BICUBIC,
+                )
+            if placeholder_for is not None:
+                self.placeholders[placeholder_for] = self.make_placeholder(tmp_map)
+            return self.encoder.encode(tmp_map, output_class, filepath)
+
+    def make_placeholder(self, image: Image.Image) -> str:
+        """A few dozen pixels of ``image`` as a WebP data URL"""
+        small = image.copy()
+        small.thumbnail(
+            (self.placeholder_size, self.placeholder_size), Image.Resampling.BOX
+        )
+        buffer = io.BytesIO()
+        small.save(buffer, format="WEBP", quality=50, method=6)
+        return f"data:image/webp;base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+    def save_lights(
+        self,
+        tile_map: Map,
+        size: tuple[int, int],
+        paddings: Paddings,
+        map_folder: Path,
+        filename: str,
+        pipeline: Pipeline,
+    ):
+        """Render the light overlay of a map, if it has lights, and queue it"""
+        with span("render lights", lights=len(tile_map.lights)):
+            overlay = render_lights(tile_map, size, paddings, self.get_tile_center)
+        if overlay is None:
+            return
+        filepath = map_folder / "lights" / filename
+        filepath.parent.mkdir(parents=True, exist_ok=True)
+        pipeline.submit(partial(self.encoder.encode, overlay, "ladder", filepath))
+        self.light_files[tile_map.id] = filename
+
+    def render_map(
+        self, tile_map: Map, record: MapMemoryRecord | None = None
+    ) -> tuple[Image.Image, Paddings]:
+        """Composite ground tiles and map objects into one padded image"""
+        with span("map objects"):
+            objects_to_draw, paddings = self.layout_map_objects(tile_map)
+        canvas_size = self.get_canvas_size(tile_map, paddings)
+        strategy, estimate = self.choose_render_strategy(tile_map, canvas_size)
+
+        if record is not None:
+            record.canvas_size = canvas_size
+            record.base_size = self.get_base_map_size(tile_map)
+            record.objects = len(objects_to_draw)
+            record.strategy = strategy
+            record.estimated_bytes = estimate
+
+        if strategy == "layered":
+            with span("base map"):
+                map_im = self.generate_base_map(tile_map)
+            obj_im = Image.new("RGBA", canvas_size, (0, 0, 0, 0))
+            self.draw_map_objects(obj_im, objects_to_draw, paddings)
+
+            with span("compose"):
+                extended_map = Image.new("RGBA", canvas_size, (0, 0, 0, 0))
+                extended_map.alpha_composite(map_im, (paddings.left, paddings.top))
+                extended_map.alpha_composite(obj_im)
+        else:
+            # draw everything straight onto the final canvas, which saves
+            # the separate ground and object layers
+            extended_map = Image.new("RGBA", canvas_size, (0, 0, 0, 0))
+            with span("base map"):
+                self.generate_base_map(
+                    tile_map, extended_map, (paddings.left, paddings.top)
+                )
+            self.draw_map_objects(extended_map, objects_to_draw, paddings)
+
+        return extended_map, paddings
+
+    def estimate_render_memory(
+        self, tile_map: Map, canvas_size: tuple[int, int], strategy: str
+    ) -> int:
+        """Rough upper bound of the image memory needed to render and encode a map"""
+        canvas_bytes = canvas_size[0] * canvas_size[1] * 4
+        base_width, base_height = self.get_base_map_size(tile_map)
+        # the half size "low" variant is the largest temporary while encoding
+        encode_bytes = canvas_bytes // 4
+        if strategy == "layered":
+            return base_width * base_height * 4 + 2 * canvas_bytes + encode_bytes
+        return canvas_bytes + encode_bytes
+
+    def choose_render_strategy(
+        self, tile_map: Map, canvas_size: tuple[int, int]
+    ) -> tuple[str, int]:
+        """Pick "layered" or the leaner "single-canvas" rendering for the budget"""
+        layered = self.estimate_render_memory(tile_map, canvas_size, "layered")
+        budget = self.options.memory_budget
+        if budget is None:
+            return "layered", layered
+
+        in_use = current_rss() or 0
+        if in_use + layered <= budget:
+            return "layered", layered
+
+        single = self.estimate_render_memory(tile_map, canvas_size, "single-canvas")
+        if in_use + single <= budget:
+            return "single-canvas", single
+
+        width, height = canvas_size
+        raise MemoryBudgetExceeded(
+            f"Map {tile_map.id} ({tile_map.name!r}) needs about {pretty_size(single)}"
+            f" for its {width}x{height} canvas, but only"
+            f" {pretty_size(max(0, budget - in_use))} of the"
+            f" {pretty_size(budget)} memory budget are left"
+        )
 
     @staticmethod
     def group_adjacent(
@@ -335,35 +690,39 @@ class MapGenerator(BaseGenerator):
         cx, cy = sx / n, sy / n
         return min(points, key=lambda p: (p[0] - cx) ** 2 + (p[1] - cy) ** 2)
 
-    def group_teleport_islands(self, teleports: list[Teleport]) -> list[Telepad]:
-        # AI generated
-        """Super-simple version. Returns list of dicts, one per logical portal group."""
+    @classmethod
+    def group_teleport_islands(cls, teleports: list[Teleport]) -> list[Telepad]:
+        """One group per island of adjacent teleport tiles that lead to an
+        island of adjacent tiles on the same map, with the same requirements.
+        """
         if not teleports:
             return []
 
-        from collections import defaultdict
-
-        by_map: dict[str, list[Teleport]] = defaultdict(list)
+        by_key: dict[tuple, list[Teleport]] = {}
         for tp in teleports:
-            by_map[tp.toMap].append(tp)
+            key = (tp.toMap, tp.itemRequired, tp.levelRequired, tp.denyMessage)
+            by_key.setdefault(key, []).append(tp)
 
         result: list[Telepad] = []
-        for dmap, tps in by_map.items():
+        for tps in by_key.values():
             mapping = {(tp.x, tp.y): (tp.toX, tp.toY) for tp in tps}
-            dest_groups = self.group_adjacent(mapping.values())
+            by_src = {(tp.x, tp.y): tp for tp in tps}
+            dest_groups = cls.group_adjacent(mapping.values())
 
-            for dg in dest_groups:
+            for dg in sorted(dest_groups):
                 dset = set(dg)
                 src_pts = [s for s, d in mapping.items() if d in dset]
-                for sg in self.group_adjacent(src_pts):
-                    dg_this = list({mapping[s] for s in sg})  # unique dests
+                for sg in sorted(cls.group_adjacent(src_pts)):
+                    sg = sorted(sg)
+                    dg_this = sorted({mapping[s] for s in sg})  # unique dests
                     result.append(
                         {
                             "src_positions": sg,
-                            "src_center": self._get_center(sg),
-                            "dest_map": dmap,
+                            "src_center": cls._get_center(sg),
+                            "dest_map": tps[0].toMap,
                             "dest_positions": dg_this,
-                            "dest_center": self._get_center(dg_this),
+                            "dest_center": cls._get_center(dg_this),
+                            "teleport": by_src[sg[0]],
                         }
                     )
         return result
@@ -375,48 +734,105 @@ class MapGenerator(BaseGenerator):
         size = (width + height) * 32, (width + height) * 16
         return size
 
-    def generate_base_map(self, tile_map: Map) -> Image.Image:
-        tiles_texture_dir = self.bundle_dir / "textures" / "mapTiles"
-        size = self.get_base_map_size(tile_map)
-        map_im = Image.new("RGBA", size, (0, 0, 0, 0))
+    def generate_base_map(
+        self,
+        tile_map: Map,
+        canvas: Image.Image | None = None,
+        offset: tuple[int, int] = (0, 0),
+    ) -> Image.Image:
+        """Draw the ground tiles, onto ``canvas`` at ``offset`` if given"""
+        if canvas is None:
+            size = self.get_base_map_size(tile_map)
+            map_im = Image.new("RGBA", size, (0, 0, 0, 0))
+        else:
+            map_im = canvas
+        offset_x, offset_y = offset
         rows = tile_map.height
 
-        tile_images = {}
-
         for tile in tile_map.mapTiles:
-            stem = tile.type
-            if stem not in tile_images:
-                tiles_texture_filename = tiles_texture_dir / f"{stem}.png"
-                if not tiles_texture_filename.exists():
-                    raise ValueError(f"missing tile texture: {tiles_texture_filename}")
-
-                im = Image.open(tiles_texture_filename)
-                im = im.convert("RGBA")
-                tile_images[stem] = im
-
+            im, (shift_x, shift_y) = self.tile_texture(tile.type, tile.rotation)
             grid_x = tile.x
             grid_y = tile.y
-            pos_x = (grid_x - grid_y) * 32 - 32 + (rows * 32)
-            pos_y = (grid_x + grid_y) * 16
-            map_im.alpha_composite(tile_images[stem], (pos_x, pos_y))
+            pos_x = (grid_x - grid_y) * 32 - 32 + (rows * 32) + offset_x + shift_x
+            pos_y = (grid_x + grid_y) * 16 + offset_y + shift_y
+            map_im.alpha_composite(im, (pos_x, pos_y))
 
         return map_im
 
+    def tile_texture(
+        self, stem: str, rotation: int = 0
+    ) -> tuple[Image.Image, tuple[int, int]]:
+        """Ground texture turned clockwise by ``rotation`` degrees around its
+        center, and the offset to draw it at instead of the unrotated one"""
+        rotation %= 360
+        key = (stem, rotation)
+        cached = self.tile_textures.get(key)
+        if cached is not None:
+            return cached
+
+        if rotation == 0:
+            filename = self.bundle_dir / "textures" / "mapTiles" / f"{stem}.png"
+            if not filename.exists():
+                raise ValueError(f"missing tile texture: {filename}")
+            with Image.open(filename) as im:
+                cached = im.convert("RGBA"), (0, 0)
+        else:
+            im, _ = self.tile_texture(stem)
+            if rotation in QUARTER_TURNS:
+                # exact, no resampling
+                rotated = im.transpose(QUARTER_TURNS[rotation])
+            else:
+                rotated = im.rotate(
+                    -rotation, Image.Resampling.BICUBIC, expand=True
+                )
+            # keep the center where it was
+            cached = rotated, (
+                (im.width - rotated.width) // 2,
+                (im.height - rotated.height) // 2,
+            )
+        self.tile_textures[key] = cached
+        return cached
+
     def generate_map_objects(self, tile_map: Map) -> tuple[Image.Image, Paddings]:
+        objects_to_draw, paddings = self.layout_map_objects(tile_map)
+        obj_map_im = Image.new(
+            "RGBA", self.get_canvas_size(tile_map, paddings), (0, 0, 0, 0)
+        )
+        self.draw_map_objects(obj_map_im, objects_to_draw, paddings)
+        return obj_map_im, paddings
+
+    def get_canvas_size(self, tile_map: Map, paddings: Paddings) -> tuple[int, int]:
+        base_width, base_height = self.get_base_map_size(tile_map)
+        canvas_width = base_width + paddings.left + paddings.right
+        canvas_height = base_height + paddings.top + paddings.bottom
+        return canvas_width, canvas_height
+
+    @staticmethod
+    def draw_map_objects(
+        canvas: Image.Image, objects_to_draw: list[SortParam], paddings: Paddings
+    ):
+        with span("composite objects"):
+            for obj in objects_to_draw:
+                x, y = obj["pos"]
+                canvas.alpha_composite(obj["im"], (paddings.left + x, paddings.top + y))
+
+    def layout_map_objects(self, tile_map: Map) -> tuple[list[SortParam], Paddings]:
+        """Position and depth sort all objects of a map, without drawing them"""
         obj_texture_dir = self.bundle_dir / "textures" / "mapObjects"
         rows = tile_map.height
         base_width, base_height = self.get_base_map_size(tile_map)
 
         obj_images = {}
 
-        map_objects_list = self.load("data/mapObjects.json")
-        map_objects: dict[str, MapObject] = {}
-        for map_object in map_objects_list:
-            map_objects[map_object["id"]] = MapObject.model_validate(
-                map_object, extra="forbid"
-            )
+        with span("load object definitions"):
+            map_objects_list = self.load("data/mapObjects.json")
+            map_objects: dict[str, MapObject] = {}
+            for map_object in map_objects_list:
+                map_objects[map_object["id"]] = MapObject.model_validate(
+                    map_object, extra="forbid"
+                )
 
-        objects_to_draw = []
+        objects_to_draw: list[SortParam] = []
 
         ranges = ObjectMapRanges(
             min_x=0,
@@ -496,7 +912,8 @@ class MapGenerator(BaseGenerator):
                 }
             )
 
-        objects_to_draw.sort(key=cmp_to_key(compare_depth_sort))
+        with span("depth sort", objects=len(objects_to_draw)):
+            objects_to_draw.sort(key=cmp_to_key(compare_depth_sort))
 
         paddings = Paddings(
             left=max(0, -ranges.min_x),
@@ -504,13 +921,4 @@ class MapGenerator(BaseGenerator):
             right=max(0, ranges.max_x - base_width),
             bottom=max(0, ranges.max_y - base_height),
         )
-
-        canvas_width = base_width + paddings.left + paddings.right
-        canvas_height = base_height + paddings.top + paddings.bottom
-        obj_map_im = Image.new("RGBA", (canvas_width, canvas_height), (0, 0, 0, 0))
-
-        for obj in objects_to_draw:
-            x, y = obj["pos"]
-            obj_map_im.alpha_composite(obj["im"], (paddings.left + x, paddings.top + y))
-
-        return obj_map_im, paddings
+        return objects_to_draw, paddings
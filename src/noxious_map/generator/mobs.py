@@ -1,29 +1,49 @@
 import shutil
 import json
+from dataclasses import dataclass
 from pathlib import Path
 
 from PIL import Image
 
-from noxious_map.models.map import Map, Monster
+from noxious_map.models.map import Monster
+from noxious_map.trace import span
+from noxious_map.encoding import Encoder
 from noxious_map.utils import progress, slugify
 from .base import BaseGenerator
 
 
+@dataclass(frozen=True)
+class SpawnMap:
+    """What the mob page shows of a map with spawns"""
+
+    id: str
+    name: str
+
+
 class MobGenerator(BaseGenerator):
-    def prepare_mob_spawns(self) -> dict[str, dict[str, tuple[Map, list[Monster]]]]:
-        tile_maps = [Map.model_validate(tm) for tm in self.load("data/maps.json")]
-
-        monster_spawns: dict[str, dict[str, tuple[Map, list[Monster]]]] = {}
-        for tile_map in tile_maps:
-            for monster in tile_map.monsters:
-                monster_spawns.setdefault(monster.monster, {})
-                _, lst = monster_spawns[monster.monster].setdefault(
-                    tile_map.id, (tile_map, [])
-                )
-                lst.append(monster)
+    encoder: Encoder
+
+    def setup(self):
+        self.encoder = Encoder(self.options.encoding)
+
+    def prepare_mob_spawns(
+        self,
+    ) -> dict[str, dict[str, tuple[SpawnMap, list[Monster]]]]:
+        """monster id -> map id -> (map, spawns), one map in memory at a time"""
+        monster_spawns: dict[str, dict[str, tuple[SpawnMap, list[Monster]]]] = {}
+        with span("mobs: collect spawns"):
+            for tile_map in self.iter_maps():
+                spawn_map = SpawnMap(id=tile_map.id, name=tile_map.name)
+                for monster in tile_map.monsters:
+                    monster_spawns.setdefault(monster.monster, {})
+                    _, lst = monster_spawns[monster.monster].setdefault(
+                        tile_map.id, (spawn_map, [])
+                    )
+                    lst.append(monster)
         return monster_spawns
 
     def generate(self):
+        self.encoder.reset()
         max_monster_sprite_width = 0
         max_drop_icon_width = 0
 
@@ -56,7 +76,9 @@ class MobGenerator(BaseGenerator):
 
         print("Generating monster drop table...")
         for monster in progress(monsters):
-            sprite = dict(path="sprites/default.png", width=64, height=64)
+            sprite = dict(
+                path="sprites/default.png", sources=[], width=64, height=64
+            )
 
             base_anchor = slugify(monster["name"])
             if not base_anchor:
@@ -86,8 +108,8 @@ class MobGenerator(BaseGenerator):
                 out_monster = (out_sprites_dir / monster_sprite.name).with_suffix(
                     ".webp"
                 )
-                im.save(out_monster, quality=80)
-                sprite["path"] = f"sprites/{out_monster.name}"
+                with span("mobs: encode sprite"):
+                    sprite.update(self.save_sprite(im, out_monster))
                 sprite["width"] = im.width
                 sprite["height"] = im.height
                 max_monster_sprite_width = max(max_monster_sprite_width, im.width)
@@ -125,9 +147,10 @@ class MobGenerator(BaseGenerator):
                         out_drop_sprite = (
                             out_sprites_dir / drop_sprite.name
                         ).with_suffix(".webp")
-                        im.save(out_drop_sprite, quality=80)
+                        with span("mobs: encode sprite"):
+                            saved = self.save_sprite(im, out_drop_sprite)
                         drop["sprite"] = {
-                            "path": f"sprites/{out_drop_sprite.name}",
+                            **saved,
                             "width": im.width,
                             "height": im.height,
                         }
@@ -175,12 +198,35 @@ class MobGenerator(BaseGenerator):
         mtime = (self.templates_root / "mobs.html").stat().st_mtime
         mtime = max(mtime, Path(__file__).stat().st_mtime)
 
-        html = self.render_template(
-            "mobs.html",
-            monsters=monsters,
-            ts=int(mtime),
-            max_monster_sprite_width=max_monster_sprite_width,
-            max_drop_icon_width=max_drop_icon_width,
-        )
+        with span("mobs: render template"):
+            html = self.render_template(
+                "mobs.html",
+                monsters=monsters,
+                ts=int(mtime),
+                max_monster_sprite_width=max_monster_sprite_width,
+                max_drop_icon_width=max_drop_icon_width,
+                stamped=self.stamped,
+                full_suffix=self.encoder.primary("full").suffix,
+                thumbnail_suffix=self.encoder.primary("thumbnail").suffix,
+                thumbnail_sources=[
+                    (p.suffix, p.mime_type)
+                    for p in self.encoder.profiles["thumbnail"][1:]
+                ],
+            )
         with self.out("mobs.html").open("w", encoding="utf-8", newline="\n") as f:
             f.write(html)
+
+        print("Sprite encoding:")
+        print(self.encoder.report())
+
+    def save_sprite(self, im: Image.Image, path: Path) -> dict:
+        """Encode a sprite, returns its ``path`` and alternative ``sources``"""
+        paths = self.encoder.save(im, "sprite", path)
+        profiles = self.encoder.profiles["sprite"]
+        return {
+            "path": self.stamped(f"sprites/{paths[0].name}"),
+            "sources": [
+                {"path": self.stamped(f"sprites/{p.name}"), "type": profile.mime_type}
+                for p, profile in zip(paths[1:], profiles[1:])
+            ],
+        }
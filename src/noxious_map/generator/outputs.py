@@ -0,0 +1,20 @@
+from noxious_map.export import HASH_CACHE, OUTPUT_MANIFEST, OutputManifest
+from noxious_map.trace import span
+from noxious_map.utils import pretty_size
+from .base import BaseGenerator
+
+
+class OutputsGenerator(BaseGenerator):
+    """Writes ``output-manifest.json`` next to ``html/``, for deployments.
+
+    Size and hash of every output file, ``noxious-map export --since``
+    compares it with the manifest of the last deployment. Runs last, after
+    the precompressed siblings are written.
+    """
+
+    def generate(self):
+        print("Writing output manifest...")
+        with span("outputs: hash files"):
+            manifest = OutputManifest.scan(self.out_dir, self.root / HASH_CACHE)
+        manifest.write(self.root / OUTPUT_MANIFEST)
+        print(f"  {len(manifest.files)} files, {pretty_size(manifest.size)}")
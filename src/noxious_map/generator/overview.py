@@ -0,0 +1,105 @@
+import json
+import math
+
+from PIL import Image
+
+from noxious_map.encoding import Encoder
+from noxious_map.trace import span
+from noxious_map.utils import progress
+from .base import BaseGenerator
+
+
+class OverviewGenerator(BaseGenerator):
+    """Composites all maps into one world image per low zoom level.
+
+    Maps are placed at their ``metadata.json`` bounds, which use the same
+    projection as the per-map overlays, and drawn in the same order. The
+    result is added to ``metadata.json`` as ``overview``, the viewer shows
+    it instead of the per-map overlays at ``max_zoom`` and below.
+    """
+
+    # zoom level -> image, each one is used down to the next
+    zooms = [-6, -8]
+    max_zoom = -6
+    # variant folder the mosaic is scaled down from
+    source_folder = "tiny"
+
+    encoder: Encoder
+
+    def setup(self):
+        self.encoder = Encoder(self.options.encoding)
+
+    def generate(self):
+        print("Generating world overview...")
+        metadata_file = self.out("js/metadata.json")
+        metadata = json.loads(metadata_file.read_text(encoding="utf-8"))
+        if not metadata["maps"]:
+            print("  no maps, skipping")
+            return
+
+        # screen pixel extent of all maps, lat/lng is [-y, x]
+        left = min(entry["bounds"][0][1] for entry in metadata["maps"])
+        right = max(entry["bounds"][1][1] for entry in metadata["maps"])
+        top = min(-entry["bounds"][1][0] for entry in metadata["maps"])
+        bottom = max(-entry["bounds"][0][0] for entry in metadata["maps"])
+
+        scale = 2.0 ** max(self.zooms)
+        size = (
+            max(1, math.ceil((right - left) * scale)),
+            max(1, math.ceil((bottom - top) * scale)),
+        )
+        canvas = Image.new("RGBA", size, (0, 0, 0, 0))
+
+        suffix = self.encoder.primary("ladder").suffix
+        with span("overview: composite", size=f"{size[0]}x{size[1]}"):
+            for entry in progress(metadata["maps"]):
+                source = self.out(f"maps/{self.source_folder}/{entry['file']}")
+                source = source.with_suffix(suffix)
+                if not source.exists():
+                    print(f"  missing {source}")
+                    continue
+
+                (lat_bottom, lng_left), (lat_top, lng_right) = entry["bounds"]
+                x0 = round((lng_left - left) * scale)
+                y0 = round((-lat_top - top) * scale)
+                x1 = round((lng_right - left) * scale)
+                y1 = round((-lat_bottom - top) * scale)
+                if x1 <= x0 or y1 <= y0:
+                    continue
+
+                with Image.open(source) as im:
+                    im = im.convert("RGBA").resize(
+                        (x1 - x0, y1 - y0), Image.Resampling.BICUBIC
+                    )
+                canvas.alpha_composite(im, (x0, y0))
+
+        out_dir = self.out("maps/overview")
+        out_dir.mkdir(parents=True, exist_ok=True)
+        levels = []
+        image = canvas
+        for zoom in sorted(self.zooms, reverse=True):
+            factor = 2.0 ** (zoom - max(self.zooms))
+            if factor != 1:
+                image = canvas.resize(
+                    (
+                        max(1, round(canvas.width * factor)),
+                        max(1, round(canvas.height * factor)),
+                    ),
+                    Image.Resampling.BICUBIC,
+                )
+            filename = f"world{zoom}.webp"
+            with span("overview: encode", zoom=zoom):
+                self.encoder.save(image, "ladder", out_dir / filename)
+            levels.append([zoom, filename])
+            print(f"  zoom {zoom}: {image.width}x{image.height}")
+
+        # the canvas is rounded up to whole pixels, so are the bounds
+        right = left + canvas.width / scale
+        bottom = top + canvas.height / scale
+        metadata["overview"] = {
+            "bounds": [[-bottom, left], [-top, right]],
+            "maxZoom": self.max_zoom,
+            "levels": levels,
+        }
+        with metadata_file.open("w", encoding="utf-8", newline="\n") as f:
+            json.dump(metadata, f, separators=(",", ":"), ensure_ascii=False)
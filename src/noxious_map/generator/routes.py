@@ -0,0 +1,138 @@
+from dataclasses import dataclass
+from collections import deque
+import base64
+import json
+
+from noxious_map.models.map import Teleport
+from noxious_map.trace import span
+from .base import BaseGenerator
+
+UNREACHABLE_8 = 0xFF
+UNREACHABLE_16 = 0xFFFF
+
+
+@dataclass(frozen=True)
+class RequirementClass:
+    """Which teleports a player can use"""
+
+    items: bool
+    # highest levelRequired the player meets, None for no limit
+    max_level: int | None
+
+    @property
+    def name(self) -> str:
+        name = "items" if self.items else "no-items"
+        if self.max_level is not None:
+            name += f",level<={self.max_level}"
+        return name
+
+    def allows(self, tp: Teleport) -> bool:
+        if tp.itemRequired is not None and not self.items:
+            return False
+        if self.max_level is not None and tp.levelRequired > self.max_level:
+            return False
+        return True
+
+
+def next_hop_table(adjacency: list[list[int]]) -> list[list[int]]:
+    """All-pairs next hops (fewest teleports) via one BFS per source.
+
+    ``table[src][dst]`` is the first map to go to from ``src`` on a shortest
+    route to ``dst``, ``src`` itself for ``src == dst`` and -1 if unreachable.
+    """
+    count = len(adjacency)
+    table = []
+    for src in range(count):
+        first_hop = [-1] * count
+        first_hop[src] = src
+        queue = deque()
+        for neighbour in adjacency[src]:
+            if first_hop[neighbour] == -1:
+                first_hop[neighbour] = neighbour
+                queue.append(neighbour)
+        while queue:
+            node = queue.popleft()
+            for neighbour in adjacency[node]:
+                if first_hop[neighbour] == -1:
+                    first_hop[neighbour] = first_hop[node]
+                    queue.append(neighbour)
+        table.append(first_hop)
+    return table
+
+
+def pack_table(table: list[list[int]]) -> tuple[int, str]:
+    """Flatten to row-major uint8 (or little endian uint16) and base64 encode"""
+    count = len(table)
+    if count < UNREACHABLE_8:
+        width, unreachable = 1, UNREACHABLE_8
+    else:
+        width, unreachable = 2, UNREACHABLE_16
+    data = bytearray()
+    for row in table:
+        for hop in row:
+            data += (unreachable if hop == -1 else hop).to_bytes(width, "little")
+    return width, base64.b64encode(bytes(data)).decode("ascii")
+
+
+class RouteGenerator(BaseGenerator):
+    """Writes ``js/routes.json`` with next-hop tables between all maps.
+
+    One table per requirement class (with/without required items, times
+    every distinct ``levelRequired`` cap). Classes that end up with the same
+    usable teleports share a table.
+    """
+
+    def generate(self):
+        print("Generating teleport routes...")
+        map_ids = [entry.id for entry in self.store]
+        index = {map_id: i for i, map_id in enumerate(map_ids)}
+
+        # one map shard at a time, only the teleports are kept
+        teleports: list[tuple[int, int, Teleport]] = []
+        for i, map_id in enumerate(map_ids):
+            for tp_raw in self.store.load_raw(map_id).get("teleports", []):
+                tp = Teleport.model_validate(tp_raw)
+                if tp.toMap in index and index[tp.toMap] != i:
+                    teleports.append((i, index[tp.toMap], tp))
+
+        # a player meets every levelRequired up to the largest cap <= their
+        # level, 0 covers players below the lowest requirement
+        levels = {tp.levelRequired for _, _, tp in teleports}
+        caps: list[int | None] = [None]
+        if any(level > 0 for level in levels):
+            caps.extend(sorted(levels | {0}))
+
+        tables: list[dict] = []
+        table_by_edges: dict[frozenset, int] = {}
+        classes = []
+        with span("routes: next hop tables", maps=len(map_ids)):
+            for items in (True, False):
+                for max_level in caps:
+                    req = RequirementClass(items=items, max_level=max_level)
+                    edges = frozenset(
+                        (src, dst) for src, dst, tp in teleports if req.allows(tp)
+                    )
+                    if edges not in table_by_edges:
+                        adjacency: list[list[int]] = [[] for _ in map_ids]
+                        for src, dst in sorted(edges):
+                            adjacency[src].append(dst)
+                        width, packed = pack_table(next_hop_table(adjacency))
+                        table_by_edges[edges] = len(tables)
+                        tables.append({"width": width, "next": packed})
+                    classes.append(
+                        {
+                            "name": req.name,
+                            "items": items,
+                            "maxLevel": max_level,
+                            "table": table_by_edges[edges],
+                        }
+                    )
+
+        routes = {
+            "maps": map_ids,
+            "classes": classes,
+            "tables": tables,
+        }
+        with self.out("js/routes.json").open("w", encoding="utf-8", newline="\n") as f:
+            json.dump(routes, f, separators=(",", ":"))
+        print(f"  {len(classes)} requirement classes, {len(tables)} distinct tables")
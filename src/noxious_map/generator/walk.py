@@ -0,0 +1,60 @@
+from noxious_map.models import Map
+from noxious_map.trace import span
+from noxious_map.utils import normalize_name, pretty_size, progress
+from noxious_map.walk import (
+    SOURCE_SPAWN,
+    SOURCE_TELEPORT,
+    WalkFile,
+    WalkGrid,
+    WalkSource,
+)
+from .base import BaseGenerator
+from .maps import MapGenerator
+
+
+class WalkGenerator(BaseGenerator):
+    """Writes ``js/walk/<map>.bin``: walkable tiles and walking distances.
+
+    One distance field per teleport island (grouped like the telepad
+    connections, whatever ``--teleport-mode`` is) and per spawn position, see
+    ``noxious_map.walk`` for the file layout.
+    """
+
+    def sources(self, tile_map: Map) -> list[WalkSource]:
+        sources = []
+        for telepad in MapGenerator.group_teleport_islands(tile_map.teleports):
+            x, y = telepad["src_center"]
+            sources.append(
+                WalkSource(SOURCE_TELEPORT, x, y, list(telepad["src_positions"]))
+            )
+        for x, y in sorted({(m.x, m.y) for m in tile_map.monsters}):
+            sources.append(WalkSource(SOURCE_SPAWN, x, y, [(x, y)]))
+        return sources
+
+    def generate(self):
+        print("Generating walking distances...")
+        out_dir = self.out("js/walk")
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+        total = 0
+        written = set()
+        count = len(self.store)
+        for tile_map in progress(self.iter_maps(forbid_extra=True), max=count):
+            with span("walk: distance fields", map=tile_map.id):
+                grid = WalkGrid.from_map(tile_map)
+                sources = self.sources(tile_map)
+                fields = [grid.distances(source.tiles) for source in sources]
+
+            path = out_dir / f"{normalize_name(tile_map.id)}.bin"
+            WalkFile(grid, sources, fields).write(path)
+            written.add(path.name)
+            total += path.stat().st_size
+
+        # maps that no longer exist, with precompressed siblings of their files
+        for path in out_dir.iterdir():
+            name = path.name
+            if path.suffix in (".gz", ".br", ".zst"):
+                name = path.stem
+            if path.is_file() and name not in written:
+                path.unlink()
+        print(f"  {count} maps, {pretty_size(total)}")
@@ -0,0 +1,113 @@
+"""Monster spawn density, per map and monster.
+
+Every spawn is splatted as a disc kernel of its ``wanderRadius`` onto a
+low resolution grid in tile space, weighted with its ``amount``. The sum
+is then projected once onto an isometric screen space grid of ``cell``
+pixels per cell, which lines up with the base map image. Both steps are
+whole-image operations in Pillow (``ImageMath``, affine ``transform``), so
+the per-spawn cost is one small image addition.
+
+Values are expected monsters per tile.
+"""
+
+from functools import lru_cache
+import base64
+
+from PIL import Image, ImageMath, ImageStat
+
+from noxious_map.models.map import Map, Monster
+
+# grid cells per tile in tile space, more gives rounder kernels
+SUBDIVISIONS = 2
+# wander radius (tiles) of spawns without one; "" means the whole map
+DEFAULT_RADIUS = 1
+
+
+@lru_cache(maxsize=128)
+def spawn_kernel(radius: float) -> Image.Image:
+    """Mode "F" disc of ``radius`` tiles that sums to 1"""
+    size = max(1, round(2 * radius * SUBDIVISIONS) + 1)
+    # radial_gradient is 0 at the center and 255 at 128 px, more outside
+    distance = Image.radial_gradient("L").resize(
+        (size, size), Image.Resampling.BILINEAR
+    )
+    kernel = distance.point([255 - v for v in range(255)] + [0])
+    total = ImageStat.Stat(kernel).sum[0] or 1.0
+    return kernel.convert("F").point(lambda v: v / total)
+
+
+def spawn_radius(tile_map: Map, monster: Monster) -> float:
+    if monster.wanderRadius == "":
+        return max(tile_map.width, tile_map.height)
+    if not monster.wanderRadius:
+        return DEFAULT_RADIUS
+    return float(monster.wanderRadius)
+
+
+def splat_spawns(tile_map: Map, spawns: list[Monster]) -> Image.Image:
+    """Mode "F" tile space density of ``SUBDIVISIONS`` cells per tile"""
+    width = tile_map.width * SUBDIVISIONS
+    height = tile_map.height * SUBDIVISIONS
+    grid = Image.new("F", (width, height), 0.0)
+    for spawn in spawns:
+        kernel = spawn_kernel(spawn_radius(tile_map, spawn))
+        # density per tile, the kernel spreads over SUBDIVISIONS² cells each
+        weight = spawn.amount * SUBDIVISIONS * SUBDIVISIONS
+        cx = round((spawn.x + 0.5) * SUBDIVISIONS)
+        cy = round((spawn.y + 0.5) * SUBDIVISIONS)
+        left = cx - kernel.width // 2
+        top = cy - kernel.height // 2
+        box = (
+            max(0, left),
+            max(0, top),
+            min(width, left + kernel.width),
+            min(height, top + kernel.height),
+        )
+        if box[0] >= box[2] or box[1] >= box[3]:
+            continue
+        part = kernel.crop((box[0] - left, box[1] - top, box[2] - left, box[3] - top))
+        region = grid.crop(box)
+        grid.paste(
+            ImageMath.lambda_eval(
+                lambda args: args["a"] + args["b"] * weight, a=region, b=part
+            ),
+            box[:2],
+        )
+    return grid
+
+
+def project_to_screen(tile_map: Map, grid: Image.Image, cell: int) -> Image.Image:
+    """Resample a tile space grid onto screen cells over the base map image.
+
+    Screen ``(sx, sy)`` of tile coordinates ``(u, v)`` is
+    ``((u - v) * 32 + rows * 32, (u + v) * 16)``, see
+    ``MapGenerator.generate_base_map``.
+    """
+    rows = tile_map.height
+    size = (
+        max(1, (tile_map.width + rows) * 32 // cell),
+        max(1, (tile_map.width + rows) * 16 // cell),
+    )
+    s = SUBDIVISIONS * cell
+    # output cell (x, y) -> grid position, the inverse of the projection
+    data = (s / 64, s / 32, -SUBDIVISIONS * rows / 2,
+            -s / 64, s / 32, SUBDIVISIONS * rows / 2)  # fmt: skip
+    return grid.transform(
+        size, Image.Transform.AFFINE, data, Image.Resampling.BILINEAR
+    )
+
+
+def quantize(layer: Image.Image) -> dict | None:
+    """uint8 crop of the non-zero part, ``scale`` is the value of 255"""
+    _, largest = layer.getextrema()
+    if largest <= 0:
+        return None
+    quantized = layer.point(lambda v: v * (255 / largest)).convert("L")
+    box = quantized.getbbox()
+    if box is None:
+        return None
+    return {
+        "scale": round(largest, 4),
+        "box": list(box),
+        "data": base64.b64encode(quantized.crop(box).tobytes()).decode("ascii"),
+    }
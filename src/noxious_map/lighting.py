@@ -0,0 +1,109 @@
+"""Light overlay for a map, from ``Map.lights``.
+
+Every light is a radial falloff mask, tinted with the light's color and
+added onto one accumulation image. Only the light's bounding box is
+touched, so the cost grows with the lit area, not with the number of
+lights times the canvas size. All per-pixel work happens in Pillow (lookup
+tables, ``ImageChops``), so no array library is needed.
+
+Positions are tile coordinates, radii screen pixels of the full resolution
+map. The overlay is rendered at ``1 / scale`` of the map size; it is smooth
+enough to be stretched over the map by the viewer.
+"""
+
+from functools import lru_cache
+from typing import Callable
+import math
+
+from PIL import Image, ImageChops, ImageColor
+
+from noxious_map.models import Map
+from noxious_map.types import Paddings
+
+# falloff name -> brightness for the relative distance 0 (center) .. 1 (edge)
+FALLOFFS: dict[str, Callable[[float], float]] = {
+    "linear": lambda d: 1 - d,
+    "quadratic": lambda d: (1 - d) ** 2,
+    "smooth": lambda d: 1 - d * d * (3 - 2 * d),
+    "constant": lambda d: 1.0,
+}
+
+
+def parse_color(value: str) -> tuple[int, int, int]:
+    """``#rrggbb``, ``0xrrggbb`` or any CSS color Pillow knows, white if invalid"""
+    value = value.strip()
+    if value.lower().startswith("0x"):
+        value = "#" + value[2:]
+    elif value and all(c in "0123456789abcdefABCDEF" for c in value):
+        value = "#" + value
+    try:
+        return ImageColor.getrgb(value)[:3]
+    except ValueError:
+        return 255, 255, 255
+
+
+@lru_cache(maxsize=256)
+def falloff_mask(radius: int, falloff: str) -> Image.Image:
+    """Grayscale disc of ``2 * radius`` pixels, 255 at the center"""
+    curve = FALLOFFS.get(falloff, FALLOFFS["linear"])
+    # radial_gradient is 0 at the center and 255 at 128 px, more outside
+    distance = Image.radial_gradient("L").resize(
+        (2 * radius, 2 * radius), Image.Resampling.BILINEAR
+    )
+    lut = [round(255 * curve(v / 255)) if v < 255 else 0 for v in range(256)]
+    return distance.point(lut)
+
+
+def render_lights(
+    tile_map: Map,
+    size: tuple[int, int],
+    paddings: Paddings,
+    tile_center: Callable[[float, float, Map, Paddings], tuple[float, float]],
+    *,
+    scale: int = 4,
+) -> Image.Image | None:
+    """RGBA light overlay for a rendered map of ``size``, None without lights"""
+    if not tile_map.lights:
+        return None
+
+    width = max(1, math.ceil(size[0] / scale))
+    height = max(1, math.ceil(size[1] / scale))
+    accumulated = Image.new("RGB", (width, height), (0, 0, 0))
+
+    for light in tile_map.lights:
+        radius = max(1, round(light.radius / scale))
+        strength = max(0.0, min(light.intensity / 100, 1.0))
+        if strength == 0:
+            continue
+
+        cx, cy = tile_center(light.x, light.y, tile_map, paddings)
+        left = round(cx / scale) - radius
+        top = round(cy / scale) - radius
+        box = (
+            max(0, left),
+            max(0, top),
+            min(width, left + 2 * radius),
+            min(height, top + 2 * radius),
+        )
+        if box[0] >= box[2] or box[1] >= box[3]:
+            continue
+
+        mask = falloff_mask(radius, light.falloff)
+        mask = mask.crop((box[0] - left, box[1] - top, box[2] - left, box[3] - top))
+        # color * falloff * intensity, per channel via lookup tables
+        color = parse_color(light.color)
+        channels = [
+            mask.point([round(v * c / 255 * strength) for v in range(256)])
+            for c in color
+        ]
+        tinted = Image.merge("RGB", channels)
+        region = accumulated.crop(box)
+        accumulated.paste(ImageChops.add(region, tinted), box[:2])
+
+    # brightest channel as alpha, so unlit parts stay transparent
+    alpha = ImageChops.lighter(
+        ImageChops.lighter(*accumulated.split()[:2]), accumulated.getchannel("B")
+    )
+    overlay = accumulated.convert("RGBA")
+    overlay.putalpha(alpha)
+    return overlay
@@ -0,0 +1,139 @@
+"""Process memory probes and the per-map memory report.
+
+``peak_rss`` of a map is the highest resident set size sampled while it
+was rendered, so the report shows which map needed the memory.
+``tracemalloc_*`` only counts Python allocations: Pillow allocates image
+buffers outside of them, so these understate the image memory of a map.
+"""
+
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+import threading
+import tracemalloc
+import json
+import os
+
+# seconds between resident set size samples while a map renders
+SAMPLE_INTERVAL = 0.01
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class MemoryBudgetExceeded(MemoryError):
+    pass
+
+
+def current_rss() -> int | None:
+    """Resident set size right now, in bytes (Linux only)"""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            pages = int(f.read().split()[1])
+    except OSError:
+        return None
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+def peak_rss() -> int | None:
+    """High-water mark of the resident set size, in bytes"""
+    if resource is None:
+        return None
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RssSampler:
+    """Highest ``current_rss`` seen between ``start`` and ``stop``"""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.peak: int | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def sample(self):
+        rss = current_rss()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+
+    def start(self):
+        self.sample()
+        if self.peak is None:
+            # no /proc, nothing to sample
+            return
+        self._thread = threading.Thread(
+            target=self._run, name="rss-sampler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> int | None:
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.sample()
+        return self.peak
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+@dataclass
+class MapMemoryRecord:
+    id: str
+    name: str
+    tiles: int
+    objects: int
+    canvas_size: tuple[int, int] = (0, 0)
+    base_size: tuple[int, int] = (0, 0)
+    strategy: str = ""
+    estimated_bytes: int = 0
+    rss_before: int | None = None
+    rss_after: int | None = None
+    # highest resident set size while this map was rendered
+    peak_rss: int | None = None
+    # Python allocations only, without Pillow's image buffers
+    tracemalloc_delta: int | None = None
+    tracemalloc_peak: int | None = None
+
+
+@dataclass
+class MemoryReport:
+    budget: int | None = None
+    maps: list[MapMemoryRecord] = field(default_factory=list)
+    _sampler: RssSampler | None = field(default=None, repr=False)
+    _maxrss_before: int | None = field(default=None, repr=False)
+
+    def begin(self, record: MapMemoryRecord):
+        record.rss_before = current_rss()
+        self._maxrss_before = peak_rss()
+        self._sampler = RssSampler()
+        self._sampler.start()
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+            record.tracemalloc_delta = tracemalloc.get_traced_memory()[0]
+
+    def end(self, record: MapMemoryRecord):
+        record.rss_after = current_rss()
+        record.peak_rss = self._sampler.stop() if self._sampler is not None else None
+        self._sampler = None
+        if record.peak_rss is None:
+            # without samples, the process high-water mark only belongs to
+            # this map if it rose while the map was rendered
+            maxrss = peak_rss()
+            if maxrss is not None and self._maxrss_before is not None:
+                if maxrss > self._maxrss_before:
+                    record.peak_rss = maxrss
+        if tracemalloc.is_tracing() and record.tracemalloc_delta is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            record.tracemalloc_peak = peak - record.tracemalloc_delta
+            record.tracemalloc_delta = current - record.tracemalloc_delta
+        self.maps.append(record)
+
+    def write_json(self, path: Path):
+        data = {"budget": self.budget, "maps": [asdict(r) for r in self.maps]}
+        with path.open("w", encoding="utf-8", newline="\n") as f:
+            json.dump(data, f, indent=2)
@@ -0,0 +1,181 @@
+"""Render, encode and write stages of the map build, run concurrently.
+
+The caller's thread renders and submits encode jobs. A pool of encode
+threads runs them (Pillow releases the GIL while resizing and encoding)
+and hands the encoded files to one writer thread. Both queues are bounded,
+so a stage that runs ahead blocks instead of piling up images in memory,
+and a build takes about as long as its slowest stage instead of the sum.
+
+With no encode workers everything runs in the caller's thread, in order.
+"""
+
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from queue import Queue
+from typing import Callable, Iterator, Self
+import threading
+import time
+
+# an encode job returns the files to write
+EncodeJob = Callable[[], list[tuple[Path, bytes]]]
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int = 1
+    items: int = 0
+    # seconds spent working, summed over the workers
+    busy: float = 0.0
+
+    def utilization(self, wall: float) -> float:
+        if wall <= 0:
+            return 0.0
+        return min(1.0, self.busy / (wall * self.workers))
+
+
+class Pipeline:
+    def __init__(self, encode_workers: int, queue_size: int | None = None):
+        self.encode_workers = encode_workers
+        if queue_size is None:
+            queue_size = 2 * encode_workers
+        self.render = StageStats("render")
+        self.encode = StageStats("encode", workers=max(1, encode_workers))
+        self.write = StageStats("write")
+        # seconds the render stage waited for room in the encode queue
+        self.blocked = 0.0
+        # seconds spent in submit(), not counted as rendering
+        self._submitting = 0.0
+        self._encode_queue: Queue[EncodeJob | None] = Queue(maxsize=queue_size)
+        self._write_queue: Queue[tuple[Path, bytes] | None] = Queue(
+            maxsize=4 * queue_size
+        )
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+        self._writer: threading.Thread | None = None
+        self._error: BaseException | None = None
+        self._start = 0.0
+        self._end: float | None = None
+
+    def __enter__(self) -> Self:
+        self._start = time.perf_counter()
+        if self.encode_workers:
+            for i in range(self.encode_workers):
+                thread = threading.Thread(
+                    target=self._run_encoder, name=f"encode-{i}", daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+            self._writer = threading.Thread(
+                target=self._run_writer, name="write", daemon=True
+            )
+            self._writer.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        if exc is None and self._error is not None:
+            raise self._error
+
+    @property
+    def wall(self) -> float:
+        end = self._end if self._end is not None else time.perf_counter()
+        return end - self._start
+
+    @contextmanager
+    def rendering(self) -> Iterator[None]:
+        """Count the time of the block, except submitting, towards the render stage"""
+        start = time.perf_counter()
+        submitting = self._submitting
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.render.busy += elapsed - (self._submitting - submitting)
+            self.render.items += 1
+
+    def submit(self, job: EncodeJob):
+        """Queue an encode job, blocks while the encode queue is full"""
+        if self._error is not None:
+            raise self._error
+        start = time.perf_counter()
+        if self.encode_workers:
+            self._encode_queue.put(job)
+            self.blocked += time.perf_counter() - start
+        else:
+            self._write_all(self._encode(job))
+        self._submitting += time.perf_counter() - start
+
+    def close(self):
+        """Wait until every submitted file is written"""
+        if self._end is not None:
+            return
+        for _ in self._threads:
+            self._encode_queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._writer is not None:
+            self._write_queue.put(None)
+            self._writer.join()
+        self._end = time.perf_counter()
+
+    def status(self) -> str:
+        """Utilization of every stage so far, for the progress bar"""
+        wall = self.wall
+        return " ".join(
+            f"{stage.name} {stage.utilization(wall) * 100:.0f}%"
+            for stage in (self.render, self.encode, self.write)
+        )
+
+    def report(self) -> str:
+        wall = self.wall
+        lines = [f"  {'stage':<8} {'workers':>7} {'items':>7} {'busy':>9} {'used':>6}"]
+        for stage in (self.render, self.encode, self.write):
+            lines.append(
+                f"  {stage.name:<8} {stage.workers:>7} {stage.items:>7}"
+                f" {stage.busy:>8.2f}s {stage.utilization(wall) * 100:>5.0f}%"
+            )
+        lines.append(f"  wall {wall:.2f}s, render waited {self.blocked:.2f}s for encoders")
+        return "\n".join(lines)
+
+    def _encode(self, job: EncodeJob) -> list[tuple[Path, bytes]]:
+        start = time.perf_counter()
+        files = job()
+        with self._lock:
+            self.encode.busy += time.perf_counter() - start
+            self.encode.items += 1
+        return files
+
+    def _write_all(self, files: list[tuple[Path, bytes]]):
+        for path, data in files:
+            start = time.perf_counter()
+            path.write_bytes(data)
+            self.write.busy += time.perf_counter() - start
+            self.write.items += 1
+
+    def _fail(self, error: BaseException):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+
+    def _run_encoder(self):
+        while (job := self._encode_queue.get()) is not None:
+            # after an error the remaining jobs are only drained, so that
+            # submit() does not block forever
+            if self._error is not None:
+                continue
+            try:
+                for file in self._encode(job):
+                    self._write_queue.put(file)
+            except BaseException as e:
+                self._fail(e)
+
+    def _run_writer(self):
+        while (file := self._write_queue.get()) is not None:
+            if self._error is not None:
+                continue
+            try:
+                self._write_all([file])
+            except BaseException as e:
+                self._fail(e)
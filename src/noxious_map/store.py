@@ -0,0 +1,131 @@
+"""Per-map shards of ``data/maps.json``.
+
+``bundle/store/`` holds one compact JSON file per map and ``index.json``
+with the id, name, size, shard file, byte size and content hash of every
+map, in ``maps.json`` order. Loading one map reads the index and that
+map's shard instead of parsing the whole bundle.
+
+The store is brought up to date whenever ``maps.json`` changed (size or
+mtime). ``maps.json`` is read one map at a time, and shards whose content
+hash did not change are not written again.
+"""
+
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator, Self
+import hashlib
+import json
+
+from noxious_map.models import Map
+from noxious_map.trace import span
+from noxious_map.utils import STAMP_LENGTH, iter_json_array, normalize_name
+
+STORE_DIR = "store"
+INDEX_FILE = "index.json"
+
+
+@dataclass
+class StoreEntry:
+    id: str
+    name: str
+    width: int
+    height: int
+    # shard file name inside the store
+    file: str
+    # bytes of the shard
+    size: int
+    hash: str
+
+
+class MapStore:
+    def __init__(self, root: Path):
+        self.root = root
+        index = json.loads((root / INDEX_FILE).read_text(encoding="utf-8"))
+        self.source = index["source"]
+        self.entries = {
+            entry["id"]: StoreEntry(**entry) for entry in index["maps"]
+        }
+
+    @classmethod
+    def open(cls, bundle_dir: Path) -> Self:
+        """Store of a bundle, updated first if ``data/maps.json`` changed"""
+        root = bundle_dir / STORE_DIR
+        maps_json = bundle_dir / "data" / "maps.json"
+        try:
+            store = cls(root)
+        except (OSError, ValueError, KeyError, TypeError):
+            return cls.update(maps_json, root)
+        if store.source != _source_key(maps_json):
+            return cls.update(maps_json, root)
+        return store
+
+    @classmethod
+    def update(cls, maps_json: Path, root: Path) -> Self:
+        """Write the shards of ``maps_json`` into ``root``, only changed ones"""
+        root.mkdir(parents=True, exist_ok=True)
+        old: dict[str, str] = {}
+        try:
+            for entry in json.loads((root / INDEX_FILE).read_text(encoding="utf-8"))["maps"]:
+                old[entry["file"]] = entry["hash"]
+        except (OSError, ValueError, KeyError):
+            pass
+
+        source = _source_key(maps_json)
+        entries = []
+        written = 0
+        with span("store: write shards"):
+            for raw in iter_json_array(maps_json):
+                data = json.dumps(
+                    raw, separators=(",", ":"), ensure_ascii=False
+                ).encode("utf-8")
+                digest = hashlib.md5(data).hexdigest()[:STAMP_LENGTH]
+                filename = f"{normalize_name(raw['id'])}.json"
+                path = root / filename
+                if old.get(filename) != digest or not path.exists():
+                    path.write_bytes(data)
+                    written += 1
+                entries.append(
+                    StoreEntry(
+                        id=raw["id"],
+                        name=raw["name"],
+                        width=raw["width"],
+                        height=raw["height"],
+                        file=filename,
+                        size=len(data),
+                        hash=digest,
+                    )
+                )
+
+        current = {entry.file for entry in entries}
+        for path in root.glob("*.json"):
+            if path.name != INDEX_FILE and path.name not in current:
+                path.unlink()
+
+        index = {"source": source, "maps": [asdict(entry) for entry in entries]}
+        with (root / INDEX_FILE).open("w", encoding="utf-8", newline="\n") as f:
+            json.dump(index, f, separators=(",", ":"), ensure_ascii=False)
+        print(f"  map store: {written} of {len(entries)} maps changed")
+        return cls(root)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, map_id: str) -> bool:
+        return map_id in self.entries
+
+    def __iter__(self) -> Iterator[StoreEntry]:
+        return iter(self.entries.values())
+
+    def load_raw(self, map_id: str) -> dict:
+        """The map as it is in ``maps.json``, KeyError for unknown ids"""
+        entry = self.entries[map_id]
+        with (self.root / entry.file).open("r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def load(self, map_id: str) -> Map:
+        return Map.model_validate(self.load_raw(map_id))
+
+
+def _source_key(maps_json: Path) -> list[int]:
+    stat = maps_json.stat()
+    return [stat.st_size, stat.st_mtime_ns]
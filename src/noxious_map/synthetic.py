@@ -0,0 +1,211 @@
+"""Deterministic fake bundle for offline benchmarking.
+
+Produces the same directory layout ``download_data`` leaves behind
+(``bundle/data/*.json`` plus textures) and an empty Tiled world, so the
+generators can run against it without touching server.noxious.gg.
+"""
+
+from dataclasses import dataclass
+from random import Random
+from pathlib import Path
+import json
+
+from PIL import Image, ImageDraw
+
+
+@dataclass
+class SyntheticConfig:
+    maps: int = 10
+    map_width: int = 40
+    map_height: int = 40
+    # map objects per tile
+    object_density: float = 0.05
+    teleports_per_map: int = 4
+    monsters_per_map: int = 6
+    tile_types: int = 8
+    object_types: int = 24
+    monster_types: int = 30
+    item_types: int = 40
+    seed: int = 123
+
+
+EMPTY_TILESET = """<?xml version="1.0" encoding="UTF-8"?>
+<tileset version="1.10" tiledversion="1.11.2" name="maps" tilewidth="1" tileheight="1" tilecount="0" columns="0">
+ <grid orientation="orthogonal" width="1" height="1"/>
+</tileset>
+"""
+
+EMPTY_WORLD = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.10" tiledversion="1.11.2" orientation="isometric" renderorder="right-down" width="64" height="20" tilewidth="64" tileheight="32" infinite="1" nextlayerid="3" nextobjectid="1">
+ <tileset firstgid="1" source="maps.tsx"/>
+ <objectgroup draworder="index" id="1" name="Maps"/>
+ <objectgroup id="2" name="Connections"/>
+</map>
+"""
+
+
+def _color(rng: Random, alpha: int = 255) -> tuple[int, int, int, int]:
+    return rng.randrange(256), rng.randrange(256), rng.randrange(256), alpha
+
+
+def _write_json(path: Path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8", newline="\n") as f:
+        json.dump(data, f, indent=2)
+
+
+def _tile_texture(rng: Random) -> Image.Image:
+    im = Image.new("RGBA", (64, 32), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(im)
+    draw.polygon([(32, 0), (63, 16), (32, 31), (0, 16)], fill=_color(rng))
+    return im
+
+
+def _object_texture(rng: Random, width: int, height: int) -> Image.Image:
+    im = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(im)
+    draw.rectangle((width // 4, 0, width - width // 4, height - 1), fill=_color(rng))
+    draw.ellipse((0, height // 2, width - 1, height - 1), fill=_color(rng, 200))
+    return im
+
+
+def generate_bundle(root: Path, config: SyntheticConfig | None = None) -> Path:
+    """Write a synthetic bundle and Tiled skeleton below ``root``"""
+    config = config or SyntheticConfig()
+    rng = Random(config.seed)
+
+    bundle_dir = root / "bundle"
+    data_dir = bundle_dir / "data"
+    textures_dir = bundle_dir / "textures"
+    tiled_dir = root / "html" / "js" / "tiled"
+    tiled_dir.mkdir(parents=True, exist_ok=True)
+    (tiled_dir / "maps.tsx").write_text(EMPTY_TILESET, encoding="utf-8")
+    (tiled_dir / "world.tmx").write_text(EMPTY_WORLD, encoding="utf-8")
+
+    tile_types = [f"tile{i:03d}" for i in range(config.tile_types)]
+    (textures_dir / "mapTiles").mkdir(parents=True, exist_ok=True)
+    for tile_type in tile_types:
+        _tile_texture(rng).save(textures_dir / "mapTiles" / f"{tile_type}.png")
+
+    map_objects = []
+    (textures_dir / "mapObjects").mkdir(parents=True, exist_ok=True)
+    for i in range(config.object_types):
+        obj_id = f"obj{i:03d}"
+        width, height = rng.randrange(32, 257, 16), rng.randrange(32, 321, 16)
+        _object_texture(rng, width, height).save(
+            textures_dir / "mapObjects" / f"{obj_id}.png"
+        )
+        depth_points = []
+        if rng.random() < 0.3:
+            depth_points = [
+                {"x": 0.0, "y": float(height)},
+                {"x": float(width), "y": float(height - 16)},
+            ]
+        map_objects.append(
+            {
+                "id": obj_id,
+                "name": f"Object {i}",
+                "originX": 0.5,
+                "originY": 1.0,
+                "image": f"{obj_id}.png",
+                "depthPoints": depth_points,
+            }
+        )
+    _write_json(data_dir / "mapObjects.json", map_objects)
+
+    items = []
+    (textures_dir / "itemIcons").mkdir(parents=True, exist_ok=True)
+    for i in range(config.item_types):
+        item_id = f"item{i:03d}"
+        _object_texture(rng, 32, 32).save(textures_dir / "itemIcons" / f"{item_id}.png")
+        items.append(
+            {
+                "id": item_id,
+                "name": f"Item {i}",
+                "stackable": rng.random() < 0.5,
+                "hideHair": False,
+                "disallow_trading": False,
+                "icon": item_id,
+            }
+        )
+    _write_json(data_dir / "items.json", items)
+
+    monsters = []
+    (textures_dir / "sprites").mkdir(parents=True, exist_ok=True)
+    for i in range(config.monster_types):
+        monster_id = f"mob{i:03d}"
+        _object_texture(rng, 64, 64).save(textures_dir / "sprites" / f"{monster_id}.png")
+        monsters.append(
+            {
+                "id": monster_id,
+                "name": f"Monster {i}",
+                "level": rng.randrange(1, 100),
+                "sprite": monster_id,
+                "hostility": "hostile",
+                "giveExp": rng.randrange(1, 500),
+                "maxHealth": rng.randrange(10, 5000),
+                "maxMana": rng.randrange(0, 500),
+                "drops": [
+                    {
+                        "item": rng.choice(items)["id"],
+                        "chance": rng.choice([100, 50, 10, 1, 0.1]),
+                        "amount": rng.randrange(1, 5),
+                    }
+                    for _ in range(rng.randrange(0, 6))
+                ],
+            }
+        )
+    _write_json(data_dir / "monsters.json", monsters)
+    _write_json(data_dir / "textures.json", [])
+
+    map_ids = [f"map{i:04d}" for i in range(config.maps)]
+    width, height = config.map_width, config.map_height
+    object_count = round(width * height * config.object_density)
+    maps = []
+    for map_id in map_ids:
+        maps.append(
+            {
+                "id": map_id,
+                "name": f"Synthetic {map_id}",
+                "width": width,
+                "height": height,
+                "mapTiles": [
+                    {"x": x, "y": y, "type": rng.choice(tile_types)}
+                    for y in range(height)
+                    for x in range(width)
+                ],
+                "mapObjects": [
+                    {
+                        "type": rng.choice(map_objects)["id"],
+                        "x": rng.randrange(width),
+                        "y": rng.randrange(height),
+                        "flipX": rng.random() < 0.5,
+                    }
+                    for _ in range(object_count)
+                ],
+                "teleports": [
+                    {
+                        "x": rng.randrange(width),
+                        "y": rng.randrange(height),
+                        "toMap": rng.choice(map_ids),
+                        "toX": rng.randrange(width),
+                        "toY": rng.randrange(height),
+                    }
+                    for _ in range(config.teleports_per_map)
+                ],
+                "monsters": [
+                    {
+                        "monster": rng.choice(monsters)["id"],
+                        "x": rng.randrange(width),
+                        "y": rng.randrange(height),
+                        "amount": rng.randrange(1, 6),
+                        "wanderRadius": rng.randrange(1, 10),
+                        "respawnTime": rng.randrange(10, 600) * 1000,
+                    }
+                    for _ in range(config.monsters_per_map)
+                ],
+            }
+        )
+    _write_json(data_dir / "maps.json", maps)
+
+    return root
@@ -5,6 +5,8 @@ from xml.dom import minidom
 from dataclasses import dataclass, field, fields
 import textwrap
 
+from .trace import span, traced
+
 NOXIOUS_NS = "https://noxious.gg/2026/tiled"
 ET.register_namespace("nox", NOXIOUS_NS)
 
@@ -74,10 +76,12 @@ class TiledWorld:
         return None
 
     def write_xml(self, path: Path):
-        root = self.to_xml(path)
-        raw_xml = ET.tostring(root, encoding="utf-8", xml_declaration=True)
-        reparsed = minidom.parseString(raw_xml)
-        raw_xml = reparsed.toprettyxml(indent=" ", encoding="UTF-8")
+        with span("tiled: build world xml"):
+            root = self.to_xml(path)
+            raw_xml = ET.tostring(root, encoding="utf-8", xml_declaration=True)
+        with span("tiled: pretty print"):
+            reparsed = minidom.parseString(raw_xml)
+            raw_xml = reparsed.toprettyxml(indent=" ", encoding="UTF-8")
         path.write_bytes(raw_xml)
 
     def to_xml(self, path: Path) -> ET.Element:
@@ -515,10 +519,12 @@ class Tileset:
         return root
 
     def write_xml(self):
-        root = self.to_xml()
-        raw_xml = ET.tostring(root, encoding="utf-8", xml_declaration=True)
-        reparsed = minidom.parseString(raw_xml)
-        raw_xml = reparsed.toprettyxml(indent=" ", encoding="UTF-8")
+        with span("tiled: build tileset xml"):
+            root = self.to_xml()
+            raw_xml = ET.tostring(root, encoding="utf-8", xml_declaration=True)
+        with span("tiled: pretty print"):
+            reparsed = minidom.parseString(raw_xml)
+            raw_xml = reparsed.toprettyxml(indent=" ", encoding="UTF-8")
         self.source.write_bytes(raw_xml)
 
     def calculate_tilesizes(self):
@@ -559,6 +565,7 @@ class Tileset:
         )
 
 
+@traced("tiled: parse world")
 def parse_world(file) -> TiledWorld:
     path = Path(file)
 
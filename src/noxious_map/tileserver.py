@@ -0,0 +1,447 @@
+"""On-demand map tile server.
+
+Renders map tiles lazily with the ``MapGenerator`` rendering functions
+instead of pre-rendering every map at every resolution::
+
+    python -m noxious_map.tileserver bundle.zip [--port 4355]
+
+``GET /maps.json`` lists the maps, ``GET /tiles/<map id>/<z>/<x>/<y>.webp``
+returns a 256x256 tile, where ``z`` is 0 for full resolution and every
+step below halves it (Leaflet's ``L.CRS.Simple`` zoom levels). Rendered
+maps, encoded tiles in memory and encoded tiles on disk are all kept in
+size limited LRU caches, and concurrent requests for the same map or tile
+share one render.
+
+The bundle may be a project folder with ``bundle/``, the extracted bundle
+itself or the ``bundle.zip``, which is extracted into ``.cache/`` once.
+"""
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import os
+import re
+import zipfile
+
+from PIL import Image
+
+from noxious_map.encoding import EncodingProfile
+from noxious_map.generator import MapGenerator
+from noxious_map.store import MapStore
+from noxious_map.trace import span
+from noxious_map.utils import content_stamp, pretty_size
+
+TILE_SIZE = 256
+KEEP_ALIVE_TIMEOUT = 15
+MAX_HEADER_BYTES = 64 * 1024
+
+TILE_RE = re.compile(r"^/tiles/(?P<map>[^/]+)/(?P<z>-?\d+)/(?P<x>\d+)/(?P<y>\d+)\.webp$")
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int):
+        super().__init__(REASONS.get(status, ""))
+        self.status = status
+
+
+def open_bundle(path: Path) -> Path:
+    """Bundle directory for a project folder, bundle folder or bundle zip"""
+    if path.is_file() and zipfile.is_zipfile(path):
+        target = path.parent / ".cache" / "tileserver" / content_stamp(path)
+        if not (target / "data" / "maps.json").exists():
+            print(f"Extracting {path} to {target} ...")
+            with zipfile.ZipFile(path, "r") as zf:
+                zf.extractall(target)
+        return target
+    if (path / "bundle" / "data" / "maps.json").exists():
+        return path / "bundle"
+    if (path / "data" / "maps.json").exists():
+        return path
+    raise FileNotFoundError(f"no bundle (data/maps.json) found in {path}")
+
+
+class LRUCache[K, V]:
+    """Least recently used entries are dropped beyond ``max_size``"""
+
+    def __init__(self, max_size: int, sizeof=lambda value: 1):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self._items: OrderedDict[K, V] = OrderedDict()
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key: K) -> V | None:
+        value = self._items.get(key)
+        if value is not None:
+            self._items.move_to_end(key)
+        return value
+
+    def put(self, key: K, value: V):
+        if key in self._items:
+            self.size -= self.sizeof(self._items.pop(key))
+        self._items[key] = value
+        self.size += self.sizeof(value)
+        while self.size > self.max_size and len(self._items) > 1:
+            _, old = self._items.popitem(last=False)
+            self.size -= self.sizeof(old)
+
+
+class DiskCache:
+    """Encoded tiles below ``root``, oldest files removed beyond ``max_bytes``"""
+
+    def __init__(self, root: Path, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        root.mkdir(parents=True, exist_ok=True)
+
+        # relative path -> size, least recently used first
+        self._index: OrderedDict[str, int] = OrderedDict()
+        self.size = 0
+        files = [(p.stat(), p) for p in root.rglob("*.webp")]
+        for stat, path in sorted(files, key=lambda item: item[0].st_mtime_ns):
+            self._index[path.relative_to(root).as_posix()] = stat.st_size
+            self.size += stat.st_size
+        self.evict()
+
+    def get(self, rel: str) -> bytes | None:
+        if rel not in self._index:
+            return None
+        path = self.root / rel
+        try:
+            data = path.read_bytes()
+        except OSError:
+            self.size -= self._index.pop(rel)
+            return None
+        self._index.move_to_end(rel)
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return data
+
+    def put(self, rel: str, data: bytes):
+        path = self.root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        tmp.replace(path)
+        if rel in self._index:
+            self.size -= self._index.pop(rel)
+        self._index[rel] = len(data)
+        self.size += len(data)
+        self.evict()
+
+    def evict(self):
+        while self.size > self.max_bytes and self._index:
+            rel, size = self._index.popitem(last=False)
+            self.size -= size
+            with contextlib.suppress(OSError):
+                (self.root / rel).unlink()
+
+
+class TileRenderer:
+    """Renders maps with ``MapGenerator`` and cuts and encodes tiles from them"""
+
+    def __init__(
+        self,
+        bundle_dir: Path,
+        *,
+        map_cache: int = 2,
+        memory_cache: int = 64 * 1024 * 1024,
+        disk_cache: DiskCache | None = None,
+        profile: EncodingProfile = EncodingProfile("webp", 75),
+        workers: int = 2,
+    ):
+        self.generator = MapGenerator(bundle_dir.parent)
+        self.generator.bundle_dir = bundle_dir
+        self.profile = profile
+
+        # maps are read from their shard when they are first rendered
+        with span("tileserver: open map store"):
+            self.store = MapStore.open(bundle_dir)
+
+        self.map_images: LRUCache[str, Image.Image] = LRUCache(map_cache)
+        self.tiles: LRUCache[tuple, bytes] = LRUCache(memory_cache, sizeof=len)
+        self.disk_cache = disk_cache
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+        # key -> future of the render in progress, shared by all requests
+        self._pending: dict[object, asyncio.Future] = {}
+        self.stats = {"memory": 0, "disk": 0, "render": 0, "shared": 0}
+
+    async def _coalesce(self, key, func, *args) -> tuple[object, bool]:
+        """Run ``func`` in the render threads once per key at a time.
+
+        Returns the result and whether this call started the work.
+        """
+        future = self._pending.get(key)
+        started = future is None
+        if started:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, func, *args)
+            self._pending[key] = future
+            future.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(future), started
+
+    def _render_map(self, map_id: str) -> Image.Image:
+        tile_map = self.store.load(map_id)
+        with span("render map", map=tile_map.name):
+            image, _ = self.generator.render_map(tile_map)
+        return image
+
+    async def map_image(self, map_id: str) -> Image.Image:
+        image = self.map_images.get(map_id)
+        if image is None:
+            image, _ = await self._coalesce(("map", map_id), self._render_map, map_id)
+            self.map_images.put(map_id, image)
+        return image
+
+    @staticmethod
+    def tile_box(
+        size: tuple[int, int], z: int, x: int, y: int
+    ) -> tuple[tuple[float, float, float, float], tuple[int, int]] | None:
+        """Source box and output size of a tile, None if outside the map"""
+        scale = 2.0**z
+        width, height = size
+        level_width = math.ceil(width * scale)
+        level_height = math.ceil(height * scale)
+        left, top = x * TILE_SIZE, y * TILE_SIZE
+        if left >= level_width or top >= level_height:
+            return None
+        right = min(left + TILE_SIZE, level_width)
+        bottom = min(top + TILE_SIZE, level_height)
+        box = (
+            left / scale,
+            top / scale,
+            min(right / scale, width),
+            min(bottom / scale, height),
+        )
+        return box, (right - left, bottom - top)
+
+    def _encode_tile(self, image: Image.Image, z: int, x: int, y: int) -> bytes | None:
+        placement = self.tile_box(image.size, z, x, y)
+        if placement is None:
+            return None
+        box, size = placement
+        with span("tileserver: cut tile"):
+            part = image.resize(size, Image.Resampling.BICUBIC, box=box)
+            tile = Image.new("RGBA", (TILE_SIZE, TILE_SIZE), (0, 0, 0, 0))
+            tile.paste(part, (0, 0))
+        out = io.BytesIO()
+        with span("tileserver: encode tile"):
+            tile.save(out, **self.profile.save_kwargs())
+        return out.getvalue()
+
+    async def tile(self, map_id: str, z: int, x: int, y: int) -> tuple[bytes, str]:
+        """Encoded tile and where it came from (memory, disk, render or shared)"""
+        if map_id not in self.store or z > 0:
+            raise HTTPError(404)
+        key = (map_id, z, x, y)
+        data = self.tiles.get(key)
+        if data is not None:
+            self.stats["memory"] += 1
+            return data, "memory"
+
+        rel = f"{map_id}/{z}/{x}_{y}.webp"
+        if self.disk_cache is not None:
+            data = self.disk_cache.get(rel)
+            if data is not None:
+                self.tiles.put(key, data)
+                self.stats["disk"] += 1
+                return data, "disk"
+
+        image = await self.map_image(map_id)
+        data, started = await self._coalesce(key, self._encode_tile, image, z, x, y)
+        if data is None:
+            raise HTTPError(404)
+        if not started:
+            self.stats["shared"] += 1
+            return data, "shared"
+        self.tiles.put(key, data)
+        if self.disk_cache is not None:
+            self.disk_cache.put(rel, data)
+        self.stats["render"] += 1
+        return data, "render"
+
+
+class TileServer:
+    def __init__(self, renderer: TileRenderer):
+        self.renderer = renderer
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(
+                        reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT
+                    )
+                except asyncio.LimitOverrunError:
+                    await self.send(writer, 431, b"", {}, keep_alive=False)
+                    break
+                except (TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+
+                lines = head.decode("latin-1").split("\r\n")
+                parts = lines[0].split(" ")
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                connection = headers.get("connection", "").lower()
+                if parts[-1] == "HTTP/1.1":
+                    keep_alive = connection != "close"
+                else:
+                    keep_alive = connection == "keep-alive"
+
+                try:
+                    if len(parts) != 3:
+                        raise HTTPError(400)
+                    status, body, extra = await self.respond(parts[0], parts[1])
+                except HTTPError as e:
+                    status, body, extra = e.status, f"{e}\n".encode(), {}
+                except Exception as e:
+                    print(f"Error handling {lines[0]!r}: {e!r}")
+                    status, body, extra = 500, b"500 Internal Server Error\n", {}
+
+                if parts[0] == "HEAD":
+                    extra["Content-Length"] = str(len(body))
+                    body = b""
+                await self.send(writer, status, body, extra, keep_alive=keep_alive)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def respond(self, method: str, target: str) -> tuple[int, bytes, dict]:
+        if method not in ("GET", "HEAD"):
+            raise HTTPError(405)
+        path = unquote(urlsplit(target).path)
+
+        if path == "/maps.json":
+            maps = [
+                {
+                    "id": entry.id,
+                    "name": entry.name,
+                    # only width and height are used
+                    "baseSize": self.renderer.generator.get_base_map_size(entry),
+                }
+                for entry in self.renderer.store
+            ]
+            body = json.dumps(maps, separators=(",", ":")).encode()
+            return 200, body, {"Content-Type": "application/json"}
+
+        if path == "/stats.json":
+            stats = {
+                **self.renderer.stats,
+                "memoryTiles": len(self.renderer.tiles),
+                "memoryBytes": self.renderer.tiles.size,
+                "renderedMaps": len(self.renderer.map_images),
+            }
+            if self.renderer.disk_cache is not None:
+                stats["diskBytes"] = self.renderer.disk_cache.size
+            body = json.dumps(stats, separators=(",", ":")).encode()
+            return 200, body, {"Content-Type": "application/json"}
+
+        match = TILE_RE.match(path)
+        if match is None:
+            raise HTTPError(404)
+        data, source = await self.renderer.tile(
+            match["map"], int(match["z"]), int(match["x"]), int(match["y"])
+        )
+        return 200, data, {
+            "Content-Type": "image/webp",
+            "Cache-Control": "public, max-age=3600",
+            "X-Tile-Cache": source,
+        }
+
+    @staticmethod
+    async def send(
+        writer: asyncio.StreamWriter,
+        status: int,
+        body: bytes,
+        headers: dict[str, str],
+        *,
+        keep_alive: bool,
+    ):
+        headers.setdefault("Content-Type", "text/plain; charset=utf-8")
+        headers.setdefault("Content-Length", str(len(body)))
+        headers["Date"] = formatdate(usegmt=True)
+        headers["Connection"] = "keep-alive" if keep_alive else "close"
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+async def serve(renderer: TileRenderer, bind: str, port: int):
+    server = TileServer(renderer)
+    aserver = await asyncio.start_server(
+        server.handle_connection, bind, port, backlog=1024, limit=MAX_HEADER_BYTES
+    )
+    print(f"Serving {len(renderer.store)} maps on http://{bind}:{port}/ ...")
+    async with aserver:
+        await aserver.serve_forever()
+
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(prog="python -m noxious_map.tileserver")
+    parser.add_argument("bundle", type=Path, help="project folder, bundle folder or bundle.zip")
+    parser.add_argument("--bind", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4355)
+    parser.add_argument("--workers", type=int, default=2, help="render threads")
+    parser.add_argument(
+        "--map-cache", type=int, default=2, metavar="N", help="rendered maps kept in memory"
+    )
+    parser.add_argument(
+        "--memory-cache", type=int, default=64, metavar="MIB", help="encoded tiles kept in memory"
+    )
+    parser.add_argument("--disk-cache", type=Path, metavar="DIR", help="keep encoded tiles on disk")
+    parser.add_argument("--disk-cache-size", type=int, default=512, metavar="MIB")
+    parser.add_argument("--quality", type=int, default=75, help="webp quality of the tiles")
+    args = parser.parse_args(argv)
+
+    bundle_dir = open_bundle(args.bundle)
+    disk_cache = None
+    if args.disk_cache is not None:
+        # tiles of another bundle version must not be served
+        stamp = content_stamp(bundle_dir / "data" / "maps.json")
+        disk_cache = DiskCache(args.disk_cache / stamp, args.disk_cache_size * 1024 * 1024)
+        print(f"Disk cache: {disk_cache.root} ({pretty_size(disk_cache.size)} used)")
+
+    renderer = TileRenderer(
+        bundle_dir,
+        map_cache=args.map_cache,
+        memory_cache=args.memory_cache * 1024 * 1024,
+        disk_cache=disk_cache,
+        profile=EncodingProfile("webp", args.quality),
+        workers=args.workers,
+    )
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve(renderer, args.bind, args.port))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+from typing import Callable
+from pathlib import Path
+from functools import wraps
+import threading
+import time
+import json
+import os
+
+
+class _NullSpan:
+    """Shared no-op span, handed out while tracing is disabled."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "args", "map", "start", "parent")
+
+    def __init__(self, tracer: Tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.map: str | None = args.get("map")
+        self.start = 0
+        self.parent: Span | None = None
+
+    def set(self, **args):
+        """Attach extra arguments to the span after it was opened"""
+        self.args.update(args)
+
+    def __enter__(self):
+        stack = self.tracer._stack()
+        if stack:
+            self.parent = stack[-1]
+            if self.map is None:
+                self.map = self.parent.map
+        stack.append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter_ns()
+        self.tracer._stack().pop()
+        self.tracer._record(self, end)
+        return False
+
+
+class Tracer:
+    """Collects nested timing spans and exports them as Chrome trace events.
+
+    While disabled, ``span()`` returns a shared no-op object, so instrumented
+    code only pays for a single attribute check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events: list[dict] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter_ns()
+
+    def enable(self):
+        self.enabled = True
+        self.events = []
+        self._origin = time.perf_counter_ns()
+
+    def _stack(self) -> list[Span]:
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = []
+            return self._local.stack
+
+    def span(self, name: str, **args) -> Span | _NullSpan:
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, args)
+
+    def _record(self, span: Span, end: int):
+        event = {
+            "name": span.name,
+            "ph": "X",
+            "ts": (span.start - self._origin) / 1000,
+            "dur": (end - span.start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": {k: str(v) for k, v in span.args.items()},
+            # only used for the summary, stripped on export
+            "_map": span.map,
+            "_top": span.parent is None or span.parent.map != span.map,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def write_chrome_trace(self, path: Path):
+        """Write the collected spans as Chrome trace-event JSON (Perfetto, chrome://tracing)"""
+        events = [
+            {k: v for k, v in event.items() if not k.startswith("_")}
+            for event in self.events
+        ]
+        with path.open("w", encoding="utf-8", newline="\n") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self) -> str:
+        stages: dict[str, list[float]] = {}
+        maps: dict[str, dict[str, float]] = {}
+        for event in self.events:
+            stages.setdefault(event["name"], []).append(event["dur"])
+            map_name = event["_map"]
+            if map_name is None:
+                continue
+            per_map = maps.setdefault(map_name, {})
+            if event["_top"]:
+                per_map[""] = per_map.get("", 0) + event["dur"]
+            else:
+                per_map[event["name"]] = per_map.get(event["name"], 0) + event["dur"]
+
+        lines = [
+            f"{'stage':<32} {'count':>7} {'total ms':>11} {'mean ms':>10} {'max ms':>10}"
+        ]
+        for name, durs in sorted(stages.items(), key=lambda e: -sum(e[1])):
+            total = sum(durs) / 1000
+            lines.append(
+                f"{name[:32]:<32} {len(durs):>7} {total:>11.1f}"
+                f" {total / len(durs):>10.2f} {max(durs) / 1000:>10.2f}"
+            )
+
+        if maps:
+            lines.append("")
+            lines.append(f"{'map':<32} {'total ms':>11}  slowest stage")
+            for map_name, per_map in sorted(maps.items(), key=lambda e: -e[1].get("", 0)):
+                total = per_map.pop("", 0) / 1000
+                slowest = ""
+                if per_map:
+                    stage, dur = max(per_map.items(), key=lambda e: e[1])
+                    slowest = f"{stage} ({dur / 1000:.1f} ms)"
+                lines.append(f"{map_name[:32]:<32} {total:>11.1f}  {slowest}")
+
+        return "\n".join(lines)
+
+
+tracer = Tracer()
+
+
+def span(name: str, **args) -> Span | _NullSpan:
+    """Time a block of code, e.g. ``with span("encode", variant="low"): ...``
+
+    A ``map`` argument labels the span (and all spans nested in it) for the
+    per-map summary.
+    """
+    if not tracer.enabled:
+        return _NULL_SPAN
+    return Span(tracer, name, args)
+
+
+def traced[**P, R](name: str | None = None) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator version of ``span()``, defaults to the function's qualified name"""
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with Span(tracer, span_name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
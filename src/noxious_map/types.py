@@ -1,4 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Self
+
+from .encoding import EncodingProfile, default_profiles
 
 
 @dataclass
@@ -25,3 +29,31 @@ class Paddings:
 
     def __str__(self):
         return ",".join(str(val) for val in self)
+
+    @classmethod
+    def parse(cls, value: str | None) -> Self:
+        """Inverse of ``str()``, missing values are 0"""
+        parts = [int(val) for val in (value or "0,0,0,0").split(",")]
+        top, right, bottom, left = (parts + [0, 0, 0, 0])[:4]
+        return cls(left=left, top=top, right=right, bottom=bottom)
+
+
+@dataclass
+class BuildOptions:
+    """Build settings handed from the command line to every generator"""
+
+    # write per-map memory usage to this JSON file
+    memory_report: Path | None = None
+    # bytes the map renderer may use before it falls back / aborts
+    memory_budget: int | None = None
+    # "telepads": one connection per island of teleport tiles, "tiles": one per tile
+    teleport_mode: str = "telepads"
+    # render Map.lights into a separate overlay per map
+    lights: bool = False
+    # encode threads of the map pipeline, 0 encodes in order,
+    # None is up to 4 unless memory_budget or memory_report is set
+    workers: int | None = None
+    # output class -> encoding profiles, the first one is the primary format
+    encoding: dict[str, list[EncodingProfile]] = field(
+        default_factory=default_profiles
+    )
@@ -1,6 +1,7 @@
-from typing import TYPE_CHECKING, Callable, Iterable, Collection
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Collection
 from pathlib import Path
 import hashlib
+import json
 import math
 import re
 
@@ -28,6 +29,21 @@ def checksum_file(path: Path | str) -> str:
     return digest.hexdigest().lower()
 
 
+# hex digits of the content hash put into asset URLs
+STAMP_LENGTH = 10
+
+
+def content_stamp(path: Path | str) -> str:
+    """Short content hash of a file, for cache busting asset URLs"""
+    return checksum_file(path)[:STAMP_LENGTH]
+
+
+def stamp_name(path: str, stamp: str) -> str:
+    """``maps/a.webp`` -> ``maps/a.<stamp>.webp``, undone by .htaccess and run.py"""
+    stem, _, ext = path.rpartition(".")
+    return f"{stem}.{stamp}.{ext}"
+
+
 def pretty_size(size: int, *, space: bool = True) -> str:
     if size < 0:
         raise ValueError(f"Invalid size. Must not be negative: {size}")
@@ -62,27 +78,92 @@ def normalize_name(name: str) -> str:
     return re.sub(r'[/\\ <>":|?*]', "_", name)
 
 
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_json_array(path: Path | str, chunk_size: int = 1 << 16) -> Iterator:
+    """Items of a file holding one JSON array, parsed one at a time.
+
+    Only the item being parsed is kept in memory, not the whole file.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buffer = f.read(chunk_size)
+        pos = _JSON_WHITESPACE.match(buffer).end()
+        if buffer[pos : pos + 1] != "[":
+            raise ValueError(f"{path}: not a JSON array")
+        pos += 1
+        eof = False
+        expect_item = True
+        while True:
+            pos = _JSON_WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) and buffer[pos] == "]":
+                return
+            if pos < len(buffer) and buffer[pos] == "," and not expect_item:
+                expect_item = True
+                pos += 1
+                continue
+
+            if pos < len(buffer):
+                try:
+                    item, end = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    end = None
+                # a number may go on in the next chunk ("-1.5" of "-1.5e10"),
+                # so an item only counts once the "," or "]" after it is read
+                if end is not None:
+                    after = _JSON_WHITESPACE.match(buffer, end).end()
+                    if buffer[after : after + 1] in (",", "]"):
+                        yield item
+                        pos = after
+                        expect_item = False
+                        continue
+                if eof:
+                    raise ValueError(f"{path}: expected ',' or ']' after an item")
+            elif eof:
+                raise ValueError(f"{path}: unexpected end of file")
+
+            # read at least as much again as is buffered, so a large item
+            # is not parsed over and over
+            more = f.read(max(chunk_size, len(buffer) - pos))
+            eof = not more
+            buffer = buffer[pos:] + more
+            pos = 0
+
+
 def progress[T](
     iterable: Iterable[T] | Collection[T],
     *,
     max: int | None = None,
     incfunc: Callable[[T], int] | None = None,
+    status: Callable[[], str] | None = None,
 ):
+    """Yield from ``iterable`` while drawing a progress bar.
+
+    ``status`` is called for extra text after the bar on every step.
+    """
     if max is None and hasattr(iterable, "__len__"):
         max = len(iterable)
     bar_width = 40
 
+    def suffix() -> str:
+        return f"  {status()}" if status is not None else ""
+
     current = 0
     for item in iterable:
         if max is not None:
             ratio = current / max
             filled = round(ratio * bar_width)
             empty = bar_width - filled
-            print(f"\r[{'#' * filled}{' ' * empty}] {ratio * 100:.1f}%", end="")
+            print(
+                f"\r[{'#' * filled}{' ' * empty}] {ratio * 100:.1f}%{suffix()}", end=""
+            )
             current += 1 if incfunc is None else incfunc(item)
         else:
             char = "-\\|/"[current % 4]
-            print(f"\r[{char}] ---%", end="")
+            print(f"\r[{char}] ---%{suffix()}", end="")
             current += 1
         yield item
 
@@ -90,9 +171,9 @@ def progress[T](
         ratio = current / max
         filled = round(ratio * bar_width)
         empty = bar_width - filled
-        print(f"\r[{'#' * filled}{' ' * empty}] {ratio * 100:.1f}%")
+        print(f"\r[{'#' * filled}{' ' * empty}] {ratio * 100:.1f}%{suffix()}")
     else:
-        print(f"\r[{'#' * bar_width}] {100:.1f}%")
+        print(f"\r[{'#' * bar_width}] {100:.1f}%{suffix()}")
 
 
 def compare_depth_sort(A: SortParam, B: SortParam):
@@ -0,0 +1,299 @@
+"""Precomputed data for the Leaflet viewer (``html/js/metadata.json``).
+
+Everything ``script.js`` needs at startup is projected here once, so the
+browser neither parses ``world.tmx``/``maps.tsx`` nor does isometric math.
+Coordinates are Leaflet ``[lat, lng]`` pairs for ``L.CRS.Simple``, i.e.
+``[-screen_y, screen_x]``.
+"""
+
+from pathlib import Path
+import math
+import json
+import re
+
+from .tiled import TiledWorld, ImageObject, PointObject, Tile, parse_world
+from .types import Paddings
+
+# resolution folder -> minimum zoom level it is used at
+VIEWER_VARIANTS: list[tuple[str, int]] = [
+    ("default", 0),
+    ("low", -2),
+    ("small", -4),
+    ("tiny", -6),
+    ("micro", -9999),
+]
+
+# (suffix, mime type) of the map images, smallest first, see viewer_formats()
+DEFAULT_FORMATS: list[tuple[str, str]] = [(".webp", "image/webp")]
+
+# marker culling, see build_marker_index(): from DETAIL_ZOOM up every marker
+# is drawn, below it markers closer than CLUSTER_RADIUS screen pixels merge
+MARKER_CELL = 1024
+DETAIL_ZOOM = -2
+CLUSTER_ZOOMS = range(-10, DETAIL_ZOOM)
+CLUSTER_RADIUS = 64
+# index key -> metadata list; map markers are the "poi" of named maps
+MARKER_KINDS = {"m": "maps", "c": "connections", "p": "pois"}
+
+_TUPLE_RE = re.compile(r"\(\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)\s*\)")
+
+
+def _round(value: float) -> float | int:
+    value = round(value, 1)
+    return int(value) if value.is_integer() else value
+
+
+def latlng(sx: float, sy: float) -> list[float | int]:
+    return [_round(-sy), _round(sx)]
+
+
+def parse_tuple(value: str | None) -> tuple[float, float] | None:
+    """Parse a ``"(x, y)"`` property value"""
+    if not value:
+        return None
+    match = _TUPLE_RE.search(value)
+    if match is None:
+        return None
+    return float(match[1]), float(match[2])
+
+
+class Projection:
+    """Tiled's isometric ``pixelToScreenCoords`` for a given world"""
+
+    def __init__(self, world: TiledWorld):
+        self.tile_width = world.tilewidth
+        self.tile_height = world.tileheight
+        self.origin_x = world.height * world.tilewidth / 2
+
+    def iso_to_screen(self, x: float, y: float) -> tuple[float, float]:
+        sx = (x - y) * self.tile_width / (2 * self.tile_height) + self.origin_x
+        sy = (x + y) / 2
+        return sx, sy
+
+    def image_screen_bounds(self, obj: ImageObject) -> tuple[float, float, float, float]:
+        """(left, top, right, bottom) in screen pixels; objects anchor at bottom-center"""
+        sx, sy = self.iso_to_screen(obj.x, obj.y)
+        width = obj.width or 0
+        height = obj.height or 0
+        return sx - width / 2, sy - height, sx + width / 2, sy
+
+    def base_screen_bounds(
+        self, obj: ImageObject, tile: Tile
+    ) -> tuple[float, float, float, float]:
+        """(left, top, right, bottom) of the ground tiles, without paddings"""
+        paddings = Paddings.parse(tile.properties["paddings"].value)
+        columns = int(tile.properties["mapWidth"].value)
+        rows = int(tile.properties["mapHeight"].value)
+        left, top, _, _ = self.image_screen_bounds(obj)
+        left += paddings.left
+        top += paddings.top
+        return left, top, left + (columns + rows) * 32, top + (columns + rows) * 16
+
+    def tile_screen_position(
+        self, tx: float, ty: float, obj: ImageObject, tile: Tile
+    ) -> tuple[float, float]:
+        """Screen position of a map tile center, see ``MapGenerator.get_tile_center``"""
+        paddings = Paddings.parse(tile.properties["paddings"].value)
+        rows = int(tile.properties["mapHeight"].value)
+        local_x = paddings.left + (tx - ty) * 32 + rows * 32
+        local_y = paddings.top + (tx + ty) * 16 + 16
+        sx, sy = self.iso_to_screen(obj.x, obj.y)
+        return sx + local_x - tile.width / 2, sy + local_y - tile.height
+
+
+def build_viewer_metadata(
+    world: TiledWorld,
+    formats: list[tuple[str, str]] | None = None,
+    lights: dict[str, str] | None = None,
+    placeholders: dict[str, str] | None = None,
+) -> dict:
+    """``formats`` are the (suffix, mime type) every map variant exists in,
+    ``lights`` maps map ids to their light overlay in ``maps/lights/``,
+    ``placeholders`` to a data URL shown while the map image loads.
+    """
+    lights = lights or {}
+    placeholders = placeholders or {}
+    proj = Projection(world)
+
+    maps = []
+    maps_by_id: dict[str, tuple[ImageObject, Tile]] = {}
+    for obj in world.get_layer_by_name("Maps").objects:
+        if not isinstance(obj, ImageObject) or obj.gid is None:
+            continue
+        tile = world.get_tile_by_gid(obj.gid)
+        if tile is None:
+            print(f"No tile found for gid {obj.gid} ({obj.name})")
+            continue
+        tile_map_id = obj.properties["tileMapId"].value
+        maps_by_id[tile_map_id] = obj, tile
+
+        left, top, right, bottom = proj.image_screen_bounds(obj)
+        columns = int(tile.properties["mapWidth"].value)
+        rows = int(tile.properties["mapHeight"].value)
+        entry = {
+            "id": tile_map_id,
+            "name": obj.name or obj.properties["tileMapName"].value,
+            "file": tile.source.name,
+            "bounds": [latlng(left, bottom), latlng(right, top)],
+            "poi": latlng(
+                *proj.tile_screen_position(
+                    math.ceil(columns / 2), math.ceil(rows / 2), obj, tile
+                )
+            ),
+        }
+        if tile_map_id in lights:
+            entry["lights"] = lights[tile_map_id]
+        if tile_map_id in placeholders:
+            entry["placeholder"] = placeholders[tile_map_id]
+        maps.append(entry)
+
+    connections = []
+    pois = []
+    for layer in world.layers:
+        for pt in layer.objects:
+            if not isinstance(pt, PointObject):
+                continue
+            props = {name: prop.value for name, prop in pt.properties.items()}
+            entry = {"pos": latlng(*proj.iso_to_screen(pt.x, pt.y))}
+            if pt.name:
+                entry["label"] = pt.name
+            if "color" in props:
+                entry["color"] = props["color"]
+
+            if layer.name != "Connections":
+                entry["group"] = layer.name
+                pois.append(entry)
+                continue
+
+            if "itemName" in props:
+                entry["itemName"] = props["itemName"]
+            # the tooltip falls back to the destination, then the source map
+            for key in ("destMapName", "srcMapName"):
+                if key in props and "label" not in entry:
+                    entry["label"] = props[key]
+            dest = maps_by_id.get(props.get("destMapId", ""))
+            if dest is not None:
+                dest_obj, dest_tile = dest
+                dest_pos = parse_tuple(props.get("destPos"))
+                if dest_pos is not None:
+                    entry["dest"] = latlng(
+                        *proj.tile_screen_position(*dest_pos, dest_obj, dest_tile)
+                    )
+                else:
+                    left, top, right, bottom = proj.image_screen_bounds(dest_obj)
+                    entry["dest"] = latlng((left + right) / 2, (top + bottom) / 2)
+            connections.append(entry)
+
+    metadata = {
+        "variants": VIEWER_VARIANTS,
+        "formats": formats or DEFAULT_FORMATS,
+        "maps": maps,
+        "connections": connections,
+        "pois": pois,
+    }
+    metadata["index"] = build_marker_index(metadata)
+    return metadata
+
+
+def build_marker_index(metadata: dict) -> dict:
+    """Grid index over all markers, with one clustered grid per low zoom level.
+
+    ``levels`` is sorted by descending zoom and a level is used from its zoom
+    down to the next level's. ``cells`` maps ``"x,y"`` (``cell`` sized, in
+    lat/lng units) to the marker indices inside per ``MARKER_KINDS`` key.
+    Cells of clustered levels also have the centroid ``pos`` of their markers.
+    """
+    points: list[tuple[str, int, list[float | int]]] = []
+    for key, kind in MARKER_KINDS.items():
+        for i, entry in enumerate(metadata[kind]):
+            if kind == "maps":
+                if entry["name"]:
+                    points.append((key, i, entry["poi"]))
+            else:
+                points.append((key, i, entry["pos"]))
+
+    levels = [_grid_level(points, DETAIL_ZOOM, MARKER_CELL, cluster=False)]
+    for zoom in reversed(CLUSTER_ZOOMS):
+        cell = CLUSTER_RADIUS * 2**-zoom
+        levels.append(_grid_level(points, zoom, cell, cluster=True))
+    return {"levels": levels}
+
+
+def _grid_level(
+    points: list[tuple[str, int, list[float | int]]],
+    zoom: int,
+    cell: int,
+    cluster: bool,
+) -> dict:
+    cells: dict[str, dict] = {}
+    sums: dict[str, list[float]] = {}
+    for key, i, (lat, lng) in points:
+        cell_key = f"{math.floor(lng / cell)},{math.floor(lat / cell)}"
+        cells.setdefault(cell_key, {}).setdefault(key, []).append(i)
+        acc = sums.setdefault(cell_key, [0.0, 0.0, 0])
+        acc[0] += lat
+        acc[1] += lng
+        acc[2] += 1
+
+    if cluster:
+        for cell_key, (lat, lng, count) in sums.items():
+            cells[cell_key]["pos"] = [_round(lat / count), _round(lng / count)]
+    return {"zoom": zoom, "cell": cell, "cluster": cluster, "cells": cells}
+
+
+# added to metadata.json by the overview and heatmap steps after the maps
+GENERATED_KEYS = ("overview", "heat")
+GENERATED_MAP_KEYS = ("heat",)
+
+
+def write_viewer_metadata(
+    world_file: Path,
+    out_file: Path,
+    formats: list[tuple[str, str]] | None = None,
+    lights: dict[str, str] | None = None,
+    placeholders: dict[str, str] | None = None,
+) -> dict:
+    """Read the Tiled files and write the compact viewer JSON.
+
+    The keys of later steps (``GENERATED_KEYS``) are kept from the old file,
+    so rebuilding only the maps does not drop the overview or heatmaps.
+    """
+    metadata = build_viewer_metadata(
+        parse_world(world_file), formats, lights, placeholders
+    )
+    if out_file.exists():
+        old = json.loads(out_file.read_text(encoding="utf-8"))
+        old_maps = {entry["id"]: entry for entry in old.get("maps", [])}
+        for entry in metadata["maps"]:
+            old_entry = old_maps.get(entry["id"], {})
+            for key in GENERATED_MAP_KEYS:
+                if key in old_entry:
+                    entry[key] = old_entry[key]
+        for key in GENERATED_KEYS:
+            if key in old:
+                metadata[key] = old[key]
+    with out_file.open("w", encoding="utf-8", newline="\n") as f:
+        json.dump(metadata, f, separators=(",", ":"), ensure_ascii=False)
+    return metadata
+
+
+def refresh_viewer_metadata(world_file: Path, out_file: Path) -> dict:
+    """Rewrite the viewer JSON after ``world_file`` was edited in Tiled.
+
+    What other generators added to the old file (light overlays, heatmaps,
+    the world overview) is kept as it is, so no map has to be rendered.
+    """
+    old = {}
+    if out_file.exists():
+        old = json.loads(out_file.read_text(encoding="utf-8"))
+    old_maps = {entry["id"]: entry for entry in old.get("maps", [])}
+
+    metadata = build_viewer_metadata(parse_world(world_file), old.get("formats"))
+    for entry in metadata["maps"]:
+        for key, value in old_maps.get(entry["id"], {}).items():
+            entry.setdefault(key, value)
+    for key, value in old.items():
+        metadata.setdefault(key, value)
+    with out_file.open("w", encoding="utf-8", newline="\n") as f:
+        json.dump(metadata, f, separators=(",", ":"), ensure_ascii=False)
+    return metadata
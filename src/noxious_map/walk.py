@@ -0,0 +1,210 @@
+"""Walkability bitsets and walking distance fields of a map.
+
+A tile is walkable if it has a ground tile and no blocking tile. The grid is
+kept as a bitset of ``width * height / 8`` bytes, bit ``y * width + x``
+(least significant bit first) is set for walkable tiles.
+
+Distance fields count the steps (up, down, left, right) from a set of
+source tiles to every tile. Sources are the teleport islands of the map and
+its monster spawns, so the files answer "how far is the next exit" and
+"which spawns are reachable" without parsing ``maps.json``.
+
+File layout, all little endian::
+
+    header  "NXWK", u8 version, u16 width, u16 height,
+            u8 distance width (1 or 2 bytes), u16 source count
+    bitset  (width * height + 7) // 8 bytes
+    sources per source: u8 kind, u16 x, u16 y (center tile)
+    fields  per source: width * height distances, row-major,
+            0xFF / 0xFFFF for unreachable
+"""
+
+from array import array
+from collections import deque
+from dataclasses import dataclass
+from pathlib import Path
+import struct
+import sys
+
+from noxious_map.models import Map
+
+MAGIC = b"NXWK"
+VERSION = 1
+HEADER = struct.Struct("<4sBHHBH")
+SOURCE = struct.Struct("<BHH")
+
+SOURCE_TELEPORT = 0
+SOURCE_SPAWN = 1
+
+UNREACHABLE = -1
+UNREACHABLE_8 = 0xFF
+UNREACHABLE_16 = 0xFFFF
+
+
+class WalkGrid:
+    """Walkable tiles of a map as a bitset"""
+
+    def __init__(self, width: int, height: int, bits: bytes | None = None):
+        self.width = width
+        self.height = height
+        size = (width * height + 7) // 8
+        self.bits = bytearray(bits) if bits is not None else bytearray(size)
+        if len(self.bits) != size:
+            raise ValueError(f"expected {size} bytes for {width}x{height} tiles")
+
+    @classmethod
+    def from_map(cls, tile_map: Map) -> "WalkGrid":
+        grid = cls(tile_map.width, tile_map.height)
+        for tile in tile_map.mapTiles:
+            grid.set(tile.x, tile.y, True)
+        for tile in tile_map.blockingTiles:
+            grid.set(tile.x, tile.y, False)
+        return grid
+
+    def inside(self, x: int, y: int) -> bool:
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def set(self, x: int, y: int, walkable: bool):
+        if not self.inside(x, y):
+            return
+        i = y * self.width + x
+        if walkable:
+            self.bits[i >> 3] |= 1 << (i & 7)
+        else:
+            self.bits[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def walkable(self, x: int, y: int) -> bool:
+        if not self.inside(x, y):
+            return False
+        i = y * self.width + x
+        return bool(self.bits[i >> 3] >> (i & 7) & 1)
+
+    def count(self) -> int:
+        return sum(byte.bit_count() for byte in self.bits)
+
+    def distances(self, sources: list[tuple[int, int]]) -> list[int]:
+        """Steps from the nearest source to every tile, row-major.
+
+        Sources count as distance 0 even if they are blocked themselves, a
+        teleport tile may well be. Unreachable tiles are ``UNREACHABLE``.
+        """
+        width, height = self.width, self.height
+        # one blocked border tile around the grid, so neighbours need no
+        # bounds checks
+        stride = width + 2
+        padded = bytearray(stride * (height + 2))
+        for y in range(height):
+            row = (y + 1) * stride + 1
+            for x in range(width):
+                i = y * width + x
+                padded[row + x] = self.bits[i >> 3] >> (i & 7) & 1
+
+        dist = [UNREACHABLE] * len(padded)
+        queue = deque()
+        for x, y in sources:
+            if self.inside(x, y):
+                i = (y + 1) * stride + x + 1
+                if dist[i] == UNREACHABLE:
+                    dist[i] = 0
+                    queue.append(i)
+
+        steps = (1, -1, stride, -stride)
+        while queue:
+            i = queue.popleft()
+            d = dist[i] + 1
+            for step in steps:
+                n = i + step
+                if padded[n] and dist[n] == UNREACHABLE:
+                    dist[n] = d
+                    queue.append(n)
+
+        result = []
+        for y in range(height):
+            row = (y + 1) * stride + 1
+            result.extend(dist[row : row + width])
+        return result
+
+
+@dataclass
+class WalkSource:
+    kind: int
+    # center tile
+    x: int
+    y: int
+    tiles: list[tuple[int, int]]
+
+
+@dataclass
+class WalkFile:
+    grid: WalkGrid
+    sources: list[WalkSource]
+    # one distance field per source, row-major
+    fields: list[list[int]]
+
+    def distance(self, source: int, x: int, y: int) -> int:
+        if not self.grid.inside(x, y):
+            return UNREACHABLE
+        return self.fields[source][y * self.grid.width + x]
+
+    def write(self, path: Path):
+        largest = max((d for field in self.fields for d in field), default=0)
+        if largest < UNREACHABLE_8:
+            typecode, width, unreachable = "B", 1, UNREACHABLE_8
+        else:
+            typecode, width, unreachable = "H", 2, UNREACHABLE_16
+
+        with path.open("wb") as f:
+            f.write(
+                HEADER.pack(
+                    MAGIC,
+                    VERSION,
+                    self.grid.width,
+                    self.grid.height,
+                    width,
+                    len(self.sources),
+                )
+            )
+            f.write(self.grid.bits)
+            for source in self.sources:
+                f.write(SOURCE.pack(source.kind, source.x, source.y))
+            for field in self.fields:
+                values = array(
+                    typecode,
+                    (
+                        unreachable if d == UNREACHABLE else min(d, unreachable - 1)
+                        for d in field
+                    ),
+                )
+                if sys.byteorder == "big":
+                    values.byteswap()
+                f.write(values.tobytes())
+
+    @classmethod
+    def read(cls, path: Path) -> "WalkFile":
+        data = path.read_bytes()
+        magic, version, width, height, dist_width, count = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path}: not a version {VERSION} walk file")
+
+        offset = HEADER.size
+        size = (width * height + 7) // 8
+        grid = WalkGrid(width, height, data[offset : offset + size])
+        offset += size
+
+        sources = []
+        for _ in range(count):
+            kind, x, y = SOURCE.unpack_from(data, offset)
+            sources.append(WalkSource(kind, x, y, [(x, y)]))
+            offset += SOURCE.size
+
+        typecode = "B" if dist_width == 1 else "H"
+        unreachable = UNREACHABLE_8 if dist_width == 1 else UNREACHABLE_16
+        fields = []
+        for _ in range(count):
+            values = array(typecode)
+            values.frombytes(data[offset : offset + width * height * dist_width])
+            if sys.byteorder == "big":
+                values.byteswap()
+            fields.append([UNREACHABLE if d == unreachable else d for d in values])
+            offset += width * height * dist_width
+        return cls(grid, sources, fields)
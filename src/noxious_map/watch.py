@@ -0,0 +1,235 @@
+"""``noxious-map watch``: rebuild what changed, then reload open pages.
+
+Polls ``bundle.zip``, the bundle, the page templates and the Tiled world
+for changed files (size and mtime first, then content, so an unzip that
+rewrites identical files does nothing). Every source lists the steps that
+read it, see ``watched_sources``. Only those steps run, in build order,
+followed by the manifests and precompression. A changed ``maps.json`` only
+re-renders the maps whose map store shard changed.
+
+After each rebuild ``.cache/livereload.json`` is rewritten. Pages served
+by ``python html/run.py --live-reload`` reload when it changes.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Collection
+import json
+import os
+import time
+import traceback
+
+from .generator import TARGETS, load_target
+from .types import BuildOptions
+from .utils import checksum_file
+
+POLL_INTERVAL = 0.5
+LIVE_RELOAD_FILE = Path(".cache") / "livereload.json"
+
+# run after every rebuild, they cover whatever the other steps wrote
+FINAL_TARGETS = ("manifest", "compress", "outputs")
+
+
+@dataclass
+class Source:
+    root: Path
+    pattern: str
+    steps: tuple[str, ...]
+
+    def files(self) -> list[Path]:
+        return [path for path in self.root.glob(self.pattern) if path.is_file()]
+
+
+def watched_sources(here: Path, templates_root: Path) -> list[Source]:
+    bundle_dir = here / "bundle"
+    data = bundle_dir / "data"
+    textures = bundle_dir / "textures"
+    # mobs.html links the map images by content hash, so "mobs" follows
+    # every "maps"
+    return [
+        Source(here, "bundle.zip", ("unpack",)),
+        Source(
+            data, "maps.json", ("maps", "overview", "heatmap", "mobs", "routes", "walk")
+        ),
+        Source(data, "mapObjects.json", ("maps", "overview", "mobs")),
+        Source(data, "items.json", ("maps", "mobs")),
+        Source(data, "monsters.json", ("heatmap", "mobs")),
+        Source(data, "textures.json", ("mobs",)),
+        Source(textures / "mapTiles", "**/*", ("maps", "overview", "mobs")),
+        Source(textures / "mapObjects", "**/*", ("maps", "overview", "mobs")),
+        Source(textures / "sprites", "**/*", ("mobs",)),
+        Source(templates_root, "**/*.html", ("mobs",)),
+        # edited in Tiled, written by the maps step too
+        Source(
+            here / "html" / "js" / "tiled",
+            "world.tmx",
+            ("metadata", "overview", "heatmap"),
+        ),
+    ]
+
+
+class Watcher:
+    def __init__(self, here: Path, options: BuildOptions):
+        self.here = here
+        self.options = options
+        self.sources = watched_sources(
+            here, Path(__file__).absolute().parent / "generator" / "templates"
+        )
+        # path -> (size, mtime_ns, md5)
+        self.state: dict[Path, tuple[int, int, str]] = {}
+        # map id -> store hash, as of the last build
+        self.maps: dict[str, str] = {}
+        self.builds = 0
+
+    def scan(self) -> dict[Path, tuple[int, int, str]]:
+        state = {}
+        for source in self.sources:
+            if not source.root.exists():
+                continue
+            for path in source.files():
+                stat = path.stat()
+                old = self.state.get(path)
+                if old is not None and old[:2] == (stat.st_size, stat.st_mtime_ns):
+                    state[path] = old
+                else:
+                    digest = checksum_file(path)
+                    state[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        return state
+
+    def changed_files(self, state: dict[Path, tuple[int, int, str]]) -> set[Path]:
+        """Files added, removed or with other content than in ``self.state``"""
+        changed = set()
+        for path in state.keys() | self.state.keys():
+            old, new = self.state.get(path), state.get(path)
+            if old is None or new is None or old[2] != new[2]:
+                changed.add(path)
+        return changed
+
+    def steps_for(self, changed: set[Path]) -> dict[str, list[Path]]:
+        """step -> the changed files that need it"""
+        steps: dict[str, list[Path]] = {}
+        for source in self.sources:
+            for path in changed:
+                if not path.is_relative_to(source.root):
+                    continue
+                if path.relative_to(source.root).full_match(source.pattern):
+                    for step in source.steps:
+                        steps.setdefault(step, []).append(path)
+        return steps
+
+    def map_hashes(self) -> dict[str, str]:
+        from .store import MapStore
+
+        return {entry.id: entry.hash for entry in MapStore.open(self.here / "bundle")}
+
+    def changed_maps(self) -> set[str] | None:
+        """Maps added or changed since the last build, None if some were removed"""
+        maps = self.map_hashes()
+        if not self.maps.keys() <= maps.keys():
+            return None
+        return {
+            map_id for map_id, digest in maps.items() if self.maps.get(map_id) != digest
+        }
+
+    def rebuild(self, changed: set[Path]):
+        steps = self.steps_for(changed)
+        if steps.pop("unpack", None) is not None:
+            from .downloader import unpack_bundle
+
+            unpack_bundle(self.here)
+            # only the bundle files that really changed decide the rest
+            state = self.scan()
+            for step, paths in self.steps_for(self.changed_files(state)).items():
+                steps.setdefault(step, []).extend(paths)
+            self.state = state
+
+        only = None
+        maps_json = self.here / "bundle" / "data" / "maps.json"
+        if steps.get("maps") == [maps_json]:
+            only = self.changed_maps()
+            if only is not None:
+                print(f"Maps to render: {', '.join(sorted(only)) or 'none'}")
+
+        # the maps step writes the metadata itself
+        if "metadata" in steps and "maps" not in steps:
+            from .viewer import refresh_viewer_metadata
+
+            print("Refreshing viewer metadata")
+            js_dir = self.here / "html" / "js"
+            refresh_viewer_metadata(
+                js_dir / "tiled" / "world.tmx", js_dir / "metadata.json"
+            )
+
+        self.build([*steps, *FINAL_TARGETS], only)
+
+    def build(self, targets: Collection[str], only: set[str] | None = None):
+        """Run these generators in build order, maps only re-renders ``only``"""
+        for target in TARGETS:
+            if target not in targets:
+                continue
+            gen_cls = load_target(target)
+            print(f"Invoking generator: {gen_cls.__name__}")
+            gen = gen_cls(self.here, self.options)
+            if target == "maps":
+                gen.only = only
+            gen.generate()
+
+    def notify(self, changed: set[Path]):
+        """Tell ``html/run.py --live-reload`` to reload the open pages"""
+        self.builds += 1
+        path = self.here / LIVE_RELOAD_FILE
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("w", encoding="utf-8", newline="\n") as f:
+            json.dump(
+                {
+                    "build": self.builds,
+                    "time": time.time(),
+                    "changed": sorted(self.display(path) for path in changed),
+                },
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(tmp, path)
+
+    def display(self, path: Path) -> str:
+        if path.is_relative_to(self.here):
+            return path.relative_to(self.here).as_posix()
+        return str(path)
+
+    def run(self, interval: float = POLL_INTERVAL):
+        if not (self.here / "html" / "maps").exists():
+            print("No build yet, building everything first")
+            self.build(TARGETS)
+        self.state = self.scan()
+        self.maps = self.map_hashes()
+        print(f"Watching {len(self.state)} files, Ctrl+C to stop")
+        while True:
+            time.sleep(interval)
+            state = self.scan()
+            if not self.changed_files(state):
+                continue
+            # wait until the files stop changing (Tiled saving, an unzip)
+            while True:
+                time.sleep(interval)
+                settled = self.scan()
+                if settled == state:
+                    break
+                state = settled
+            changed = self.changed_files(state)
+            self.state = state
+
+            for path in sorted(changed):
+                print(f"Changed: {self.display(path)}")
+            start = time.perf_counter()
+            try:
+                self.rebuild(changed)
+            except Exception:
+                traceback.print_exc()
+                print("Rebuild failed, waiting for the next change")
+            else:
+                self.notify(changed)
+                print(f"Rebuilt in {time.perf_counter() - start:.2f}s")
+            # what the build wrote itself (world.tmx) is not a change
+            self.state = self.scan()
+            self.maps = self.map_hashes()